@@ -14,4 +14,6 @@ export interface Log {
   export interface LogSearchResult {
     total: number;
     logs: Log[];
+    partial?: boolean;
+    skipped_sources?: string[];
   }
\ No newline at end of file
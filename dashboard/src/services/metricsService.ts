@@ -0,0 +1,14 @@
+// src/services/metricsService.ts
+import axios from 'axios';
+import { MetricResult } from '../models/Metric';
+
+// Range queries go through the log-api proxy, which caches them for every tab
+const API_URL = import.meta.env.VITE_LOG_API_URL || 'http://log-api.local';
+
+export default {
+  queryRange(query: string, start: number, end: number, step: number, points: number) {
+    return axios.get<MetricResult>(`${API_URL}/prometheus/query_range`, {
+      params: { query, start, end, step, points }
+    });
+  }
+};
@@ -1,7 +1,7 @@
 import { defineStore } from 'pinia';
 import { Robot, RobotUpdate } from '../models/Robot';
 import robotService from '../services/robotService';
-import axios from 'axios';
+import metricsService from '../services/metricsService';
 
 interface MetricPoint {
   time: string;
@@ -62,18 +62,11 @@ export const useRobotStore = defineStore('robot', {
     
     async fetchMetrics() {
       try {
-        const PROMETHEUS_URL = 'http://prometheus.default.svc.cluster.local:9090';
         const now = Math.floor(Date.now() / 1000);
         const timeAgo = now - 3600; // Get data for the last hour
-        
-        const response = await axios.get(`${PROMETHEUS_URL}/api/v1/query_range`, {
-          params: {
-            query: 'robots_added_total',
-            start: timeAgo,
-            end: now,
-            step: '60s' // 1-minute intervals
-          }
-        });
+
+        // 1-minute intervals
+        const response = await metricsService.queryRange('robots_added_total', timeAgo, now, 60, 60);
         
         if (response.data.status === 'success' && response.data.data?.result?.length > 0) {
           const result = response.data.data.result[0];
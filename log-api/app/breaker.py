@@ -0,0 +1,63 @@
+"""Per-source circuit breaker for container log fetches."""
+
+import threading
+import time
+from typing import Callable, Dict, Hashable, Tuple
+
+
+class SourceBreaker:
+    """Track fetch failures per source and back off exponentially.
+
+    After a failure a source is skipped for ``base_backoff`` seconds; every
+    further consecutive failure doubles the wait, up to ``max_backoff``. Once
+    the wait has elapsed a single trial fetch is allowed through, and a success
+    closes the breaker again.
+    """
+
+    def __init__(
+        self,
+        base_backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        # source -> (consecutive failures, skip until)
+        self._state: Dict[Hashable, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, source: Hashable) -> bool:
+        with self._lock:
+            state = self._state.get(source)
+            if state is None:
+                return True
+            failures, open_until = state
+            now = self.clock()
+            if now < open_until:
+                return False
+            # Half-open: let one trial through and hold others back until it
+            # reports, so a dead source is not hit by every concurrent request.
+            self._state[source] = (failures, now + self._backoff(failures))
+            return True
+
+    def record_success(self, source: Hashable) -> None:
+        with self._lock:
+            self._state.pop(source, None)
+
+    def record_failure(self, source: Hashable) -> None:
+        with self._lock:
+            failures = self._state.get(source, (0, 0.0))[0] + 1
+            self._state[source] = (failures, self.clock() + self._backoff(failures))
+
+    def is_open(self, source: Hashable) -> bool:
+        with self._lock:
+            state = self._state.get(source)
+            return state is not None and self.clock() < state[1]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state.clear()
+
+    def _backoff(self, failures: int) -> float:
+        return min(self.max_backoff, self.base_backoff * (2 ** (failures - 1)))
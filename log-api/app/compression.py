@@ -0,0 +1,161 @@
+"""Response compression negotiated from Accept-Encoding.
+
+gzip is always available; zstd and brotli are offered when the zstandard and
+brotli packages are installed. The client's preference (q-values) decides,
+with ties broken in the order of ``ENCODINGS``. Bodies are compressed as they
+are sent, one chunk at a time, so streamed responses are never buffered whole.
+
+Responses smaller than ``minimum_size`` (when sent in one piece), responses
+that already have a Content-Encoding (such as gzipped /metrics) and event
+streams are sent as they are.
+"""
+
+import zlib
+from typing import Dict, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional
+    brotli = None
+
+
+class GzipEncoder:
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = 3):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int = 4):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+# Preferred first; levels favour CPU per request over the last few percent
+ENCODINGS: Dict[str, type] = {}
+if zstandard is not None:
+    ENCODINGS["zstd"] = ZstdEncoder
+if brotli is not None:
+    ENCODINGS["br"] = BrotliEncoder
+ENCODINGS["gzip"] = GzipEncoder
+
+
+def negotiate(accept_encoding: str, available=ENCODINGS) -> Optional[str]:
+    """The available coding the client accepts with the highest q-value."""
+    weights: Dict[str, float] = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for name in available:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def passes_through(headers) -> bool:
+    """Whether a response must be sent unchanged whatever the client accepts."""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return True
+        # Compressor buffering would hold back events
+        if name == b"content-type" and value.startswith(b"text/event-stream"):
+            return True
+    return False
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, encodings=ENCODINGS):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = encodings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope.get("headers", ()):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        coding = negotiate(accept_encoding, self.encodings)
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None
+
+        async def send_wrapper(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            if encoder is None:
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                headers = start["headers"] = list(start.get("headers", ()))
+                if passes_through(headers) or (
+                    not more_body and len(body) < self.minimum_size
+                ):
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                headers[:] = [(k, v) for k, v in headers if k != b"content-length"]
+                headers.append((b"content-encoding", coding.encode()))
+                headers.append((b"vary", b"Accept-Encoding"))
+                encoder = self.encodings[coding]()
+                await send(start)
+            chunk = encoder.compress(message.get("body", b""))
+            if message.get("more_body", False):
+                if chunk:
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            else:
+                chunk += encoder.finish()
+                await send({"type": "http.response.body", "body": chunk})
+
+        await self.app(scope, receive, send_wrapper)
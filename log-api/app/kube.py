@@ -0,0 +1,94 @@
+"""Lazily created Kubernetes API client.
+
+Importing the kubernetes package and loading its configuration is the slowest
+part of starting log-api, so it happens on first use (or in the background at
+startup) instead of at import time. The client is then shared by every request
+and fetch thread. Its connection pool is sized for the fetch workers, since
+urllib3's default of 4 connections would make concurrent reads reconnect.
+
+A failed configuration load is retried on the next use after
+``retry_seconds``; until then the client reports itself unavailable.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+READY = "ready"
+UNAVAILABLE = "unavailable"
+
+
+def create_core_v1_api(pool_maxsize: int = 16, host: Optional[str] = None):
+    """Build a CoreV1Api from the in-cluster or local configuration, or talk
+    to ``host`` without credentials (for a fake API server in load tests).
+    """
+    from kubernetes import client, config
+
+    if host:
+        configuration = client.Configuration(host=host)
+        logger.info(f"Using Kubernetes API at {host}")
+    else:
+        try:
+            config.load_incluster_config()
+            logger.info("Loaded in-cluster Kubernetes configuration")
+        except Exception as e:
+            logger.warning(
+                f"Failed to load in-cluster config, will try local config: {e}"
+            )
+            config.load_kube_config()
+            logger.info("Loaded local Kubernetes configuration")
+        configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = pool_maxsize
+    return client.CoreV1Api(client.ApiClient(configuration))
+
+
+class KubeClient:
+    def __init__(
+        self,
+        pool_maxsize: int = 16,
+        retry_seconds: float = 30.0,
+        host: Optional[str] = None,
+        factory: Optional[Callable] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.pool_maxsize = pool_maxsize
+        self.retry_seconds = retry_seconds
+        self.factory = factory or (lambda: create_core_v1_api(self.pool_maxsize, host))
+        self.clock = clock
+        self.state = PENDING
+        self._api = None
+        self._failed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the CoreV1Api, creating it if needed, or None if unavailable."""
+        if self._api is not None:
+            return self._api
+        with self._lock:
+            if self._api is not None:
+                return self._api
+            if (
+                self._failed_at is not None
+                and self.clock() - self._failed_at < self.retry_seconds
+            ):
+                return None
+            try:
+                self._api = self.factory()
+            except Exception as e:
+                logger.error(f"Failed to load Kubernetes configuration: {e}")
+                self._failed_at = self.clock()
+                self.state = UNAVAILABLE
+                return None
+            self.state = READY
+            return self._api
+
+    async def aget(self):
+        """Like get(), but loads the client off the event loop."""
+        if self._api is not None:
+            return self._api
+        return await asyncio.to_thread(self.get)
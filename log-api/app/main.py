@@ -1,25 +1,127 @@
+import asyncio
 import json
 import logging
 import os
 import re
-import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import List, Optional
 
 import pytz
 import uvicorn
-from fastapi import FastAPI, HTTPException, Query
+from app.admission import (EXEMPT_PATHS, AdmissionController,
+                           AdmissionMiddleware, CostClass)
+from app.breaker import SourceBreaker
+from app.compression import CompressionMiddleware
+from app.exposition import ExpositionCache
+from app.instrumentation import PrometheusMiddleware, RequestMetrics
+from app.kube import PENDING, KubeClient
+from app.models import (LogPatternResult, LogSearchResult, StandingQueryCreate,
+                        StandingQueryInfo)
+from app.patterns import PatternMiner
+from app.patterns import summarize as summarize_patterns
+from app.profiling import install_profiling
+from app.promproxy import (PrometheusError, RangeQueryCache, downsample,
+                           fetch_query_range, parse_step)
+from app.query import QuerySyntaxError, compile_query
+from app.sharding import Membership, fetch_peer_logs, merge_newest
+from app.spill import SpillTier
+from app.standing import StandingQueryIndex
+from app.standing import events as standing_events
+from app.standing import match_entry, post_webhook
+from app.store import (LogSegment, LogStore, SearchFilter, format_timestamp,
+                       level_table, now_us, parse_timestamp)
+from app.timing import StageTimer
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from kubernetes import client, config
-from prometheus_client import (CONTENT_TYPE_LATEST, Counter, Histogram,
-                               generate_latest)
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import Counter, Gauge
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the Kubernetes client in the background; /ready reports when done
+    warmup = asyncio.create_task(kube_client.aget())
+    collector = None
+    if COLLECT_INTERVAL_SECONDS > 0:
+        collector = asyncio.create_task(collect_periodically())
+    notifier = asyncio.create_task(notify_standing_queries())
+    watcher = None
+    if membership.service:
+        watcher = asyncio.create_task(watch_membership())
+    yield
+    warmup.cancel()
+    notifier.cancel()
+    if watcher is not None:
+        watcher.cancel()
+    if collector is not None:
+        collector.cancel()
+    log_store.flush()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def from_peer(scope) -> bool:
+    """Whether a request comes from another log-api replica."""
+    client = scope.get("client")
+    return client is not None and membership.is_member_host(client[0])
+
+
+# Admission control. Requests run within per-class concurrency limits and wait
+# in a bounded queue; past their class's wait budget they are shed with 503 and
+# Retry-After. Added before CORS so that shed responses carry CORS headers too.
+# Searches can fan out to every container, so only a few run at once.
+admission = AdmissionController(
+    [
+        CostClass(
+            "default",
+            limit=int(os.getenv("ADMISSION_CONCURRENCY", "64")),
+            queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "256")),
+            max_wait=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "1")),
+        ),
+        CostClass(
+            "heavy",
+            limit=int(os.getenv("ADMISSION_HEAVY_CONCURRENCY", "4")),
+            queue_size=int(os.getenv("ADMISSION_HEAVY_QUEUE_SIZE", "16")),
+            max_wait=float(os.getenv("ADMISSION_HEAVY_MAX_WAIT_SECONDS", "2")),
+        ),
+        # Exports hold their slot for the whole download, so they get their own
+        # limit rather than starving searches
+        CostClass(
+            "export",
+            limit=int(os.getenv("ADMISSION_EXPORT_CONCURRENCY", "2")),
+            queue_size=int(os.getenv("ADMISSION_EXPORT_QUEUE_SIZE", "4")),
+            max_wait=float(os.getenv("ADMISSION_EXPORT_MAX_WAIT_SECONDS", "2")),
+        ),
+        # Searches that replicas send each other for their own shard. A search
+        # holds its heavy slot while it waits for its peers, so if peers queued
+        # for heavy slots too, two replicas could end up waiting on each other.
+        # Only requests from a replica's address are admitted here
+        CostClass(
+            "peer",
+            limit=int(os.getenv("ADMISSION_PEER_CONCURRENCY", "4")),
+            queue_size=int(os.getenv("ADMISSION_PEER_QUEUE_SIZE", "16")),
+            max_wait=float(os.getenv("ADMISSION_PEER_MAX_WAIT_SECONDS", "2")),
+        ),
+    ],
+    routes={
+        "/logs": "heavy",
+        "/logs?scope=local": "peer",
+        "/logs/patterns": "heavy",
+        "/logs/export": "export",
+    },
+    # Event streams stay open but cost nothing while idle
+    exempt=(*EXEMPT_PATHS, "/logs/standing/events"),
+    prefix="log_api_",
+    guards={"peer": from_peer},
+)
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,26 +131,158 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-request_duration = Histogram(
-    "log_api_request_duration_seconds", "Request duration in seconds", ["endpoint"]
+# Opt-in request profiling, served from /admin/profiles. Nothing is installed
+# unless PROFILING_ENABLED is set. Reading profiles, and asking for one with
+# X-Profile, need an X-Profile-Token header equal to PROFILING_TOKEN.
+if os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true"):
+    install_profiling(
+        app,
+        sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+        interval=float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.005")),
+        capacity=int(os.getenv("PROFILING_MAX_PROFILES", "50")),
+        token=os.getenv("PROFILING_TOKEN") or None,
+    )
+
+# Compress responses of at least COMPRESSION_MIN_BYTES for clients that accept
+# gzip (or zstd/brotli when installed). Inside the metrics middleware, so that
+# response sizes are recorded as sent.
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")),
 )
+
+# Request duration, size and in-flight metrics per route template
+http_metrics = RequestMetrics("log_api_")
+request_duration = http_metrics.duration
+app.add_middleware(PrometheusMiddleware, metrics=http_metrics)
+
 search_count = Counter("log_api_search_total", "Total number of log searches")
 
-try:
-    config.load_incluster_config()
-    logger.info("Loaded in-cluster Kubernetes configuration")
-    k8s_available = True
-except Exception as e:
-    logger.warning(f"Failed to load in-cluster config, will try local config: {e}")
-    try:
-        config.load_kube_config()
-        logger.info("Loaded local Kubernetes configuration")
-        k8s_available = True
-    except Exception as e:
-        logger.error(f"Failed to load Kubernetes configuration: {e}")
-        k8s_available = False
+# Default collection scope. Request parameters override these; when neither is
+# set, pods are listed across all namespaces.
+DEFAULT_NAMESPACE = os.getenv("LOG_API_NAMESPACE") or None
+DEFAULT_LABEL_SELECTOR = os.getenv("LOG_API_LABEL_SELECTOR") or None
+
+# Overall budget for fetching container logs in one request, and the timeout of
+# a single container read. Sources that miss the budget are reported as skipped.
+FETCH_DEADLINE_SECONDS = float(os.getenv("LOG_API_FETCH_DEADLINE_SECONDS", "5"))
+FETCH_TIMEOUT_SECONDS = float(os.getenv("LOG_API_FETCH_TIMEOUT_SECONDS", "10"))
+
+# Container reads run on their own pool so a hung read never blocks the loop or
+# the default executor.
+FETCH_WORKERS = int(os.getenv("LOG_API_FETCH_WORKERS", "16"))
+fetch_executor = ThreadPoolExecutor(
+    max_workers=FETCH_WORKERS, thread_name_prefix="log-fetch"
+)
+fetch_breaker = SourceBreaker(
+    base_backoff=float(os.getenv("LOG_API_BREAKER_BASE_BACKOFF_SECONDS", "1")),
+    max_backoff=float(os.getenv("LOG_API_BREAKER_MAX_BACKOFF_SECONDS", "300")),
+)
+# Retained history. Full segments are sealed into memory and, when
+# LOG_API_SPILL_DIR is set, the oldest sealed segments spill to compressed
+# files there instead of being dropped.
+SPILL_DIR = os.getenv("LOG_API_SPILL_DIR") or None
+COLLECT_INTERVAL_SECONDS = float(os.getenv("LOG_API_COLLECT_INTERVAL_SECONDS", "0"))
+
+log_store = LogStore(
+    segment_entries=int(os.getenv("LOG_API_SEGMENT_ENTRIES", "8192")),
+    memory_segments=int(os.getenv("LOG_API_MEMORY_SEGMENTS", "16")),
+    spill=(
+        SpillTier(
+            SPILL_DIR,
+            block_entries=int(os.getenv("LOG_API_SPILL_BLOCK_ENTRIES", "1024")),
+            max_bytes=int(os.getenv("LOG_API_SPILL_MAX_BYTES", str(512 * 2**20))),
+        )
+        if SPILL_DIR
+        else None
+    ),
+)
+
+# Message templates learned from every ingested line, for /logs/patterns
+pattern_miner = PatternMiner(
+    max_clusters=int(os.getenv("LOG_API_PATTERN_MAX_CLUSTERS", "1000"))
+)
+
+
+def learn_pattern(timestamp_us, level_id, source_id, message):
+    pattern_miner.add(message)
+
+
+log_store.listeners.append(learn_pattern)
+
+# Lines between resume checkpoints in /logs/export
+EXPORT_CHECKPOINT_ROWS = int(os.getenv("LOG_API_EXPORT_CHECKPOINT_ROWS", "1000"))
 
-v1 = client.CoreV1Api() if k8s_available else None
+# Standing queries are matched against every ingested line, so they see new
+# lines as often as logs are collected (see LOG_API_COLLECT_INTERVAL_SECONDS).
+# Webhooks receive the matches of each interval in one POST.
+standing_queries = StandingQueryIndex(
+    max_queries=int(os.getenv("LOG_API_STANDING_MAX_QUERIES", "100")),
+    recent_size=int(os.getenv("LOG_API_STANDING_RECENT_MATCHES", "20")),
+)
+log_store.listeners.append(standing_queries)
+STANDING_WEBHOOK_INTERVAL_SECONDS = float(
+    os.getenv("LOG_API_STANDING_WEBHOOK_INTERVAL_SECONDS", "5")
+)
+STANDING_WEBHOOK_TIMEOUT_SECONDS = float(
+    os.getenv("LOG_API_STANDING_WEBHOOK_TIMEOUT_SECONDS", "5")
+)
+STANDING_KEEPALIVE_SECONDS = 15.0
+# Hosts that webhooks may be posted to (comma-separated); webhooks are refused
+# when none are listed, so clients cannot make the server call arbitrary URLs
+STANDING_WEBHOOK_HOSTS = {
+    host.strip().lower()
+    for host in os.getenv("LOG_API_STANDING_WEBHOOK_HOSTS", "").split(",")
+    if host.strip()
+}
+
+standing_notifications = Counter(
+    "log_api_standing_notifications_total",
+    "Standing query webhook deliveries",
+    ["outcome"],
+)
+
+# Sharded collection. Replicas split the pods between them by consistent
+# hashing and answer /logs for the whole cluster by asking each other. Members
+# are listed in LOG_API_PEERS (comma-separated base URLs, for local testing) or
+# resolved from the headless service LOG_API_PEER_SERVICE (host:port).
+# LOG_API_SELF_URL is this replica's base URL as its peers see it.
+membership = Membership(
+    self_url=os.getenv("LOG_API_SELF_URL")
+    or f"http://{os.getenv('POD_IP', '127.0.0.1')}:8080",
+    peers=[
+        peer.strip()
+        for peer in os.getenv("LOG_API_PEERS", "").split(",")
+        if peer.strip()
+    ],
+    service=os.getenv("LOG_API_PEER_SERVICE") or None,
+)
+PEER_REFRESH_SECONDS = float(os.getenv("LOG_API_PEER_REFRESH_SECONDS", "30"))
+PEER_TIMEOUT_SECONDS = float(os.getenv("LOG_API_PEER_TIMEOUT_SECONDS", "10"))
+# Deepest /logs offset; every replica reads offset + limit matches to serve it
+MAX_SEARCH_OFFSET = 10000
+
+shard_members = Gauge(
+    "log_api_shard_members", "log-api replicas sharing log collection"
+)
+shard_members.set(len(membership.members))
+peer_search_failures = Counter(
+    "log_api_peer_search_failures_total", "Searches of peer replicas that failed"
+)
+
+fetch_skipped = Counter(
+    "log_api_fetch_skipped_total",
+    "Container log fetches skipped or abandoned",
+    ["reason"],
+)
+
+# Created on first use. The pool allows one connection per fetch worker.
+kube_client = KubeClient(
+    pool_maxsize=int(os.getenv("LOG_API_KUBE_POOL_MAXSIZE", str(FETCH_WORKERS))),
+    retry_seconds=float(os.getenv("LOG_API_KUBE_RETRY_SECONDS", "30")),
+    # Overrides the cluster configuration, e.g. to use a fake API server
+    host=os.getenv("LOG_API_KUBE_HOST") or None,
+)
 
 # Fallback mock logs for when Kubernetes API is unavailable.
 mock_logs = [
@@ -56,43 +290,59 @@ mock_logs = [
         "timestamp": datetime.now().isoformat(),
         "level": "info",
         "message": "Robot service started",
-        "kubernetes": {"pod_name": "robot-service", "container_name": "robot-service"},
+        "kubernetes": {
+            "pod_name": "robot-service",
+            "container_name": "robot-service",
+            "namespace": "default",
+        },
     },
     {
         "timestamp": (datetime.now() - timedelta(minutes=5)).isoformat(),
         "level": "info",
         "message": "Robot added: test-robot-efk",
-        "kubernetes": {"pod_name": "robot-service", "container_name": "robot-service"},
+        "kubernetes": {
+            "pod_name": "robot-service",
+            "container_name": "robot-service",
+            "namespace": "default",
+        },
     },
     {
         "timestamp": (datetime.now() - timedelta(minutes=10)).isoformat(),
         "level": "warning",
         "message": "High CPU usage detected",
-        "kubernetes": {"pod_name": "prometheus", "container_name": "prometheus"},
+        "kubernetes": {
+            "pod_name": "prometheus",
+            "container_name": "prometheus",
+            "namespace": "default",
+        },
     },
     {
         "timestamp": (datetime.now() - timedelta(minutes=15)).isoformat(),
         "level": "error",
         "message": "Failed to connect to database",
-        "kubernetes": {"pod_name": "robot-service", "container_name": "robot-service"},
+        "kubernetes": {
+            "pod_name": "robot-service",
+            "container_name": "robot-service",
+            "namespace": "default",
+        },
     },
     {
         "timestamp": (datetime.now() - timedelta(minutes=20)).isoformat(),
         "level": "info",
         "message": "Dashboard service started",
-        "kubernetes": {"pod_name": "dashboard", "container_name": "dashboard"},
+        "kubernetes": {
+            "pod_name": "dashboard",
+            "container_name": "dashboard",
+            "namespace": "default",
+        },
     },
 ]
 
 
-class LogSearchResult(BaseModel):
-    total: int
-    logs: List[Dict[Any, Any]]
-
-
-def parse_log_line(line):
+def parse_log_line(line, default_timestamp=None):
     """Parse a log line to extract timestamp, level, and message.
     This is a simplified example and would need to be adapted to your log format.
+    Lines without a timestamp get ``default_timestamp``, or the current time.
     """
     try:
         # Pattern 1: ISO timestamp [LEVEL] Message
@@ -117,11 +367,11 @@ def parse_log_line(line):
             level = std_match.group(2).lower()
             message = std_match.group(3)
         elif simple_match:
-            timestamp = datetime.now(pytz.UTC).isoformat()
+            timestamp = default_timestamp or datetime.now(pytz.UTC).isoformat()
             level = simple_match.group(1).lower()
             message = simple_match.group(2)
         else:
-            timestamp = datetime.now(pytz.UTC).isoformat()
+            timestamp = default_timestamp or datetime.now(pytz.UTC).isoformat()
 
             # Try to extract log level by keywords
             level = "info"
@@ -144,18 +394,257 @@ def parse_log_line(line):
         # Fallback for unparseable lines
         logger.warning(f"Failed to parse log line: {e}")
         return {
-            "timestamp": datetime.now(pytz.UTC).isoformat(),
+            "timestamp": default_timestamp or datetime.now(pytz.UTC).isoformat(),
             "level": "info",
             "message": line,
         }
 
 
+def resolve_scope(namespace, label_selector):
+    """Return the (namespace, label_selector) to collect from for a request."""
+    return (
+        namespace or DEFAULT_NAMESPACE,
+        label_selector or DEFAULT_LABEL_SELECTOR,
+    )
+
+
+def list_pods(namespace=None, label_selector=None):
+    """List pods, pushing the namespace and label selector down to the API server
+    so that pods outside the scope are never fetched.
+    """
+    v1 = kube_client.get()
+    kwargs = {"watch": False}
+    if label_selector:
+        kwargs["label_selector"] = label_selector
+    if namespace:
+        return v1.list_namespaced_pod(namespace, **kwargs)
+    return v1.list_pod_for_all_namespaces(**kwargs)
+
+
+def list_sources(namespace=None, label_selector=None, pod=None, container=None):
+    """Return the (namespace, pod, container) sources in scope."""
+    sources = []
+    for pod_item in list_pods(namespace, label_selector).items:
+        pod_name = pod_item.metadata.name
+        if pod and pod != pod_name:
+            continue
+        if not (pod_item.spec and pod_item.spec.containers):
+            continue
+        for container_item in pod_item.spec.containers:
+            if container and container != container_item.name:
+                continue
+            sources.append((pod_item.metadata.namespace, pod_name, container_item.name))
+    return sources
+
+
+def format_source(source):
+    return "/".join(source)
+
+
+def fetch_container_logs(source):
+    pod_namespace, pod_name, container_name = source
+    kwargs = {}
+    high_water = log_store.high_water_mark(source)
+    if high_water is not None:
+        # Only download what was written since the last line we stored
+        kwargs["since_seconds"] = max(1, int((now_us() - high_water) / 1e6) + 1)
+    return kube_client.get().read_namespaced_pod_log(
+        name=pod_name,
+        namespace=pod_namespace,
+        container=container_name,
+        tail_lines=100,  # Limit for performance
+        timestamps=True,
+        _request_timeout=FETCH_TIMEOUT_SECONDS,
+        **kwargs,
+    )
+
+
+def parse_container_logs(pod_logs, after=None, timer=None):
+    """Yield LogStore rows for log output read with ``timestamps=True``.
+
+    The kubelet prefixes each line with an RFC 3339 timestamp. It orders lines
+    for de-duplication and stands in for lines without a timestamp of their own.
+    Lines at or before ``after`` are already stored and are skipped unparsed.
+    """
+    fetched = parsed = 0
+    for line in pod_logs.split("\n"):
+        if not line:
+            continue
+        fetched += 1
+        prefix, _, rest = line.partition(" ")
+        sequence = parse_timestamp(prefix, default=-1)
+        if sequence < 0:
+            log_entry = parse_log_line(line)
+            sequence = parse_timestamp(log_entry["timestamp"])
+        elif after is not None and sequence <= after:
+            continue
+        else:
+            log_entry = parse_log_line(rest, default_timestamp=prefix)
+        parsed += 1
+        timestamp = parse_timestamp(log_entry["timestamp"], default=sequence)
+        yield sequence, timestamp, log_entry["level"], log_entry["message"]
+    if timer is not None:
+        timer.count("lines_fetched", fetched)
+        timer.count("bytes_fetched", len(pod_logs.encode()))
+        timer.count("lines_parsed", parsed)
+
+
+async def collect(
+    namespace=None, label_selector=None, pod=None, container=None, timer=None
+):
+    """Read new log lines for every source in scope into the log store.
+
+    Returns the sources in scope and the names of the skipped sources.
+    """
+    timer = timer or StageTimer()
+    with timer.stage("list"):
+        sources = await asyncio.to_thread(
+            list_sources, namespace, label_selector, pod, container
+        )
+        # The other replicas read the pods the ring assigns to them
+        sources = [source for source in sources if membership.owns(source)]
+    with timer.stage("fetch"):
+        fetched, skipped = await fetch_sources(sources)
+    with timer.stage("parse"):
+        for source, pod_logs in fetched:
+            log_store.ingest(
+                source,
+                parse_container_logs(
+                    pod_logs, log_store.high_water_mark(source), timer
+                ),
+            )
+    if len(log_store.sealed) > log_store.memory_segments:
+        with timer.stage("spill"):
+            # Compresses segments to disk, so off the event loop
+            await asyncio.to_thread(log_store.spill_overflow)
+    return sources, skipped
+
+
+async def watch_membership():
+    """Follow the replica set; sources move at the next collection."""
+    while True:
+        try:
+            if await asyncio.to_thread(membership.refresh):
+                logger.info(f"log-api replicas are now {membership.members}")
+                shard_members.set(len(membership.members))
+        except Exception as e:
+            logger.error(f"Resolving {membership.service} failed: {e}")
+        await asyncio.sleep(PEER_REFRESH_SECONDS)
+
+
+async def collect_periodically():
+    """Keep the log store current for the default scope between searches."""
+    while True:
+        try:
+            if await kube_client.aget() is not None:
+                await collect(DEFAULT_NAMESPACE, DEFAULT_LABEL_SELECTOR)
+        except Exception as e:
+            logger.error(f"Background log collection failed: {e}")
+        await asyncio.sleep(COLLECT_INTERVAL_SECONDS)
+
+
+def source_filter(namespace, pod, container, sources=None):
+    """Build a predicate over stored (namespace, pod, container) sources.
+
+    When ``sources`` is given (label-selector scopes, which cannot be checked
+    against stored sources) only those sources are allowed.
+    """
+    if sources is not None:
+        return set(sources).__contains__
+
+    def source_ok(source):
+        return (
+            (not namespace or source[0] == namespace)
+            and (not pod or source[1] == pod)
+            and (not container or source[2] == container)
+        )
+
+    return source_ok
+
+
+def parse_time_param(name, value):
+    if not value:
+        return None
+    timestamp = parse_timestamp(value, default=-1)
+    if timestamp < 0:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+    return timestamp
+
+
+async def fetch_sources(sources):
+    """Fetch logs for all sources concurrently within the request deadline.
+
+    Sources whose breaker is open are not contacted. Sources that fail or do not
+    answer before the deadline are recorded as failures on the breaker. Returns
+    the fetched (source, text) pairs and the names of the skipped sources.
+    """
+    loop = asyncio.get_running_loop()
+    skipped = []
+    tasks = {}
+    for source in sources:
+        if not fetch_breaker.allow(source):
+            fetch_skipped.labels(reason="breaker_open").inc()
+            skipped.append(format_source(source))
+            continue
+        task = loop.run_in_executor(fetch_executor, fetch_container_logs, source)
+        tasks[task] = source
+
+    fetched = []
+    if not tasks:
+        return fetched, skipped
+
+    done, pending = await asyncio.wait(tasks, timeout=FETCH_DEADLINE_SECONDS)
+    for task in pending:
+        # The worker thread finishes on its own once _request_timeout expires.
+        task.cancel()
+        source = tasks[task]
+        logger.error(f"Deadline exceeded fetching logs for {format_source(source)}")
+        fetch_breaker.record_failure(source)
+        fetch_skipped.labels(reason="deadline").inc()
+        skipped.append(format_source(source))
+
+    # Keep the listing order so results are stable across requests
+    for task, source in tasks.items():
+        if task not in done:
+            continue
+        try:
+            fetched.append((source, task.result()))
+            fetch_breaker.record_success(source)
+        except Exception as e:
+            logger.error(f"Error getting logs for {format_source(source)}: {e}")
+            fetch_breaker.record_failure(source)
+            fetch_skipped.labels(reason="error").inc()
+            skipped.append(format_source(source))
+    return fetched, skipped
+
+
+def filter_mock_logs_by_namespace(logs, namespace):
+    if not namespace:
+        return logs
+    return [
+        log for log in logs if log.get("kubernetes", {}).get("namespace") == namespace
+    ]
+
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
 
 
-@app.get("/logs", response_model=LogSearchResult)
+@app.get("/ready")
+def readiness_check():
+    # Ready once the Kubernetes client has loaded or failed to; without a
+    # cluster the API still answers from the mock logs.
+    if kube_client.state == PENDING:
+        return JSONResponse(
+            status_code=503, content={"status": "starting", "kubernetes": PENDING}
+        )
+    return {"status": "ready", "kubernetes": kube_client.state}
+
+
+@app.get(
+    "/logs", response_model=LogSearchResult, response_model_exclude_none=True
+)
 async def get_logs(
     query: Optional[str] = None,
     level: Optional[str] = None,
@@ -163,166 +652,538 @@ async def get_logs(
     container: Optional[str] = None,
     from_time: Optional[str] = None,
     to_time: Optional[str] = None,
+    namespace: Optional[str] = None,
+    label_selector: Optional[str] = None,
     limit: int = Query(100, gt=0, le=1000),
-    offset: int = Query(0, ge=0),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    debug: Optional[str] = Query(None, pattern="^timing$"),
+    # scope=local searches only this replica's shard
+    scope: Optional[str] = Query(None, pattern="^local$"),
 ):
-    with request_duration.labels(endpoint="/logs").time():
-        search_count.inc()
-        logger.info(f"Searching logs with query: {query}, level: {level}, pod: {pod}")
+    search_count.inc()
+    timer = StageTimer()
+    peers = membership.peers() if scope is None else []
+    segment, skipped_sources, total_exact = await search_logs(
+        query,
+        level,
+        pod,
+        container,
+        from_time,
+        to_time,
+        namespace,
+        label_selector,
+        timer,
+        # Mock lines would pass for real ones in a merge across replicas
+        fallback=scope is None and not peers,
+        # Only the newest matches are returned, here and from the peers
+        newest=offset + limit,
+    )
+    timer.count("lines_matched", len(segment))
+    total = len(segment)
+    # Sort logs by timestamp (descending) and materialize only this page
+    with timer.stage("sort"):
+        if peers:
+            # Merged with the peers' pages below
+            page = segment.page(0, offset + limit)
+        else:
+            page = segment.page(offset, limit)
 
-        all_logs = []
+    if peers:
+        params = {
+            "query": query,
+            "level": level,
+            "pod": pod,
+            "container": container,
+            "from_time": from_time,
+            "to_time": to_time,
+            "namespace": namespace,
+            "label_selector": label_selector,
+        }
+        params = {name: value for name, value in params.items() if value}
+        with timer.stage("gather"):
+            results = await search_peers(peers, params, offset + limit)
+        pages = [page]
+        for peer, result in results:
+            if result is None:
+                skipped_sources.append(f"peer {peer}")
+                continue
+            total += result["total"]
+            total_exact = total_exact and result["total_exact"]
+            skipped_sources.extend(result["skipped_sources"])
+            pages.append(result["logs"])
+        with timer.stage("merge"):
+            page = merge_newest(pages, offset, limit)
 
-        if k8s_available and v1:
-            try:
-                # Get all pods in all namespaces
-                pods = v1.list_pod_for_all_namespaces(watch=False)
-
-                # Collect logs from each pod
-                for pod_item in pods.items:
-                    pod_name = pod_item.metadata.name
-                    namespace = pod_item.metadata.namespace
-
-                    # Skip if pod filter is specified and doesn't match
-                    if pod and pod != pod_name:
-                        continue
-
-                    # Get containers for this pod
-                    if pod_item.spec and pod_item.spec.containers:
-                        for container_item in pod_item.spec.containers:
-                            container_name = container_item.name
-
-                            # Skip if container filter is specified and doesn't match
-                            if container and container != container_name:
-                                continue
-
-                            try:
-                                # Get logs for this container
-                                pod_logs = v1.read_namespaced_pod_log(
-                                    name=pod_name,
-                                    namespace=namespace,
-                                    container=container_name,
-                                    tail_lines=100,  # Limit for performance
-                                )
-
-                                # Parse log lines
-                                for line in pod_logs.split("\n"):
-                                    if not line:
-                                        continue
-
-                                    # Parse log line to extract timestamp and level
-                                    log_entry = parse_log_line(line)
-                                    log_entry["kubernetes"] = {
-                                        "pod_name": pod_name,
-                                        "container_name": container_name,
-                                        "namespace": namespace,
-                                    }
-
-                                    # Apply filters
-                                    if level and log_entry.get("level") != level:
-                                        continue
-                                    if query and query.lower() not in line.lower():
-                                        continue
-
-                                    all_logs.append(log_entry)
-                            except Exception as e:
-                                logger.error(
-                                    f"Error getting logs for pod {pod_name}, container {container_name}: {e}"
-                                )
-                                # Continue with next container
-            except Exception as e:
-                logger.error(f"Error accessing Kubernetes API: {e}")
+    return {
+        "total": total,
+        "total_exact": total_exact,
+        "logs": page,
+        "partial": bool(skipped_sources),
+        "skipped_sources": skipped_sources,
+        "timing": timer.report() if debug == "timing" else None,
+    }
 
-        if not all_logs:
-            logger.info("Using mock logs as fallback")
-            all_logs = mock_logs.copy()
 
-            # Apply filters to mock logs
-            if query:
-                all_logs = [
-                    log
-                    for log in all_logs
-                    if query.lower() in log.get("message", "").lower()
-                ]
+@app.get("/logs/patterns", response_model=LogPatternResult)
+async def get_log_patterns(
+    query: Optional[str] = None,
+    level: Optional[str] = None,
+    pod: Optional[str] = None,
+    container: Optional[str] = None,
+    from_time: Optional[str] = None,
+    to_time: Optional[str] = None,
+    namespace: Optional[str] = None,
+    label_selector: Optional[str] = None,
+    limit: int = Query(50, gt=0, le=500),
+    samples: int = Query(3, ge=0, le=20),
+):
+    """Group the lines matching a /logs search by message template."""
+    segment, skipped_sources, _ = await search_logs(
+        query, level, pod, container, from_time, to_time, namespace, label_selector
+    )
+    timestamps = segment.timestamps
+    patterns = summarize_patterns(
+        pattern_miner,
+        ((timestamps[i], segment.message(i)) for i in range(len(segment))),
+        limit=limit,
+        samples=samples,
+    )
+    for pattern in patterns:
+        pattern["first_seen"] = format_timestamp(pattern["first_seen"])
+        pattern["last_seen"] = format_timestamp(pattern["last_seen"])
+    # Patterns are not merged across replicas; the others' shards are missing
+    skipped_sources.extend(f"peer {peer}" for peer in membership.peers())
+    return {
+        "total": len(segment),
+        "patterns": patterns,
+        "partial": bool(skipped_sources),
+        "skipped_sources": skipped_sources,
+    }
 
-            if level:
-                all_logs = [log for log in all_logs if log.get("level") == level]
 
-            if pod:
-                all_logs = [
-                    log
-                    for log in all_logs
-                    if log.get("kubernetes", {}).get("pod_name") == pod
-                ]
+def compile_query_param(query):
+    try:
+        return compile_query(query) if query else None
+    except QuerySyntaxError as e:
+        logger.error(f"Invalid log query {query!r}: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
 
-            if container:
-                all_logs = [
-                    log
-                    for log in all_logs
-                    if log.get("kubernetes", {}).get("container_name") == container
-                ]
 
-        # Sort logs by timestamp (descending)
-        all_logs.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+@app.get("/logs/export")
+async def export_logs(
+    query: Optional[str] = None,
+    level: Optional[str] = None,
+    pod: Optional[str] = None,
+    container: Optional[str] = None,
+    from_time: Optional[str] = None,
+    to_time: Optional[str] = None,
+    namespace: Optional[str] = None,
+    label_selector: Optional[str] = None,
+    checkpoint: Optional[str] = None,
+    scope: Optional[str] = Query(None, pattern="^local$"),
+):
+    """Stream every stored line matching the filter as NDJSON, oldest first.
 
-        # Apply pagination
-        paginated_logs = all_logs[offset : offset + limit]
+    A ``{"checkpoint": ...}`` line follows every EXPORT_CHECKPOINT_ROWS lines
+    and ends the stream. Repeating the request with the last checkpoint
+    received resumes right after the lines written before it.
 
-        return {"total": len(all_logs), "logs": paginated_logs}
+    With several replicas an export covers only this replica's shard, so it
+    must be asked for explicitly with scope=local.
+    """
+    if scope is None and membership.peers():
+        raise HTTPException(
+            status_code=409,
+            detail="Logs are sharded across replicas; export from each replica "
+            "with scope=local",
+        )
+    namespace, label_selector = resolve_scope(namespace, label_selector)
+    plan = compile_query_param(query)
+    from_us = parse_time_param("from_time", from_time)
+    to_us = parse_time_param("to_time", to_time)
+    resume_us, skip = parse_checkpoint(checkpoint)
+    if resume_us is not None:
+        from_us = resume_us if from_us is None else max(from_us, resume_us)
 
+    sources = None
+    if await kube_client.aget() is not None:
+        try:
+            # Pick up what was written since the last collection
+            sources, _ = await collect(namespace, label_selector, pod, container)
+        except Exception as e:
+            logger.error(f"Error accessing Kubernetes API: {e}")
+    search = SearchFilter(
+        from_us=from_us,
+        to_us=to_us,
+        level=level,
+        source_ok=source_filter(
+            namespace, pod, container, sources if label_selector else None
+        ),
+        plan=plan,
+    )
+    logger.info(
+        f"Exporting logs with query: {query}, level: {level}, pod: {pod}, "
+        f"namespace: {namespace}, from: {from_us}, checkpoint: {checkpoint}"
+    )
+    return StreamingResponse(
+        export_lines(log_store.stream(search), resume_us, skip),
+        media_type="application/x-ndjson",
+    )
 
-@app.get("/pods")
-async def get_pods():
-    with request_duration.labels(endpoint="/pods").time():
-        if k8s_available and v1:
-            try:
-                # Get pods from Kubernetes API
-                pods = v1.list_pod_for_all_namespaces(watch=False)
-                pod_names = [pod.metadata.name for pod in pods.items]
-                return {"pods": pod_names}
-            except Exception as e:
-                logger.error(f"Error getting pods from Kubernetes API: {e}")
-
-        # Use mock pods if K8s not available or error occurred
-        pods = list(
-            set(
-                log.get("kubernetes", {}).get("pod_name")
-                for log in mock_logs
-                if log.get("kubernetes", {}).get("pod_name")
+
+def parse_checkpoint(checkpoint):
+    """Split a ``<timestamp_us>-<lines at that timestamp>`` checkpoint."""
+    if not checkpoint:
+        return None, 0
+    timestamp, _, count = checkpoint.partition("-")
+    try:
+        return int(timestamp), int(count)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid checkpoint: {checkpoint}")
+
+
+def export_lines(rows, resume_us=None, skip=0):
+    """Encode stream rows as NDJSON, with checkpoint lines between chunks."""
+    last_us, at_last = resume_us, skip
+    chunk = []
+    for timestamp, source, level_id, message, _ in rows:
+        if timestamp == resume_us and skip:
+            # Already sent before the checkpoint
+            skip -= 1
+            continue
+        if timestamp == last_us:
+            at_last += 1
+        else:
+            last_us, at_last = timestamp, 1
+        namespace, pod_name, container_name = source
+        chunk.append(
+            json.dumps(
+                {
+                    "timestamp": format_timestamp(timestamp),
+                    "level": level_table[level_id],
+                    "message": message,
+                    "kubernetes": {
+                        "pod_name": pod_name,
+                        "container_name": container_name,
+                        "namespace": namespace,
+                    },
+                }
             )
         )
-        return {"pods": pods}
+        if len(chunk) >= EXPORT_CHECKPOINT_ROWS:
+            chunk.append(json.dumps({"checkpoint": f"{last_us}-{at_last}"}))
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if last_us is not None:
+        chunk.append(json.dumps({"checkpoint": f"{last_us}-{at_last}", "done": True}))
+    else:
+        chunk.append(json.dumps({"done": True}))
+    yield "\n".join(chunk) + "\n"
 
 
-@app.get("/containers")
-async def get_containers():
-    with request_duration.labels(endpoint="/containers").time():
-        if k8s_available and v1:
+async def search_logs(
+    query,
+    level,
+    pod,
+    container,
+    from_time,
+    to_time,
+    namespace,
+    label_selector,
+    timer=None,
+    fallback=True,
+    newest=None,
+):
+    """Collect new lines for the scope and return the matching ones, falling
+    back to the mock logs unless ``fallback`` is off, with the names of the
+    skipped sources and whether the matches are all of them.
+
+    With ``newest``, the store is only searched until the ``newest`` newest
+    matches are certain to be among the returned ones.
+    """
+    timer = timer or StageTimer()
+    namespace, label_selector = resolve_scope(namespace, label_selector)
+    plan = compile_query_param(query)
+    logger.info(
+        f"Searching logs with query: {query}, level: {level}, pod: {pod}, "
+        f"namespace: {namespace}, label_selector: {label_selector}"
+    )
+
+    from_us = parse_time_param("from_time", from_time)
+    to_us = parse_time_param("to_time", to_time)
+
+    segment = LogSegment()
+    skipped_sources = []
+    exact = True
+
+    if await kube_client.aget() is not None:
+        try:
+            # Read new lines for the containers in the requested scope
+            sources, skipped_sources = await collect(
+                namespace, label_selector, pod, container, timer
+            )
+            search = SearchFilter(
+                from_us=from_us,
+                to_us=to_us,
+                level=level,
+                source_ok=source_filter(
+                    namespace,
+                    pod,
+                    container,
+                    sources if label_selector else None,
+                ),
+                plan=plan,
+            )
+            with timer.stage("filter"):
+                # Spill reads decompress blocks, so keep them off the loop
+                if newest is None:
+                    segment = await asyncio.to_thread(log_store.search, search)
+                else:
+                    segment, exact = await asyncio.to_thread(
+                        log_store.search_newest, search, newest
+                    )
+        except Exception as e:
+            logger.error(f"Error accessing Kubernetes API: {e}")
+
+    if fallback and not len(segment):
+        logger.info("Using mock logs as fallback")
+        for log in filter_mock_logs_by_namespace(mock_logs, namespace):
+            k8s = log.get("kubernetes", {})
+            if pod and k8s.get("pod_name") != pod:
+                continue
+            if container and k8s.get("container_name") != container:
+                continue
+            if level and log["level"] != level:
+                continue
+            source = (
+                k8s.get("namespace", ""),
+                k8s.get("pod_name", ""),
+                k8s.get("container_name", ""),
+            )
+            if plan and not plan(log["message"], log["level"], source):
+                continue
+            segment.add(log["timestamp"], log["level"], source, log["message"])
+    return segment, skipped_sources, exact
+
+
+async def search_peers(peers, params, want):
+    """Ask every peer for the newest ``want`` matches in its own shard.
+
+    Returns (peer, result) pairs in /logs format, with None for failed peers.
+    """
+
+    async def search_peer(peer):
+        try:
+            return await asyncio.to_thread(
+                fetch_peer_logs, peer, params, want, PEER_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            logger.error(f"Error searching logs on peer {peer}: {e}")
+            peer_search_failures.inc()
+            return None
+
+    results = await asyncio.gather(*(search_peer(peer) for peer in peers))
+    return list(zip(peers, results))
+
+
+async def notify_standing_queries():
+    """Post each standing query's new matches to its webhook."""
+    while True:
+        await asyncio.sleep(STANDING_WEBHOOK_INTERVAL_SECONDS)
+        for standing in standing_queries:
+            if not standing.webhook_url or not standing.pending:
+                continue
+            matches, dropped = standing.take_pending()
+            payload = {
+                "id": standing.id,
+                "name": standing.name,
+                "query": standing.query,
+                "matches": [match_entry(m) for m in matches],
+                "dropped": dropped,
+            }
             try:
-                # Get containers from Kubernetes API
-                pods = v1.list_pod_for_all_namespaces(watch=False)
-                containers = []
-                for pod in pods.items:
-                    if pod.spec and pod.spec.containers:
-                        for container in pod.spec.containers:
-                            containers.append(container.name)
-                return {"containers": list(set(containers))}
+                await asyncio.to_thread(
+                    post_webhook,
+                    standing.webhook_url,
+                    payload,
+                    STANDING_WEBHOOK_TIMEOUT_SECONDS,
+                )
+                standing_notifications.labels(outcome="sent").inc()
             except Exception as e:
-                logger.error(f"Error getting containers from Kubernetes API: {e}")
-
-        # Use mock containers if K8s not available or error occurred
-        containers = list(
-            set(
-                log.get("kubernetes", {}).get("container_name")
-                for log in mock_logs
-                if log.get("kubernetes", {}).get("container_name")
+                logger.error(f"Webhook for standing query {standing.id} failed: {e}")
+                standing_notifications.labels(outcome="failed").inc()
+
+
+# The standing query endpoints are async so that they run on the event loop,
+# like ingest, and never change the index while a line is being matched
+
+
+@app.post("/logs/standing", response_model=StandingQueryInfo, status_code=201)
+async def create_standing_query(request: StandingQueryCreate):
+    """Register a query to be matched against every line ingested from now on."""
+    if request.webhook_url:
+        url = urllib.parse.urlparse(request.webhook_url)
+        if url.scheme not in ("http", "https"):
+            raise HTTPException(status_code=400, detail="webhook_url must be http(s)")
+        if (url.hostname or "") not in STANDING_WEBHOOK_HOSTS:
+            raise HTTPException(
+                status_code=400,
+                detail="webhook_url host is not in LOG_API_STANDING_WEBHOOK_HOSTS",
             )
+    try:
+        standing = standing_queries.add(**request.model_dump())
+    except ValueError as e:
+        # Includes QuerySyntaxError
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"Standing query {standing.id} registered: {request.query}")
+    return standing_info(standing)
+
+
+@app.get("/logs/standing", response_model=List[StandingQueryInfo])
+async def list_standing_queries():
+    return [standing_info(standing) for standing in standing_queries]
+
+
+@app.get("/logs/standing/events")
+async def standing_query_events(id: str):
+    """Stream the matches of a standing query as server-sent events."""
+    standing = get_standing_query(id)
+    return StreamingResponse(
+        standing_events(standing, keepalive=STANDING_KEEPALIVE_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/logs/standing/{query_id}", response_model=StandingQueryInfo)
+async def get_standing_query_info(query_id: str):
+    return standing_info(get_standing_query(query_id), recent=True)
+
+
+@app.delete("/logs/standing/{query_id}", response_model=StandingQueryInfo)
+async def delete_standing_query(query_id: str):
+    standing = get_standing_query(query_id)
+    standing_queries.remove(query_id)
+    return standing_info(standing)
+
+
+def standing_info(standing, recent=False):
+    info = standing.describe(recent)
+    # Standing queries only see the lines this replica collects
+    info["partial"] = bool(membership.peers())
+    return info
+
+
+def get_standing_query(query_id):
+    standing = standing_queries.get(query_id)
+    if standing is None:
+        raise HTTPException(status_code=404, detail="Standing query not found")
+    return standing
+
+
+@app.get("/pods")
+async def get_pods(
+    namespace: Optional[str] = None, label_selector: Optional[str] = None
+):
+    namespace, label_selector = resolve_scope(namespace, label_selector)
+    if await kube_client.aget() is not None:
+        try:
+            # Get pods from Kubernetes API
+            pods = list_pods(namespace, label_selector)
+            pod_names = [pod.metadata.name for pod in pods.items]
+            return {"pods": pod_names}
+        except Exception as e:
+            logger.error(f"Error getting pods from Kubernetes API: {e}")
+
+    # Use mock pods if K8s not available or error occurred
+    pods = list(
+        set(
+            log.get("kubernetes", {}).get("pod_name")
+            for log in filter_mock_logs_by_namespace(mock_logs, namespace)
+            if log.get("kubernetes", {}).get("pod_name")
+        )
+    )
+    return {"pods": pods}
+
+
+@app.get("/containers")
+async def get_containers(
+    namespace: Optional[str] = None, label_selector: Optional[str] = None
+):
+    namespace, label_selector = resolve_scope(namespace, label_selector)
+    if await kube_client.aget() is not None:
+        try:
+            # Get containers from Kubernetes API
+            pods = list_pods(namespace, label_selector)
+            containers = []
+            for pod in pods.items:
+                if pod.spec and pod.spec.containers:
+                    for container in pod.spec.containers:
+                        containers.append(container.name)
+            return {"containers": list(set(containers))}
+        except Exception as e:
+            logger.error(f"Error getting containers from Kubernetes API: {e}")
+
+    # Use mock containers if K8s not available or error occurred
+    containers = list(
+        set(
+            log.get("kubernetes", {}).get("container_name")
+            for log in filter_mock_logs_by_namespace(mock_logs, namespace)
+            if log.get("kubernetes", {}).get("container_name")
         )
-        return {"containers": containers}
+    )
+    return {"containers": containers}
+
+
+# Range queries for the dashboard go through one shared cache instead of each
+# browser tab querying Prometheus directly.
+PROMETHEUS_URL = os.getenv("LOG_API_PROMETHEUS_URL", "http://prometheus:9090")
+prometheus_cache = RangeQueryCache(
+    fetch=lambda query, start, end, step: fetch_query_range(
+        PROMETHEUS_URL, query, start, end, step
+    ),
+    refresh_seconds=float(os.getenv("LOG_API_PROMETHEUS_REFRESH_SECONDS", "15")),
+    settle_seconds=float(os.getenv("LOG_API_PROMETHEUS_SETTLE_SECONDS", "60")),
+    max_entries=int(os.getenv("LOG_API_PROMETHEUS_CACHE_ENTRIES", "256")),
+)
+
+
+@app.get("/prometheus/query_range")
+async def prometheus_query_range(
+    query: str,
+    start: float,
+    end: float,
+    step: str = "60s",
+    points: Optional[int] = Query(None, ge=1),
+    mode: str = Query("last", alias="downsample", pattern="^(last|avg|max|min)$"),
+):
+    """Prometheus query_range through the cache, optionally downsampled to at
+    most ``points`` samples per series.
+    """
+    try:
+        result = await prometheus_cache.query_range(query, start, end, parse_step(step))
+    except PrometheusError as e:
+        logger.error(f"Prometheus query {query!r} failed: {e}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    if points:
+        result = [
+            {**series, "values": downsample(series["values"], points, mode)}
+            for series in result
+        ]
+    return {"status": "success", "data": {"resultType": "matrix", "result": result}}
+
+
+# Scrapes within METRICS_CACHE_SECONDS of a render are served the same bytes;
+# 0 renders on every scrape.
+metrics_cache = ExpositionCache(ttl=float(os.getenv("METRICS_CACHE_SECONDS", "0")))
 
 
 @app.get("/metrics")
-def metrics():
-    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+def metrics(request: Request):
+    body, media_type, headers = metrics_cache.response_parts(
+        request.headers.get("accept", ""), request.headers.get("accept-encoding", "")
+    )
+    return Response(content=body, media_type=media_type, headers=headers)
 
 
 if __name__ == "__main__":
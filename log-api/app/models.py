@@ -12,4 +12,57 @@ class LogEntry(BaseModel):
 
 class LogSearchResult(BaseModel):
     total: int
+    # False when the search stopped once the page was certain; total is then
+    # a lower bound
+    total_exact: bool = True
     logs: List[Dict[Any, Any]]
+    # Set when some sources were skipped (breaker open, error or deadline)
+    partial: bool = False
+    skipped_sources: List[str] = []
+    # Per-stage breakdown, only returned with debug=timing
+    timing: Optional[Dict[str, Any]] = None
+
+
+class LogPattern(BaseModel):
+    pattern: str
+    count: int
+    first_seen: str
+    last_seen: str
+    # Values seen in the template's <*> positions
+    sample_values: List[str]
+
+
+class LogPatternResult(BaseModel):
+    total: int
+    patterns: List[LogPattern]
+    partial: bool = False
+    skipped_sources: List[str] = []
+
+
+class StandingQueryCreate(BaseModel):
+    name: Optional[str] = None
+    query: Optional[str] = None
+    level: Optional[str] = None
+    namespace: Optional[str] = None
+    pod: Optional[str] = None
+    container: Optional[str] = None
+    # Batches of new matches are POSTed here as JSON
+    webhook_url: Optional[str] = None
+
+
+class StandingQueryInfo(BaseModel):
+    id: str
+    name: Optional[str] = None
+    query: Optional[str] = None
+    level: Optional[str] = None
+    namespace: Optional[str] = None
+    pod: Optional[str] = None
+    container: Optional[str] = None
+    webhook_url: Optional[str] = None
+    matches: int
+    last_match: Optional[str] = None
+    subscribers: int = 0
+    # Set when logs are sharded: only this replica's lines are matched
+    partial: bool = False
+    # Newest first, only returned for a single query
+    recent: Optional[List[Dict[str, Any]]] = None
@@ -0,0 +1,192 @@
+"""Online log template mining with a Drain-style fixed-depth parse tree.
+
+Each message is split on whitespace. As in Drain, ``depth`` counts the root
+and the token-count layer, so the tree is keyed by token count and then by the
+first ``depth - 2`` tokens, with tokens that contain a digit (ids, numbers,
+addresses) sent down a shared ``<*>`` branch. A leaf holds a few template
+clusters; a message joins the most similar one when at least ``similarity`` of
+its tokens agree, and positions that differ become ``<*>``. Otherwise it
+starts a new cluster. Learning a line therefore costs ``depth - 1`` dict
+lookups plus a comparison against the clusters of one leaf. Tokens past the
+prefix, such as ids without digits, are left to the similarity check.
+
+Memory is bounded: nodes have at most ``max_children`` children (the rest share
+the ``<*>`` branch) and at most ``max_clusters`` clusters are kept, evicting
+the one that matched a line longest ago.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+WILDCARD = "<*>"
+
+
+def has_digit(token: str) -> bool:
+    return any(c.isdigit() for c in token)
+
+
+def masked(tokens: List[str]) -> List[str]:
+    """The tokens with every digit-bearing token replaced by the wildcard."""
+    return [WILDCARD if has_digit(t) else t for t in tokens]
+
+
+class Cluster:
+    __slots__ = ("id", "template", "size", "leaf")
+
+    def __init__(self, cluster_id: int, template: List[str], leaf: list):
+        self.id = cluster_id
+        self.template = template
+        self.size = 1
+        self.leaf = leaf
+
+    @property
+    def pattern(self) -> str:
+        return " ".join(self.template)
+
+
+def token_similarity(
+    template: List[str], tokens: List[str], wildcards_agree: bool = False
+) -> Tuple[float, int]:
+    """Share of template tokens that agree with ``tokens``, and the number of
+    wildcards in the template. Wildcards agree only if ``wildcards_agree``.
+    """
+    same = wildcards = 0
+    for expected, token in zip(template, tokens):
+        if expected == WILDCARD:
+            wildcards += 1
+        elif expected == token:
+            same += 1
+    if wildcards_agree:
+        same += wildcards
+    return same / len(template), wildcards
+
+
+class PatternMiner:
+    def __init__(
+        self,
+        depth: int = 4,
+        similarity: float = 0.5,
+        max_children: int = 100,
+        max_clusters: int = 1000,
+    ):
+        self.depth = max(3, depth)
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.root: Dict = {}
+        # Least recently matched first
+        self.clusters: "OrderedDict[int, Cluster]" = OrderedDict()
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self.clusters)
+
+    def clear(self) -> None:
+        self.root = {}
+        self.clusters.clear()
+
+    def _leaf(self, tokens: List[str], create: bool) -> Optional[list]:
+        node = self.root.get(len(tokens))
+        if node is None:
+            if not create:
+                return None
+            node = self.root[len(tokens)] = {}
+        path = tokens[: self.depth - 2]
+        for i, token in enumerate(path):
+            key = WILDCARD if has_digit(token) else token
+            child = node.get(key)
+            if child is None:
+                child = node.get(WILDCARD) if not create else None
+            if child is None:
+                if not create:
+                    return None
+                if len(node) >= self.max_children:
+                    key = WILDCARD
+                last = i == len(path) - 1
+                child = node.setdefault(key, [] if last else {})
+            node = child
+        if isinstance(node, dict):
+            # Messages with no tokens end at the length node
+            node = node.setdefault(None, [])
+        return node
+
+    def _best(
+        self, leaf: list, tokens: List[str], threshold: float, covering=False
+    ) -> Optional[Cluster]:
+        best, best_score = None, (-1.0, -1)
+        for cluster in leaf:
+            score = (1.0, 0)
+            if tokens:
+                score = token_similarity(cluster.template, tokens, covering)
+            if score[0] >= threshold and score > best_score:
+                best, best_score = cluster, score
+        return best
+
+    def add(self, message: str) -> Cluster:
+        """Learn ``message`` and return the cluster it now belongs to."""
+        tokens = message.split()
+        leaf = self._leaf(tokens, create=True)
+        cluster = self._best(leaf, tokens, self.similarity)
+        if cluster is not None:
+            cluster.size += 1
+            cluster.template = [
+                expected if expected == token else WILDCARD
+                for expected, token in zip(cluster.template, tokens)
+            ]
+            self.clusters.move_to_end(cluster.id)
+            return cluster
+        cluster = Cluster(self._next_id, masked(tokens), leaf)
+        self._next_id += 1
+        leaf.append(cluster)
+        self.clusters[cluster.id] = cluster
+        while len(self.clusters) > self.max_clusters:
+            _, evicted = self.clusters.popitem(last=False)
+            evicted.leaf.remove(evicted)
+        return cluster
+
+    def match(self, message: str) -> Optional[Cluster]:
+        """The cluster whose template covers ``message``, without learning it."""
+        tokens = message.split()
+        leaf = self._leaf(tokens, create=False)
+        if leaf is None:
+            return None
+        return self._best(leaf, tokens, 1.0, covering=True)
+
+
+def summarize(
+    miner: PatternMiner,
+    messages,
+    limit: int = 50,
+    samples: int = 3,
+) -> List[dict]:
+    """Group ``(timestamp, message)`` pairs by template, largest groups first.
+
+    Messages no template covers (learned before an eviction, or never
+    ingested) are grouped by their masked tokens instead.
+    """
+    groups: Dict[Tuple[str, ...], dict] = {}
+    for timestamp, message in messages:
+        tokens = message.split()
+        cluster = miner.match(message)
+        template = tuple(cluster.template if cluster else masked(tokens))
+        group = groups.get(template)
+        if group is None:
+            group = groups[template] = {
+                "pattern": " ".join(template),
+                "count": 0,
+                "first_seen": timestamp,
+                "last_seen": timestamp,
+                "sample_values": [],
+            }
+        group["count"] += 1
+        group["first_seen"] = min(group["first_seen"], timestamp)
+        group["last_seen"] = max(group["last_seen"], timestamp)
+        values = group["sample_values"]
+        if len(values) < samples:
+            value = " ".join(
+                t for expected, t in zip(template, tokens) if expected == WILDCARD
+            )
+            if value and value not in values:
+                values.append(value)
+    ordered = sorted(groups.values(), key=lambda g: g["count"], reverse=True)
+    return ordered[:limit]
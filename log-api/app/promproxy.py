@@ -0,0 +1,227 @@
+"""Caching proxy for Prometheus range queries.
+
+Results are cached per (query, step) on a grid of ``step``-aligned timestamps,
+so every client asking for the same query sees the same sample times and
+shares one cache entry. A request fetches only what the entry does not hold:
+usually the tail since the previous fetch. Samples newer than
+``settle_seconds`` may still change (late scrapes, rule evaluation), so they
+are fetched again on the next refresh; older ones are final. Within
+``refresh_seconds`` of a fetch the entry is served as is, and concurrent
+requests for the same entry wait for one fetch instead of each sending their
+own.
+"""
+
+import asyncio
+import json
+import math
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class PrometheusError(Exception):
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def fetch_query_range(base_url, query, start, end, step, timeout=10.0):
+    """Run one query_range against Prometheus and return its result list."""
+    params = urllib.parse.urlencode(
+        {"query": query, "start": start, "end": end, "step": step}
+    )
+    url = f"{base_url.rstrip('/')}/api/v1/query_range?{params}"
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            body = json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            body = json.load(e)
+        except ValueError:
+            raise PrometheusError(f"Prometheus returned HTTP {e.code}")
+        # Bad queries are the client's error; anything else is upstream
+        status = 400 if body.get("errorType") == "bad_data" else 502
+        raise PrometheusError(body.get("error", f"HTTP {e.code}"), status)
+    except (OSError, ValueError) as e:
+        raise PrometheusError(f"Prometheus unavailable: {e}")
+    if body.get("status") != "success":
+        raise PrometheusError(body.get("error", "query failed"))
+    return body["data"]["result"]
+
+
+def parse_step(value: str) -> float:
+    """Parse a step given in seconds ("60") or as a duration ("60s", "5m")."""
+    text = value.strip()
+    for unit in sorted(_DURATION_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            number, scale = text[: -len(unit)], _DURATION_UNITS[unit]
+            break
+    else:
+        number, scale = text, 1
+    try:
+        step = float(number) * scale
+    except ValueError:
+        raise PrometheusError(f"Invalid step: {value}", 400)
+    if not step > 0:
+        raise PrometheusError(f"Invalid step: {value}", 400)
+    return step
+
+
+def downsample(values: List[list], points: int, mode: str = "last") -> List[list]:
+    """Reduce ``values`` to at most ``points`` samples, one per equal bucket.
+
+    Each bucket is stamped with its last sample's time. ``last`` keeps counters
+    exact; ``avg``, ``max`` and ``min`` summarize gauges.
+    """
+    if points <= 0 or len(values) <= points:
+        return values
+    size = len(values) / points
+    out = []
+    for i in range(points):
+        bucket = values[int(i * size) : int((i + 1) * size)]
+        if not bucket:
+            continue
+        if mode == "last":
+            out.append(bucket[-1])
+            continue
+        numbers = [float(v) for _, v in bucket]
+        if mode == "avg":
+            value = sum(numbers) / len(numbers)
+        elif mode == "max":
+            value = max(numbers)
+        else:
+            value = min(numbers)
+        out.append([bucket[-1][0], repr(value)])
+    return out
+
+
+class RangeEntry:
+    """Cached samples of one (query, step), keyed by step index."""
+
+    __slots__ = ("lo", "settled", "hi", "fetched_at", "series", "lock")
+
+    def __init__(self):
+        self.lo: Optional[int] = None  # first cached step index
+        self.settled: Optional[int] = None  # last final step index
+        self.hi: Optional[int] = None  # last fetched step index
+        self.fetched_at = -math.inf
+        # series labels -> (metric, {step index: value})
+        self.series: Dict[Tuple, Tuple[dict, Dict[int, str]]] = {}
+        self.lock = asyncio.Lock()
+
+
+class RangeQueryCache:
+    def __init__(
+        self,
+        fetch: Callable,
+        refresh_seconds: float = 15.0,
+        settle_seconds: float = 60.0,
+        max_entries: int = 256,
+        max_points: int = 11_000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.fetch = fetch
+        self.refresh_seconds = refresh_seconds
+        self.settle_seconds = settle_seconds
+        self.max_entries = max_entries
+        self.max_points = max_points
+        self.clock = clock
+        self.fetches = 0
+        self._entries: "OrderedDict[Tuple[str, float], RangeEntry]" = OrderedDict()
+
+    def _entry(self, query: str, step: float) -> RangeEntry:
+        key = (query, step)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = RangeEntry()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def _fetch(self, query, first: int, last: int, step: float):
+        self.fetches += 1
+        return await asyncio.to_thread(
+            self.fetch, query, first * step, last * step, step
+        )
+
+    def _merge(self, entry: RangeEntry, result, first: int, last: int, step) -> None:
+        # Drop what the fetched range replaces, including samples that vanished
+        for _, samples in entry.series.values():
+            for index in [i for i in samples if first <= i <= last]:
+                del samples[index]
+        for series in result:
+            metric = series.get("metric", {})
+            key = tuple(sorted(metric.items()))
+            _, samples = entry.series.setdefault(key, (metric, {}))
+            for timestamp, value in series.get("values", ()):
+                samples[round(float(timestamp) / step)] = value
+
+    def _trim(self, entry: RangeEntry) -> None:
+        if entry.hi - entry.lo + 1 <= self.max_points:
+            return
+        entry.lo = entry.hi - self.max_points + 1
+        entry.settled = max(entry.settled, entry.lo - 1)
+        for key in list(entry.series):
+            _, samples = entry.series[key]
+            for index in [i for i in samples if i < entry.lo]:
+                del samples[index]
+            if not samples:
+                del entry.series[key]
+
+    async def query_range(
+        self, query: str, start: float, end: float, step: float
+    ) -> List[dict]:
+        """Return Prometheus-style matrix series for the aligned window."""
+        first, last = math.ceil(start / step), math.floor(end / step)
+        if last < first:
+            return []
+        if last - first + 1 > self.max_points:
+            raise PrometheusError(
+                f"Window holds more than {self.max_points} points; raise step", 400
+            )
+        entry = self._entry(query, step)
+        async with entry.lock:
+            now = self.clock()
+            covered = entry.lo is not None and entry.lo <= first
+            final = covered and last <= entry.settled
+            fresh = (
+                covered
+                and last <= entry.hi
+                and now - entry.fetched_at < self.refresh_seconds
+            )
+            if not (final or fresh):
+                await self._refresh(entry, query, first, last, step, now, covered)
+            series = []
+            for metric, samples in entry.series.values():
+                values = [
+                    [i * step, samples[i]]
+                    for i in sorted(samples)
+                    if first <= i <= last
+                ]
+                if values:
+                    series.append({"metric": metric, "values": values})
+            return series
+
+    async def _refresh(self, entry, query, first, last, step, now, covered):
+        if covered and first <= entry.settled + 1:
+            # Only the part after the last final sample is missing
+            fetch_first = entry.settled + 1
+        else:
+            fetch_first = first
+            entry.series.clear()
+            entry.lo, entry.settled, entry.hi = first, first - 1, last
+        if fetch_first <= last:
+            result = await self._fetch(query, fetch_first, last, step)
+            self._merge(entry, result, fetch_first, last, step)
+        entry.hi = max(entry.hi, last)
+        settled = min(math.floor((now - self.settle_seconds) / step), last)
+        entry.settled = max(entry.settled, settled)
+        entry.fetched_at = now
+        self._trim(entry)
@@ -0,0 +1,265 @@
+"""Query language for /logs searches.
+
+A query is compiled once into a filter plan that evaluates every predicate in a
+single pass over a log line. Supported syntax::
+
+    timeout                   case-insensitive substring of the message
+    "connection refused"      quoted phrase
+    /err(or)?\\s+\\d+/i        regular expression (optional trailing i flag)
+    level:error               field match (level, pod, container, namespace, message)
+    pod:/robot-.*/            field regular expression
+    a AND b, a b              conjunction (AND is implicit between terms)
+    a OR b                    disjunction
+    NOT a, -a                 negation
+    ( ... )                   grouping
+
+Compiled plans are cached in an LRU so that repeated dashboard queries skip
+parsing and regex compilation.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+QUERY_CACHE_SIZE = int(os.getenv("LOG_API_QUERY_CACHE_SIZE", "256"))
+
+# Source tuples are (namespace, pod, container); see FIELDS for the mapping.
+Source = Tuple[str, str, str]
+Predicate = Callable[[str, str, str, Source], bool]
+
+FIELDS = ("level", "pod", "container", "namespace", "message")
+KEYWORDS = ("AND", "OR", "NOT")
+
+_SOURCE_INDEX = {"namespace": 0, "pod": 1, "container": 2}
+
+
+class QuerySyntaxError(ValueError):
+    """Raised when a query cannot be parsed."""
+
+
+class _Token:
+    __slots__ = ("kind", "value", "field", "flags")
+
+    def __init__(self, kind, value=None, field=None, flags=""):
+        self.kind = kind
+        self.value = value
+        self.field = field
+        self.flags = flags
+
+
+def _read_regex(text, pos):
+    """Read /pattern/flags starting at text[pos] == '/'.
+
+    Returns None unless the closing slash and flags end the token, so that
+    paths such as /robots or /api/v1/robots stay plain terms.
+    """
+    end = pos + 1
+    while end < len(text):
+        if text[end] == "\\":
+            end += 2
+            continue
+        if text[end] == "/":
+            break
+        end += 1
+    if end >= len(text):
+        return None
+    pattern = text[pos + 1 : end]
+    end += 1
+    flags_start = end
+    while end < len(text) and text[end] == "i":
+        end += 1
+    if end < len(text) and not text[end].isspace() and text[end] not in "()":
+        return None
+    return pattern, text[flags_start:end], end
+
+
+def _read_phrase(text, pos):
+    """Read "phrase" starting at text[pos] == '"', or None if it is unclosed."""
+    end = text.find('"', pos + 1)
+    if end == -1:
+        return None
+    return text[pos + 1 : end], end + 1
+
+
+def _read_literal(text, pos):
+    """Read everything up to whitespace or a parenthesis as one plain term."""
+    end = pos
+    while end < len(text) and not text[end].isspace() and text[end] not in "()":
+        end += 1
+    return text[pos:end], end
+
+
+def _read_word(text, pos):
+    end = pos
+    while end < len(text) and not text[end].isspace() and text[end] not in '()"':
+        end += 1
+    return text[pos:end], end
+
+
+def _read_value(text, pos, field):
+    """Read a term value, optionally scoped to a field."""
+    if pos < len(text) and text[pos] in '/"':
+        read = _read_regex if text[pos] == "/" else _read_phrase
+        parsed = read(text, pos)
+        if parsed is None:
+            # Not a complete /regex/ or "phrase": search for it literally
+            word, pos = _read_literal(text, pos)
+            return _Token("term", word, field), pos
+        if text[pos] == "/":
+            pattern, flags, end = parsed
+            return _Token("regex", pattern, field, flags), end
+        phrase, end = parsed
+        return _Token("term", phrase, field), end
+    word, pos = _read_word(text, pos)
+    if not word:
+        raise QuerySyntaxError(f"Missing value for field '{field}'")
+    return _Token("term", word, field), pos
+
+
+def tokenize(text: str) -> List[_Token]:
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        char = text[pos]
+        if char.isspace():
+            pos += 1
+        elif char in "()":
+            tokens.append(_Token(char))
+            pos += 1
+        elif char == "-" and pos + 1 < len(text) and not text[pos + 1].isspace():
+            tokens.append(_Token("NOT"))
+            pos += 1
+        elif char in '/"':
+            token, pos = _read_value(text, pos, None)
+            tokens.append(token)
+        else:
+            word, end = _read_word(text, pos)
+            if word in KEYWORDS:
+                tokens.append(_Token(word))
+                pos = end
+                continue
+            field, sep, _ = word.partition(":")
+            if sep and field.lower() in FIELDS:
+                token, pos = _read_value(text, pos + len(field) + 1, field.lower())
+                tokens.append(token)
+            else:
+                tokens.append(_Token("term", word))
+                pos = end
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser producing predicate closures."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.needs_lower = False
+
+    def peek(self) -> Optional[_Token]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> _Token:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self) -> Predicate:
+        if not self.tokens:
+            raise QuerySyntaxError("Empty query")
+        predicate = self.parse_or()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f"Unexpected '{self.peek().kind}'")
+        return predicate
+
+    def parse_or(self) -> Predicate:
+        operands = [self.parse_and()]
+        while self.peek() is not None and self.peek().kind == "OR":
+            self.take()
+            operands.append(self.parse_and())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda m, low, lvl, src: any(p(m, low, lvl, src) for p in operands)
+
+    def parse_and(self) -> Predicate:
+        operands = [self.parse_not()]
+        while self.peek() is not None and self.peek().kind not in ("OR", ")"):
+            if self.peek().kind == "AND":
+                self.take()
+            operands.append(self.parse_not())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda m, low, lvl, src: all(p(m, low, lvl, src) for p in operands)
+
+    def parse_not(self) -> Predicate:
+        token = self.peek()
+        if token is None:
+            raise QuerySyntaxError("Unexpected end of query")
+        if token.kind == "NOT":
+            self.take()
+            operand = self.parse_not()
+            return lambda m, low, lvl, src: not operand(m, low, lvl, src)
+        return self.parse_atom()
+
+    def parse_atom(self) -> Predicate:
+        token = self.take()
+        if token.kind == "(":
+            predicate = self.parse_or()
+            if self.peek() is None or self.peek().kind != ")":
+                raise QuerySyntaxError("Missing closing parenthesis")
+            self.take()
+            return predicate
+        if token.kind == "term":
+            return self.term_predicate(token)
+        if token.kind == "regex":
+            return self.regex_predicate(token)
+        raise QuerySyntaxError(f"Unexpected '{token.kind}'")
+
+    def term_predicate(self, token) -> Predicate:
+        value = token.value.lower()
+        field = token.field
+        if field is None or field == "message":
+            self.needs_lower = True
+            return lambda m, low, lvl, src: value in low
+        if field == "level":
+            return lambda m, low, lvl, src: lvl == value
+        index = _SOURCE_INDEX[field]
+        return lambda m, low, lvl, src: src[index].lower() == value
+
+    def regex_predicate(self, token) -> Predicate:
+        try:
+            flags = re.IGNORECASE if "i" in token.flags else 0
+            search = re.compile(token.value, flags).search
+        except re.error as e:
+            raise QuerySyntaxError(f"Invalid regular expression '{token.value}': {e}")
+        field = token.field
+        if field is None or field == "message":
+            return lambda m, low, lvl, src: search(m) is not None
+        if field == "level":
+            return lambda m, low, lvl, src: search(lvl) is not None
+        index = _SOURCE_INDEX[field]
+        return lambda m, low, lvl, src: search(src[index]) is not None
+
+
+class QueryPlan:
+    """A compiled query. Call it with (message, level, source) for each line."""
+
+    __slots__ = ("text", "predicate", "needs_lower")
+
+    def __init__(self, text: str, predicate: Predicate, needs_lower: bool):
+        self.text = text
+        self.predicate = predicate
+        self.needs_lower = needs_lower
+
+    def __call__(self, message: str, level: str, source: Source) -> bool:
+        lowered = message.lower() if self.needs_lower else message
+        return self.predicate(message, lowered, level, source)
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def compile_query(text: str) -> QueryPlan:
+    """Compile a query into a QueryPlan, reusing cached plans for repeated text."""
+    parser = _Parser(tokenize(text))
+    predicate = parser.parse()
+    return QueryPlan(text, predicate, parser.needs_lower)
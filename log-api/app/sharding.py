@@ -0,0 +1,199 @@
+"""Sharded log collection across log-api replicas.
+
+Each replica collects only the pods that a consistent-hash ring over the
+replica set assigns to it. Pods are keyed by namespace and name, with every
+replica placed on the ring ``vnodes`` times, so a membership change moves only
+the pods of the replicas that joined or left. Replicas are the members of a
+static peer list or the addresses behind a headless service, re-resolved
+periodically.
+
+/logs on any replica answers for the whole cluster by asking its peers for
+their newest matches and merging the newest-first pages with a lazy k-way
+merge that stops after ``offset + limit`` entries.
+"""
+
+import hashlib
+import heapq
+import json
+import socket
+import urllib.parse
+import urllib.request
+from bisect import bisect
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.store import parse_timestamp
+
+# Largest page a peer serves for one /logs request
+PEER_PAGE_SIZE = 1000
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+def source_key(source: Tuple[str, str, str]) -> str:
+    """Containers of one pod share a key, so a pod is read by one replica."""
+    namespace, pod, _ = source
+    return f"{namespace}/{pod}"
+
+
+class HashRing:
+    def __init__(self, members: Iterable[str], vnodes: int = 64):
+        self.members = sorted(set(members))
+        points = sorted(
+            (ring_hash(f"{member}#{i}"), member)
+            for member in self.members
+            for i in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        i = bisect(self._hashes, ring_hash(key)) % len(self._hashes)
+        return self._owners[i]
+
+
+def resolve_service(service: str, scheme: str = "http") -> List[str]:
+    """Base URLs of the addresses behind ``host:port`` (a headless service)."""
+    host, _, port = service.rpartition(":")
+    urls = set()
+    for _, _, _, _, address in socket.getaddrinfo(
+        host, int(port), type=socket.SOCK_STREAM
+    ):
+        ip = address[0]
+        if ":" in ip:
+            # IPv6
+            ip = f"[{ip}]"
+        urls.add(f"{scheme}://{ip}:{port}")
+    return sorted(urls)
+
+
+class Membership:
+    """This replica's view of the replica set and the ring built from it.
+
+    ``self_url`` must be the URL under which the other replicas list this one.
+    With neither ``peers`` nor ``service`` this replica owns every source.
+    """
+
+    def __init__(
+        self,
+        self_url: str,
+        peers: Sequence[str] = (),
+        service: Optional[str] = None,
+        vnodes: int = 64,
+    ):
+        self.self_url = self_url.rstrip("/")
+        self.static = [peer.rstrip("/") for peer in peers]
+        self.service = service
+        self.vnodes = vnodes
+        self._set_ring(self.static + [self.self_url])
+
+    def _set_ring(self, members: Iterable[str]) -> None:
+        ring = HashRing(members, self.vnodes)
+        self.hosts = {urllib.parse.urlsplit(member).hostname for member in ring.members}
+        self.ring = ring
+
+    @property
+    def members(self) -> List[str]:
+        return self.ring.members
+
+    def peers(self) -> List[str]:
+        return [member for member in self.ring.members if member != self.self_url]
+
+    def is_member_host(self, host: Optional[str]) -> bool:
+        """Whether ``host`` is the address of a replica, e.g. of a request's
+        client. Replicas are listed by address behind a headless service.
+        """
+        return host in self.hosts
+
+    def owns(self, source: Tuple[str, str, str]) -> bool:
+        return self.ring.owner(source_key(source)) == self.self_url
+
+    def refresh(self) -> bool:
+        """Re-resolve the service and rebuild the ring; True if it changed.
+
+        Blocks on DNS, so call it from a thread.
+        """
+        if not self.service:
+            return False
+        members = set(resolve_service(self.service))
+        # Until DNS lists this replica (e.g. before it is ready) it still
+        # collects its own share
+        members.add(self.self_url)
+        if sorted(members) == self.ring.members:
+            return False
+        self._set_ring(members)
+        return True
+
+
+def fetch_peer_logs(
+    peer: str, params: Dict[str, str], want: int, timeout: float
+) -> dict:
+    """The newest ``want`` matches from one peer's own shard, in /logs format.
+
+    Pages through the peer when ``want`` is above its page size.
+    """
+    logs: List[dict] = []
+    result: dict = {
+        "total": 0,
+        "total_exact": True,
+        "partial": False,
+        "skipped_sources": [],
+    }
+    while len(logs) < want:
+        limit = min(PEER_PAGE_SIZE, want - len(logs))
+        query = urllib.parse.urlencode(
+            {**params, "scope": "local", "offset": len(logs), "limit": limit}
+        )
+        with urllib.request.urlopen(f"{peer}/logs?{query}", timeout=timeout) as r:
+            page = json.loads(r.read())
+        if not logs:
+            result.update(
+                total=page["total"],
+                total_exact=page.get("total_exact", True),
+                partial=page.get("partial", False),
+                skipped_sources=page.get("skipped_sources", []),
+            )
+        logs.extend(page["logs"])
+        if len(page["logs"]) < limit:
+            break
+    result["logs"] = logs
+    return result
+
+
+def entry_key(entry: dict) -> Tuple:
+    k8s = entry.get("kubernetes") or {}
+    return (
+        k8s.get("namespace"),
+        k8s.get("pod_name"),
+        k8s.get("container_name"),
+        entry["message"],
+    )
+
+
+def merge_newest(pages: Iterable[List[dict]], offset: int, limit: int) -> List[dict]:
+    """Merge newest-first pages of /logs entries and return one page of them.
+
+    Only ``offset + limit`` entries are drawn from the merge. A line returned by
+    several replicas (read by both around a rebalance) is kept once.
+    """
+    timed = [((parse_timestamp(e["timestamp"]), e) for e in page) for page in pages]
+    merged = heapq.merge(*timed, key=lambda item: item[0], reverse=True)
+    out: List[dict] = []
+    position = 0
+    seen_at, seen = None, set()
+    for timestamp, entry in merged:
+        if timestamp != seen_at:
+            seen_at, seen = timestamp, set()
+        key = entry_key(entry)
+        if key in seen:
+            continue
+        seen.add(key)
+        if position >= offset:
+            out.append(entry)
+            if len(out) >= limit:
+                break
+        position += 1
+    return out
@@ -0,0 +1,341 @@
+"""Compressed on-disk tier for sealed log segments.
+
+Each sealed segment is written as one file of zlib-compressed blocks followed
+by a JSON footer holding a sparse index: byte range, row count, min/max
+timestamp and the sources present in every block. The footer also keeps each
+source's highest ingest sequence, so that de-duplication resumes after a
+restart. Files are read through mmap, and a range query only decompresses the
+blocks whose index entry overlaps the requested time range and sources.
+
+File layout::
+
+    [block 0][block 1]...[footer JSON][footer length: u64][magic]
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.store import LogSegment, source_table
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LGS1"
+_TRAILER = struct.Struct("<Q4s")
+_BLOCK_HEADER = struct.Struct("<II")  # rows, message bytes
+
+
+def encode_block(segment: LogSegment, start: int, end: int, local_ids) -> bytes:
+    count = end - start
+    base = segment.offsets[start]
+    offsets = array("Q", (segment.offsets[i] - base for i in range(start, end + 1)))
+    messages = bytes(segment.messages[base : segment.offsets[end]])
+    sources = array("I", (local_ids[sid] for sid in segment.sources[start:end]))
+    payload = b"".join(
+        (
+            _BLOCK_HEADER.pack(count, len(messages)),
+            segment.timestamps[start:end].tobytes(),
+            segment.levels[start:end].tobytes(),
+            sources.tobytes(),
+            offsets.tobytes(),
+            messages,
+        )
+    )
+    return zlib.compress(payload, 6)
+
+
+def decode_block(data: bytes, global_ids: List[int]) -> LogSegment:
+    payload = zlib.decompress(data)
+    count, message_bytes = _BLOCK_HEADER.unpack_from(payload)
+    pos = _BLOCK_HEADER.size
+    segment = LogSegment()
+    segment.timestamps.frombytes(payload[pos : pos + 8 * count])
+    pos += 8 * count
+    segment.levels.frombytes(payload[pos : pos + count])
+    pos += count
+    local = array("I")
+    local.frombytes(payload[pos : pos + 4 * count])
+    pos += 4 * count
+    segment.sources = array("I", (global_ids[i] for i in local))
+    segment.offsets = array("Q")
+    segment.offsets.frombytes(payload[pos : pos + 8 * (count + 1)])
+    pos += 8 * (count + 1)
+    segment.messages = bytearray(payload[pos : pos + message_bytes])
+    return segment
+
+
+class SpillFile:
+    """One immutable spill file and its sparse block index."""
+
+    def __init__(self, path: str, footer: dict):
+        self.path = path
+        self.blocks = footer["blocks"]
+        self.min_us = footer["min_us"]
+        self.max_us = footer["max_us"]
+        # File-local source index -> process-wide source id
+        self.global_ids = [source_table.intern(tuple(s)) for s in footer["sources"]]
+        self.source_sequences = footer["source_sequences"]
+        self.size = os.path.getsize(path)
+        self._map = None
+        # Readers using the file, and whether the budget has dropped it
+        self.pins = 0
+        self.retired = False
+
+    @classmethod
+    def write(cls, path: str, segment: LogSegment, block_entries: int):
+        """Write a time-sorted segment to ``path``."""
+        local_ids = {}
+        sources = []
+        source_max_us = []
+        for sid, timestamp in zip(segment.sources, segment.timestamps):
+            if sid not in local_ids:
+                local_ids[sid] = len(sources)
+                sources.append(list(source_table[sid]))
+                source_max_us.append(timestamp)
+            else:
+                # Rows are time-sorted, so the last one seen is the newest
+                source_max_us[local_ids[sid]] = timestamp
+        source_sequences = [
+            segment.sequences.get(sid, max_us)
+            for sid, max_us in zip(local_ids, source_max_us)
+        ]
+
+        blocks = []
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(segment), block_entries):
+                end = min(start + block_entries, len(segment))
+                data = encode_block(segment, start, end, local_ids)
+                blocks.append(
+                    {
+                        "offset": f.tell(),
+                        "length": len(data),
+                        "count": end - start,
+                        "min_us": segment.timestamps[start],
+                        "max_us": segment.timestamps[end - 1],
+                        "sources": sorted(
+                            {local_ids[sid] for sid in segment.sources[start:end]}
+                        ),
+                    }
+                )
+                f.write(data)
+            footer = {
+                "version": 2,
+                "min_us": segment.timestamps[0],
+                "max_us": segment.timestamps[-1],
+                "sources": sources,
+                "source_max_us": source_max_us,
+                "source_sequences": source_sequences,
+                "blocks": blocks,
+            }
+            footer_bytes = json.dumps(footer, separators=(",", ":")).encode()
+            f.write(footer_bytes)
+            f.write(_TRAILER.pack(len(footer_bytes), MAGIC))
+        os.replace(tmp_path, path)
+        return cls(path, footer)
+
+    @classmethod
+    def open(cls, path: str):
+        with open(path, "rb") as f:
+            f.seek(-_TRAILER.size, os.SEEK_END)
+            footer_length, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+            if magic != MAGIC:
+                raise ValueError(f"Not a log spill file: {path}")
+            f.seek(-(_TRAILER.size + footer_length), os.SEEK_END)
+            footer = json.loads(f.read(footer_length))
+        return cls(path, footer)
+
+    def _mapping(self):
+        if self._map is None:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def matching_blocks(self, search) -> List[dict]:
+        """Index entries of the blocks that overlap ``search``."""
+        if not search.overlaps(self.min_us, self.max_us):
+            return []
+        return [
+            block
+            for block in self.blocks
+            if search.overlaps(block["min_us"], block["max_us"])
+            and any(search.allows_source(self.global_ids[i]) for i in block["sources"])
+        ]
+
+    def read_block(self, block: dict) -> LogSegment:
+        start = block["offset"]
+        data = self._mapping()[start : start + block["length"]]
+        return decode_block(data, self.global_ids)
+
+    def blocks_for(self, search) -> Iterator[LogSegment]:
+        """Decompress and yield only the blocks that overlap ``search``."""
+        for block in self.matching_blocks(search):
+            yield self.read_block(block)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class SpillTier:
+    """Directory of spill files, oldest deleted first beyond ``max_bytes``.
+
+    Searches and streams pin the files they read, so a file dropped while a
+    reader is still on it is only closed and deleted when that reader is done.
+    """
+
+    def __init__(self, directory: str, block_entries: int = 1024, max_bytes: int = 0):
+        self.directory = directory
+        self.block_entries = block_entries
+        self.max_bytes = max_bytes
+        self.files: List[SpillFile] = []
+        self._sequence = 0
+        # Reentrant: an abandoned reader may be finalized while this thread
+        # holds the lock
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+                continue
+            if not name.endswith(".lgs"):
+                continue
+            try:
+                self.files.append(SpillFile.open(path))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable spill file {path}: {e}")
+        self.files.sort(key=lambda f: f.min_us)
+        # Names are <first timestamp>-<sequence>.lgs; continue the sequence
+        self._sequence = max(
+            (int(os.path.basename(f.path)[21:29]) for f in self.files), default=0
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(f.size for f in self.files)
+
+    def write(self, segment: LogSegment) -> None:
+        spill_file = self.prepare(segment)
+        if spill_file is not None:
+            self.add(spill_file)
+
+    def prepare(self, segment: LogSegment) -> Optional[SpillFile]:
+        """Compress and write ``segment`` to a new file, not yet searched."""
+        if not len(segment):
+            return None
+        with self._lock:
+            self._sequence += 1
+            name = f"{segment.timestamps[0]:020d}-{self._sequence:08d}.lgs"
+        return SpillFile.write(
+            os.path.join(self.directory, name), segment, self.block_entries
+        )
+
+    def add(self, spill_file: SpillFile) -> None:
+        """Make a prepared file searchable, then enforce the size budget."""
+        with self._lock:
+            self.files.append(spill_file)
+            self.files.sort(key=lambda f: f.min_us)
+            self._enforce_budget()
+
+    def _enforce_budget(self) -> None:
+        if not self.max_bytes:
+            return
+        total = self.nbytes
+        while self.files and total > self.max_bytes:
+            oldest = self.files.pop(0)
+            total -= oldest.size
+            self._retire(oldest)
+
+    def _retire(self, spill_file: SpillFile) -> None:
+        # Callers hold self._lock
+        spill_file.retired = True
+        if not spill_file.pins:
+            spill_file.close()
+            os.remove(spill_file.path)
+
+    def _pin(self, files: List[SpillFile]) -> List[SpillFile]:
+        """Pin the files not yet dropped by the budget and return them."""
+        with self._lock:
+            pinned = [spill_file for spill_file in files if not spill_file.retired]
+            for spill_file in pinned:
+                spill_file.pins += 1
+        return pinned
+
+    def _unpin(self, files: List[SpillFile]) -> None:
+        with self._lock:
+            for spill_file in files:
+                spill_file.pins -= 1
+                if spill_file.retired:
+                    self._retire(spill_file)
+
+    def _read(self, spill_file: SpillFile, search) -> Iterator[LogSegment]:
+        pinned = self._pin([spill_file])
+        if not pinned:
+            return
+        try:
+            yield from spill_file.blocks_for(search)
+        finally:
+            self._unpin(pinned)
+
+    def high_water(self) -> Dict[int, int]:
+        """Highest stored ingest sequence per source id, across all files."""
+        marks: Dict[int, int] = {}
+        for spill_file in self.files:
+            for sid, sequence in zip(
+                spill_file.global_ids, spill_file.source_sequences
+            ):
+                marks[sid] = max(sequence, marks.get(sid, sequence))
+        return marks
+
+    def blocks(
+        self, search, files: Optional[List[SpillFile]] = None
+    ) -> Iterator[LogSegment]:
+        """Blocks of ``files`` (every file by default) that may match."""
+        for spill_file in list(self.files) if files is None else files:
+            yield from self._read(spill_file, search)
+
+    def runs(
+        self, search, files: Optional[List[SpillFile]] = None
+    ) -> List[Iterator[LogSegment]]:
+        """One lazy block iterator per file; each yields blocks in time order."""
+        files = list(self.files) if files is None else files
+        return [self._read(spill_file, search) for spill_file in files]
+
+    def newest_blocks(
+        self, search, files: Optional[List[SpillFile]] = None
+    ) -> Iterator[Tuple[int, Callable[[], LogSegment]]]:
+        """``(max_us, read)`` for each block that may match, newest block first.
+
+        Only the index is consulted until a block is read. The files stay
+        pinned until the iterator is exhausted or closed.
+        """
+        pinned = self._pin(list(self.files) if files is None else files)
+        try:
+            index = [
+                (block["max_us"], spill_file, block)
+                for spill_file in pinned
+                for block in spill_file.matching_blocks(search)
+            ]
+            index.sort(key=lambda entry: entry[0], reverse=True)
+            for max_us, spill_file, block in index:
+                yield max_us, partial(spill_file.read_block, block)
+        finally:
+            self._unpin(pinned)
+
+    def clear(self) -> None:
+        with self._lock:
+            for spill_file in self.files:
+                self._retire(spill_file)
+            self.files = []
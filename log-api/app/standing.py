@@ -0,0 +1,318 @@
+"""Standing queries: saved searches evaluated against every ingested line.
+
+A standing query is compiled once when it is registered. The index is an
+ingest listener on the log store: each new line is checked against the
+registered predicates, and every query it matches updates its running count
+and its buffer of recent matches, and notifies its subscribers.
+
+Queries with the same shape (level, namespace, pod, container and query text)
+share one predicate, which is evaluated once per line however many queries use
+it. Predicates are bucketed by level, so a line is only checked against the
+predicates for its own level and those with no level. Query plans with the
+same text are evaluated once per line across predicates, and source checks are
+cached per source id. The cost of a line therefore grows with the number of
+distinct predicates, not with the number of registered queries.
+"""
+
+import asyncio
+import json
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from app.query import compile_query
+from app.store import SearchFilter, format_timestamp, level_table, source_table
+
+# (timestamp_us, level_id, source_id, message)
+Match = Tuple[int, int, int, str]
+
+
+def match_entry(match: Match) -> dict:
+    """A match in the /logs response format."""
+    timestamp, level_id, source_id, message = match
+    namespace, pod_name, container_name = source_table[source_id]
+    return {
+        "timestamp": format_timestamp(timestamp),
+        "level": level_table[level_id],
+        "message": message,
+        "kubernetes": {
+            "pod_name": pod_name,
+            "container_name": container_name,
+            "namespace": namespace,
+        },
+    }
+
+
+class StandingQuery:
+    def __init__(
+        self,
+        query_id: str,
+        name: Optional[str],
+        query: Optional[str],
+        level: Optional[str],
+        scope: Tuple[Optional[str], Optional[str], Optional[str]],
+        webhook_url: Optional[str] = None,
+        recent_size: int = 20,
+        pending_size: int = 1000,
+    ):
+        self.id = query_id
+        self.name = name
+        self.query = query
+        self.level = level
+        self.namespace, self.pod, self.container = scope
+        self.webhook_url = webhook_url
+        self.matches = 0
+        self.last_match_us: Optional[int] = None
+        self.recent: "deque[Match]" = deque(maxlen=recent_size)
+        # Matches not yet posted to the webhook; the oldest are dropped first
+        self.pending: "deque[Match]" = deque(maxlen=pending_size)
+        self.dropped = 0
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def shape(self) -> Tuple:
+        return (self.level, self.namespace, self.pod, self.container, self.query)
+
+    def record(self, match: Match) -> None:
+        self.matches += 1
+        self.last_match_us = match[0]
+        self.recent.append(match)
+        if self.webhook_url:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(match)
+        for subscriber in self.subscribers:
+            try:
+                subscriber.put_nowait(match)
+            except asyncio.QueueFull:
+                # A slow client misses matches rather than holding up ingest
+                pass
+
+    def take_pending(self) -> Tuple[List[Match], int]:
+        """The matches awaiting webhook delivery and the number dropped."""
+        pending, dropped = list(self.pending), self.dropped
+        self.pending.clear()
+        self.dropped = 0
+        return pending, dropped
+
+    def close(self) -> None:
+        """End every subscriber's event stream."""
+        for subscriber in self.subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(None)
+                    break
+                except asyncio.QueueFull:
+                    subscriber.get_nowait()
+        self.subscribers.clear()
+
+    def describe(self, recent: bool = False) -> dict:
+        info = {
+            "id": self.id,
+            "name": self.name,
+            "query": self.query,
+            "level": self.level,
+            "namespace": self.namespace,
+            "pod": self.pod,
+            "container": self.container,
+            "webhook_url": self.webhook_url,
+            "matches": self.matches,
+            "last_match": (
+                format_timestamp(self.last_match_us)
+                if self.last_match_us is not None
+                else None
+            ),
+            "subscribers": len(self.subscribers),
+        }
+        if recent:
+            info["recent"] = [match_entry(m) for m in reversed(self.recent)]
+        return info
+
+
+class Predicate:
+    """A distinct query shape and the standing queries that share it."""
+
+    __slots__ = ("search", "queries")
+
+    def __init__(self, search: SearchFilter):
+        self.search = search
+        self.queries: List[StandingQuery] = []
+
+
+def scope_filter(scope: Tuple[Optional[str], Optional[str], Optional[str]]):
+    def source_ok(source):
+        return all(not want or have == want for want, have in zip(scope, source))
+
+    return source_ok
+
+
+class StandingQueryIndex:
+    """Registered standing queries, callable as a LogStore ingest listener."""
+
+    def __init__(
+        self, max_queries: int = 100, recent_size: int = 20, pending_size: int = 1000
+    ):
+        self.max_queries = max_queries
+        self.recent_size = recent_size
+        self.pending_size = pending_size
+        self.queries: Dict[str, StandingQuery] = {}
+        # level (None for any) -> shape -> predicate
+        self._by_level: Dict[Optional[str], Dict[Tuple, Predicate]] = {}
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def __iter__(self) -> Iterator[StandingQuery]:
+        return iter(list(self.queries.values()))
+
+    def predicates(self) -> int:
+        return sum(len(shapes) for shapes in self._by_level.values())
+
+    def get(self, query_id: str) -> Optional[StandingQuery]:
+        return self.queries.get(query_id)
+
+    def add(
+        self,
+        name: Optional[str] = None,
+        query: Optional[str] = None,
+        level: Optional[str] = None,
+        namespace: Optional[str] = None,
+        pod: Optional[str] = None,
+        container: Optional[str] = None,
+        webhook_url: Optional[str] = None,
+    ) -> StandingQuery:
+        """Register a standing query.
+
+        Raises QuerySyntaxError for an invalid query and ValueError when the
+        query has no filter at all or the index is full.
+        """
+        if not (query or level or namespace or pod or container):
+            raise ValueError("A standing query needs a query, level or source filter")
+        if len(self.queries) >= self.max_queries:
+            raise ValueError(f"At most {self.max_queries} standing queries allowed")
+        plan = compile_query(query) if query else None
+        standing = StandingQuery(
+            uuid.uuid4().hex,
+            name,
+            query or None,
+            # Parsed log levels are lower-case
+            level.lower() if level else None,
+            (namespace or None, pod or None, container or None),
+            webhook_url=webhook_url,
+            recent_size=self.recent_size,
+            pending_size=self.pending_size,
+        )
+        shapes = self._by_level.setdefault(standing.level, {})
+        predicate = shapes.get(standing.shape)
+        if predicate is None:
+            scope = (standing.namespace, standing.pod, standing.container)
+            predicate = shapes[standing.shape] = Predicate(
+                SearchFilter(source_ok=scope_filter(scope), plan=plan)
+            )
+        predicate.queries.append(standing)
+        self.queries[standing.id] = standing
+        return standing
+
+    def remove(self, query_id: str) -> bool:
+        standing = self.queries.pop(query_id, None)
+        if standing is None:
+            return False
+        shapes = self._by_level[standing.level]
+        predicate = shapes[standing.shape]
+        predicate.queries.remove(standing)
+        if not predicate.queries:
+            del shapes[standing.shape]
+            if not shapes:
+                del self._by_level[standing.level]
+        standing.close()
+        return True
+
+    def clear(self) -> None:
+        for query_id in list(self.queries):
+            self.remove(query_id)
+
+    def __call__(
+        self, timestamp_us: int, level_id: int, source_id: int, message: str
+    ) -> None:
+        if not self._by_level:
+            return
+        level = level_table[level_id]
+        predicates = chain(
+            self._by_level.get(level, {}).values(),
+            self._by_level.get(None, {}).values(),
+        )
+        # Plans with the same text, evaluated once for this line
+        verdicts: Dict[str, bool] = {}
+        match = None
+        for predicate in predicates:
+            search = predicate.search
+            if not search.allows_source(source_id):
+                continue
+            plan = search.plan
+            if plan is not None:
+                verdict = verdicts.get(plan.text)
+                if verdict is None:
+                    verdict = verdicts[plan.text] = plan(
+                        message, level, source_table[source_id]
+                    )
+                if not verdict:
+                    continue
+            if match is None:
+                match = (timestamp_us, level_id, source_id, message)
+            for standing in predicate.queries:
+                standing.record(match)
+
+
+async def events(
+    standing: StandingQuery, queue_size: int = 100, keepalive: float = 15.0
+):
+    """Server-sent events for the matches of ``standing`` from now on.
+
+    Each match is a ``match`` event carrying the entry as JSON. A comment line
+    is sent after ``keepalive`` idle seconds so proxies keep the stream open.
+    The stream ends when the query is removed.
+    """
+    subscriber: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    standing.subscribers.add(subscriber)
+    try:
+        # Sent at once so the response headers go out before the first match
+        yield ": subscribed\n\n"
+        while True:
+            try:
+                match = await asyncio.wait_for(subscriber.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if match is None:
+                return
+            yield f"event: match\ndata: {json.dumps(match_entry(match))}\n\n"
+    finally:
+        standing.subscribers.discard(subscriber)
+
+
+class RefuseRedirects(urllib.request.HTTPRedirectHandler):
+    """Fail on redirects, so a webhook cannot send its POST to another host
+    than the allowed one it names.
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        raise urllib.error.HTTPError(
+            req.full_url, code, f"Webhook redirected to {newurl}", headers, fp
+        )
+
+
+webhook_opener = urllib.request.build_opener(RefuseRedirects)
+
+
+def post_webhook(url: str, payload: dict, timeout: float) -> None:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with webhook_opener.open(request, timeout=timeout) as response:
+        response.read()
@@ -0,0 +1,509 @@
+"""Compact storage for buffered log entries.
+
+Entries are held column-wise: integer microsecond timestamps, small-int level
+codes, interned source ids and UTF-8 messages packed into one contiguous
+buffer. Dicts are only materialized for the entries that are actually returned.
+"""
+
+import heapq
+import logging
+import threading
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from typing import (Callable, Dict, Hashable, Iterable, Iterator, List,
+                    Optional, Sequence, Tuple)
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("debug", "info", "warning", "error")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class Interner:
+    """Map hashable values to small consecutive integer ids."""
+
+    __slots__ = ("values", "ids")
+
+    def __init__(self, values: Iterable[Hashable] = ()):
+        self.values: List[Hashable] = []
+        self.ids: Dict[Hashable, int] = {}
+        for value in values:
+            self.intern(value)
+
+    def intern(self, value: Hashable) -> int:
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.values.append(value)
+            self.ids[value] = value_id
+        return value_id
+
+    def __getitem__(self, value_id: int):
+        return self.values[value_id]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+# Shared by every segment so ids stay comparable across segments.
+level_table = Interner(LEVELS)
+source_table = Interner()
+
+
+def parse_timestamp(value: str, default: Optional[int] = None) -> int:
+    """Convert an ISO-8601 or 'YYYY-MM-DD HH:MM:SS' string to epoch microseconds.
+
+    Naive timestamps are taken as UTC. Unparseable values return ``default``,
+    or the current time when no default is given.
+    """
+    try:
+        text = value.strip()
+        if text.endswith("Z") or text.endswith("z"):
+            text = text[:-1] + "+00:00"
+        # fromisoformat() on Python < 3.11 only accepts 3 or 6 fractional digits
+        head, dot, tail = text.partition(".")
+        if dot:
+            digits = len(tail) - len(tail.lstrip("0123456789"))
+            fraction = (tail[:digits] + "000000")[:6]
+            text = f"{head}.{fraction}{tail[digits:]}"
+        parsed = datetime.fromisoformat(text)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        delta = parsed - _EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    except (ValueError, AttributeError):
+        if default is not None:
+            return default
+        return now_us()
+
+
+def now_us() -> int:
+    delta = datetime.now(timezone.utc) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def format_timestamp(timestamp_us: int) -> str:
+    seconds, micros = divmod(timestamp_us, 1_000_000)
+    moment = datetime.fromtimestamp(seconds, timezone.utc).replace(microsecond=micros)
+    return moment.isoformat()
+
+
+class LogSegment:
+    """An append-only, column-oriented block of log entries."""
+
+    __slots__ = (
+        "timestamps",
+        "levels",
+        "sources",
+        "offsets",
+        "messages",
+        "sequences",
+    )
+
+    def __init__(self):
+        self.timestamps = array("q")
+        self.levels = array("B")
+        self.sources = array("I")
+        # offsets[i]:offsets[i + 1] is the UTF-8 message of entry i
+        self.offsets = array("Q", [0])
+        self.messages = bytearray()
+        # Highest ingest sequence per source id among the rows, when known
+        self.sequences: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(
+        self, timestamp_us: int, level_id: int, source_id: int, message: str
+    ) -> None:
+        self.timestamps.append(timestamp_us)
+        self.levels.append(level_id)
+        self.sources.append(source_id)
+        self.messages += message.encode("utf-8", "replace")
+        self.offsets.append(len(self.messages))
+
+    def add(
+        self,
+        timestamp: str,
+        level: str,
+        source: Tuple[str, str, str],
+        message: str,
+    ) -> None:
+        """Append an entry given in its parsed (string) form."""
+        self.append(
+            parse_timestamp(timestamp),
+            level_table.intern(level),
+            source_table.intern(source),
+            message,
+        )
+
+    def message(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.messages[start:end].decode("utf-8")
+
+    def entry(self, index: int) -> dict:
+        """Materialize entry ``index`` in the /logs response format."""
+        namespace, pod_name, container_name = source_table[self.sources[index]]
+        return {
+            "timestamp": format_timestamp(self.timestamps[index]),
+            "level": level_table[self.levels[index]],
+            "message": self.message(index),
+            "kubernetes": {
+                "pod_name": pod_name,
+                "container_name": container_name,
+                "namespace": namespace,
+            },
+        }
+
+    def newest(self, count: int) -> List[int]:
+        """Indices of the ``count`` newest entries, newest first."""
+        if count >= len(self):
+            return sorted(
+                range(len(self)), key=self.timestamps.__getitem__, reverse=True
+            )
+        return heapq.nlargest(count, range(len(self)), key=self.timestamps.__getitem__)
+
+    def page(self, offset: int, limit: int) -> List[dict]:
+        """Materialize one page of entries ordered newest first."""
+        return [self.entry(i) for i in self.newest(offset + limit)[offset:]]
+
+    def take(self, indices: Sequence[int]) -> "LogSegment":
+        """Return a new segment holding the given rows, in the given order."""
+        segment = LogSegment()
+        for i in indices:
+            start, end = self.offsets[i], self.offsets[i + 1]
+            segment.timestamps.append(self.timestamps[i])
+            segment.levels.append(self.levels[i])
+            segment.sources.append(self.sources[i])
+            segment.messages += self.messages[start:end]
+            segment.offsets.append(len(segment.messages))
+        return segment
+
+    def sorted_by_time(self) -> "LogSegment":
+        return self.take(sorted(range(len(self)), key=self.timestamps.__getitem__))
+
+    def time_range(self) -> Tuple[int, int]:
+        return min(self.timestamps), max(self.timestamps)
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by the column buffers."""
+        return sum(
+            column.itemsize * len(column)
+            for column in (self.timestamps, self.levels, self.sources, self.offsets)
+        ) + len(self.messages)
+
+
+class SearchFilter:
+    """Row filter for LogStore searches.
+
+    Cheap integer columns (time, level, source) are checked before the message
+    is decoded for the query plan.
+    """
+
+    __slots__ = ("from_us", "to_us", "level_id", "source_ok", "plan", "_allowed")
+
+    def __init__(
+        self,
+        from_us: Optional[int] = None,
+        to_us: Optional[int] = None,
+        level: Optional[str] = None,
+        source_ok: Optional[Callable[[Tuple[str, str, str]], bool]] = None,
+        plan=None,
+    ):
+        self.from_us = from_us
+        self.to_us = to_us
+        self.level_id = level_table.ids.get(level, -1) if level else None
+        self.source_ok = source_ok
+        self.plan = plan
+        self._allowed: List[bool] = []
+
+    def overlaps(self, min_us: int, max_us: int) -> bool:
+        if self.from_us is not None and max_us < self.from_us:
+            return False
+        if self.to_us is not None and min_us > self.to_us:
+            return False
+        return True
+
+    def allows_source(self, source_id: int) -> bool:
+        allowed = self._allowed
+        # The source table only grows, so extend the cached verdicts lazily
+        while len(allowed) <= source_id:
+            source = source_table[len(allowed)]
+            allowed.append(self.source_ok is None or self.source_ok(source))
+        return allowed[source_id]
+
+    def scan(self, segment: LogSegment, out: LogSegment) -> None:
+        """Append the rows of ``segment`` that match to ``out``."""
+        from_us, to_us, level_id, plan = (
+            self.from_us,
+            self.to_us,
+            self.level_id,
+            self.plan,
+        )
+        timestamps, levels, sources = (
+            segment.timestamps,
+            segment.levels,
+            segment.sources,
+        )
+        for i in range(len(segment)):
+            timestamp = timestamps[i]
+            if from_us is not None and timestamp < from_us:
+                continue
+            if to_us is not None and timestamp > to_us:
+                continue
+            if level_id is not None and levels[i] != level_id:
+                continue
+            source_id = sources[i]
+            if not self.allows_source(source_id):
+                continue
+            message = segment.message(i)
+            if plan is not None and not plan(
+                message, level_table[levels[i]], source_table[source_id]
+            ):
+                continue
+            out.append(timestamp, levels[i], source_id, message)
+
+
+def matching_rows(segments: Iterable[LogSegment], search: SearchFilter):
+    """Matching rows of time-ordered ``segments`` as LogStore.stream rows."""
+    for segment in segments:
+        matches = LogSegment()
+        search.scan(segment, matches)
+        rows = [
+            (
+                matches.timestamps[i],
+                source_table[matches.sources[i]],
+                matches.levels[i],
+                matches.message(i),
+                matches.sources[i],
+            )
+            for i in range(len(matches))
+        ]
+        rows.sort()
+        yield from rows
+
+
+class LogStore:
+    """Retained log history.
+
+    New lines go to an active in-memory segment. Full segments are sealed
+    (sorted by time) and kept in memory up to ``memory_segments``; beyond that
+    the oldest sealed segment is dropped, or, with a spill tier, written to it
+    by ``spill_overflow``. Writing compresses the segment, so callers on the
+    event loop run ``spill_overflow`` in a thread after ingesting.
+
+    Lines are de-duplicated per source on a monotonically increasing sequence
+    (the kubelet timestamp), so repeated tail reads only add new lines. Each
+    added line is also passed to the ingest listeners, as
+    ``listener(timestamp_us, level_id, source_id, message)``.
+    """
+
+    def __init__(
+        self,
+        segment_entries: int = 8192,
+        memory_segments: int = 16,
+        spill=None,
+    ):
+        self.segment_entries = segment_entries
+        self.memory_segments = memory_segments
+        self.spill = spill
+        self.active = LogSegment()
+        # (segment, min timestamp, max timestamp), oldest first
+        self.sealed: deque = deque()
+        self.high_water: Dict[int, int] = {}
+        self.listeners: List[Callable[[int, int, int, str], None]] = []
+        # Moves a segment from memory to a spill file in one step for searches
+        self._lock = threading.Lock()
+        # One spill writer at a time
+        self._spill_lock = threading.Lock()
+        if spill is not None:
+            # Resume after a restart without re-adding lines already on disk
+            self.high_water.update(spill.high_water())
+
+    def __len__(self) -> int:
+        return len(self.active) + sum(len(s) for s, _, _ in self.sealed)
+
+    def clear(self) -> None:
+        self.active = LogSegment()
+        with self._lock:
+            self.sealed.clear()
+            if self.spill is not None:
+                self.spill.clear()
+        self.high_water.clear()
+
+    def high_water_mark(self, source: Tuple[str, str, str]) -> Optional[int]:
+        source_id = source_table.ids.get(source)
+        return None if source_id is None else self.high_water.get(source_id)
+
+    def ingest(
+        self,
+        source: Tuple[str, str, str],
+        rows: Iterable[Tuple[int, int, str, str]],
+    ) -> int:
+        """Append ``(sequence_us, timestamp_us, level, message)`` rows for one
+        source, skipping rows at or below the source's high-water mark as it
+        was before this call. Rows of one call may share a sequence (kubelet
+        timestamps are cut to microseconds), so they are all kept.
+        Returns the number of rows added.
+        """
+        source_id = source_table.intern(source)
+        stored = high_water = self.high_water.get(source_id)
+        added = 0
+        for sequence, timestamp, level, message in rows:
+            if stored is not None and sequence <= stored:
+                continue
+            if high_water is None or sequence > high_water:
+                high_water = sequence
+            level_id = level_table.intern(level)
+            self.active.append(timestamp, level_id, source_id, message)
+            self.active.sequences[source_id] = high_water
+            for listener in self.listeners:
+                try:
+                    listener(timestamp, level_id, source_id, message)
+                except Exception:
+                    # A failing listener must not lose the line or the
+                    # high-water mark, nor starve the other listeners
+                    logger.exception(f"Ingest listener {listener!r} failed")
+            added += 1
+            if len(self.active) >= self.segment_entries:
+                self.seal()
+        if high_water is not None:
+            self.high_water[source_id] = high_water
+        return added
+
+    def seal(self) -> None:
+        if not len(self.active):
+            return
+        segment = self.active.sorted_by_time()
+        segment.sequences = self.active.sequences
+        self.active = LogSegment()
+        self.sealed.append((segment, segment.timestamps[0], segment.timestamps[-1]))
+        if self.spill is None:
+            while len(self.sealed) > self.memory_segments:
+                self.sealed.popleft()
+
+    def spill_overflow(self) -> None:
+        """Write the sealed segments beyond ``memory_segments`` to the spill
+        tier. A segment stays searchable in memory until its file replaces it.
+        """
+        if self.spill is None:
+            return
+        with self._spill_lock:
+            while len(self.sealed) > self.memory_segments:
+                self._spill_oldest()
+
+    def _spill_oldest(self) -> None:
+        spill_file = self.spill.prepare(self.sealed[0][0])
+        with self._lock:
+            if spill_file is not None:
+                self.spill.add(spill_file)
+            self.sealed.popleft()
+
+    def flush(self) -> None:
+        """Seal the active segment and move every sealed segment to the spill
+        tier, so that history survives a restart. No-op without a spill tier.
+        """
+        if self.spill is None:
+            return
+        self.seal()
+        with self._spill_lock:
+            while self.sealed:
+                self._spill_oldest()
+
+    def _snapshot(self) -> Tuple[list, list]:
+        """The spill files and sealed segments, with no segment in both."""
+        # Copied: ingest and spilling change them while a search runs in a thread
+        with self._lock:
+            files = list(self.spill.files) if self.spill is not None else []
+            return files, list(self.sealed)
+
+    def segments(self, search: SearchFilter) -> Iterator[LogSegment]:
+        """Yield every segment or disk block that may hold matching rows."""
+        files, sealed = self._snapshot()
+        if self.spill is not None:
+            yield from self.spill.blocks(search, files)
+        for segment, min_us, max_us in sealed:
+            if search.overlaps(min_us, max_us):
+                yield segment
+        if len(self.active):
+            yield self.active
+
+    def search(self, search: SearchFilter) -> LogSegment:
+        result = LogSegment()
+        for segment in self.segments(search):
+            search.scan(segment, result)
+        return result
+
+    def search_newest(
+        self, search: SearchFilter, count: int
+    ) -> Tuple[LogSegment, bool]:
+        """Matching rows that include the ``count`` newest matches.
+
+        Segments and spill blocks are scanned newest first (by their latest
+        timestamp), and the scan stops once none of the rest can hold one of
+        the ``count`` newest matches. Returns the rows found and whether every
+        segment was scanned, i.e. whether their number is the exact total.
+        """
+        files, sealed = self._snapshot()
+        memory = [
+            (max_us, segment)
+            for segment, min_us, max_us in sealed
+            if search.overlaps(min_us, max_us)
+        ]
+        active = self.active
+        if len(active):
+            min_us, max_us = active.time_range()
+            if search.overlaps(min_us, max_us):
+                memory.append((max_us, active))
+        memory.sort(key=lambda unit: unit[0], reverse=True)
+        disk = None
+        if self.spill is not None:
+            disk = self.spill.newest_blocks(search, files)
+        result = LogSegment()
+        # The ``count`` newest timestamps found so far, oldest on top
+        newest: List[int] = []
+        try:
+            units = heapq.merge(
+                ((max_us, lambda s=segment: s) for max_us, segment in memory),
+                disk or (),
+                key=lambda unit: unit[0],
+                reverse=True,
+            )
+            for max_us, read in units:
+                if len(newest) >= count and max_us < newest[0]:
+                    return result, False
+                found = len(result)
+                search.scan(read(), result)
+                for timestamp in result.timestamps[found:]:
+                    if len(newest) < count:
+                        heapq.heappush(newest, timestamp)
+                    elif timestamp > newest[0]:
+                        heapq.heapreplace(newest, timestamp)
+        finally:
+            if disk is not None:
+                # Unpins the spill files
+                disk.close()
+        return result, True
+
+    def stream(self, search: SearchFilter) -> Iterator[Tuple]:
+        """Yield every matching row in time order, one block at a time.
+
+        Rows are ``(timestamp_us, source, level_id, message, source_id)``
+        tuples; rows with the same timestamp are ordered by the remaining
+        fields, so the order is the same on every call. Spill files, sealed
+        segments and the active segment are merged lazily, so memory use
+        depends on the number of segments, not on the number of matches.
+        """
+        runs: List[Iterable[LogSegment]] = []
+        files, sealed = self._snapshot()
+        if self.spill is not None:
+            runs.extend(self.spill.runs(search, files))
+        for segment, min_us, max_us in sealed:
+            if search.overlaps(min_us, max_us):
+                runs.append([segment])
+        if len(self.active):
+            # Copied so that lines ingested meanwhile do not shift the rows
+            runs.append([self.active.take(range(len(self.active)))])
+        return heapq.merge(*(matching_rows(run, search) for run in runs))
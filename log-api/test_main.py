@@ -0,0 +1,1105 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from app import main
+from app.kube import KubeClient
+from app.main import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def make_pod(name, namespace, containers):
+    return SimpleNamespace(
+        metadata=SimpleNamespace(name=name, namespace=namespace),
+        spec=SimpleNamespace(containers=[SimpleNamespace(name=c) for c in containers]),
+    )
+
+
+class FakeCoreV1Api:
+    """Minimal stand-in for kubernetes.client.CoreV1Api."""
+
+    def __init__(self, pods, logs):
+        self.pods = pods
+        self.logs = logs
+        self.calls = []
+
+    def _select(self, pods, label_selector):
+        if not label_selector:
+            return pods
+        return [p for p in pods if p.metadata.name.startswith(label_selector)]
+
+    def list_pod_for_all_namespaces(self, watch=False, label_selector=None):
+        self.calls.append(("all", None, label_selector))
+        return SimpleNamespace(items=self._select(self.pods, label_selector))
+
+    def list_namespaced_pod(self, namespace, watch=False, label_selector=None):
+        self.calls.append(("namespaced", namespace, label_selector))
+        pods = [p for p in self.pods if p.metadata.namespace == namespace]
+        return SimpleNamespace(items=self._select(pods, label_selector))
+
+    def read_namespaced_pod_log(self, name, namespace, container, **kwargs):
+        self.calls.append(("log", namespace, name))
+        logs = self.logs[(namespace, name, container)]
+        if isinstance(logs, Exception):
+            raise logs
+        if callable(logs):
+            logs = logs()
+        if logs and kwargs.get("timestamps"):
+            # Emulate the kubelet's RFC 3339 prefix, one second per line
+            logs = "".join(
+                f"2024-01-01T09:00:{i:02d}.000000000Z {line}\n"
+                for i, line in enumerate(logs.splitlines())
+            )
+        return logs
+
+
+def no_cluster():
+    raise RuntimeError("no Kubernetes configuration")
+
+
+@pytest.fixture
+def fake_k8s(monkeypatch):
+    fake = FakeCoreV1Api(
+        pods=[
+            make_pod("robot-service-1", "default", ["robot-service"]),
+            make_pod("coredns-1", "kube-system", ["coredns"]),
+        ],
+        logs={
+            ("default", "robot-service-1", "robot-service"): (
+                "2024-01-01T10:00:00Z [INFO] Added robot: r1\n"
+                "2024-01-01T10:00:01Z [ERROR] Robot r1 failed\n"
+            ),
+            ("kube-system", "coredns-1", "coredns"): (
+                "2024-01-01T10:00:02Z [INFO] dns ready\n"
+            ),
+        },
+    )
+    monkeypatch.setattr(main, "kube_client", KubeClient(factory=lambda: fake))
+    main.fetch_breaker.reset()
+    yield fake
+    main.fetch_breaker.reset()
+
+
+@pytest.fixture(autouse=True)
+def clear_log_store():
+    main.log_store.clear()
+    yield
+    main.log_store.clear()
+    main.standing_queries.clear()
+
+
+def test_health():
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json() == {"status": "healthy"}
+
+
+def test_parse_log_line_iso():
+    entry = main.parse_log_line("2024-01-01T10:00:00Z [ERROR] boom")
+    assert entry == {
+        "timestamp": "2024-01-01T10:00:00Z",
+        "level": "error",
+        "message": "boom",
+    }
+
+
+def test_logs_all_namespaces(fake_k8s):
+    response = client.get("/logs")
+    assert response.status_code == 200
+    assert response.json()["total"] == 3
+    assert fake_k8s.calls[0] == ("all", None, None)
+    assert response.json()["partial"] is False
+
+
+def test_logs_namespace_is_pushed_down(fake_k8s):
+    response = client.get("/logs", params={"namespace": "default"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 2
+    assert {log["kubernetes"]["namespace"] for log in body["logs"]} == {"default"}
+    assert fake_k8s.calls[0] == ("namespaced", "default", None)
+    assert ("log", "kube-system", "coredns-1") not in fake_k8s.calls
+
+
+def test_logs_label_selector_is_pushed_down(fake_k8s):
+    response = client.get("/logs", params={"label_selector": "coredns"})
+    assert response.json()["total"] == 1
+    assert fake_k8s.calls[0] == ("all", None, "coredns")
+
+
+def test_default_scope(fake_k8s, monkeypatch):
+    monkeypatch.setattr(main, "DEFAULT_NAMESPACE", "kube-system")
+    response = client.get("/pods")
+    assert response.json() == {"pods": ["coredns-1"]}
+
+    # An explicit request parameter overrides the default scope
+    response = client.get("/pods", params={"namespace": "default"})
+    assert response.json() == {"pods": ["robot-service-1"]}
+
+
+def test_readiness_follows_lazy_client(monkeypatch):
+    now = [0.0]
+    attempts = []
+
+    def factory():
+        attempts.append(now[0])
+        if len(attempts) == 1:
+            no_cluster()
+        return FakeCoreV1Api(pods=[], logs={})
+
+    kube = KubeClient(retry_seconds=30, factory=factory, clock=lambda: now[0])
+    monkeypatch.setattr(main, "kube_client", kube)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "starting", "kubernetes": "pending"}
+
+    assert kube.get() is None
+    assert client.get("/ready").json() == {
+        "status": "ready",
+        "kubernetes": "unavailable",
+    }
+    # Failures are retried only after retry_seconds, then the client is kept
+    assert kube.get() is None and attempts == [0.0]
+    now[0] = 30.0
+    api = kube.get()
+    assert api is not None and kube.get() is api and len(attempts) == 2
+    assert client.get("/ready").json()["kubernetes"] == "ready"
+
+
+def test_mock_logs_fallback(monkeypatch):
+    monkeypatch.setattr(main, "kube_client", KubeClient(factory=no_cluster))
+    response = client.get("/logs", params={"level": "error"})
+    assert response.status_code == 200
+    assert response.json()["total"] == 1
+
+    response = client.get("/logs", params={"namespace": "kube-system"})
+    assert response.json()["total"] == 0
+
+
+def test_query_language():
+    from app.query import compile_query
+
+    source = ("default", "robot-service-1", "robot-service")
+    plan = compile_query('level:error AND (robot OR "dns ready") -timeout')
+    assert plan("Robot r1 failed", "error", source)
+    assert not plan("Robot r1 failed", "info", source)
+    assert not plan("Robot r1 timeout", "error", source)
+
+    plan = compile_query("pod:/^robot-/ /r\\d+/")
+    assert plan("Added robot: r1", "info", source)
+    assert not plan("Added robot", "info", source)
+
+    # Repeated queries reuse the cached plan
+    assert compile_query("pod:/^robot-/ /r\\d+/") is plan
+
+
+def test_logs_query_filter(fake_k8s):
+    response = client.get("/logs", params={"query": "namespace:default NOT failed"})
+    body = response.json()
+    assert body["total"] == 1
+    assert body["logs"][0]["message"] == "Added robot: r1"
+
+    response = client.get("/logs", params={"query": "added OR dns"})
+    assert response.json()["total"] == 2
+
+
+def test_logs_invalid_query(fake_k8s):
+    response = client.get("/logs", params={"query": "/robot(/"})
+    assert response.status_code == 400
+    assert "Invalid regular expression" in response.json()["detail"]
+
+
+def test_query_path_searches_are_plain_terms():
+    from app.query import compile_query
+
+    source = ("default", "robot-service-1", "robot-service")
+    line = 'GET /api/v1/robots HTTP/1.1 "ok'
+    for query in ("GET /robots", "/robots", "/api/v1/robots", '"ok'):
+        assert compile_query(query)(line, "info", source), query
+    assert not compile_query("/robots")("GET /health", "info", source)
+    # Complete /regex/ tokens are still regular expressions
+    assert compile_query("/rob.ts/i")("GET /ROBOTS", "info", source)
+    assert compile_query("(/rob.ts/ OR x)")("GET /robots", "info", source)
+
+
+def test_failing_container_opens_breaker(fake_k8s):
+    fake_k8s.logs[("kube-system", "coredns-1", "coredns")] = RuntimeError("boom")
+
+    body = client.get("/logs").json()
+    assert body["total"] == 2
+    assert body["partial"] is True
+    assert body["skipped_sources"] == ["kube-system/coredns-1/coredns"]
+
+    # The breaker is open now, so the broken container is not contacted again
+    fake_k8s.calls.clear()
+    body = client.get("/logs").json()
+    assert body["skipped_sources"] == ["kube-system/coredns-1/coredns"]
+    assert ("log", "kube-system", "coredns-1") not in fake_k8s.calls
+
+
+def test_slow_container_hits_deadline(fake_k8s, monkeypatch):
+    import time
+
+    monkeypatch.setattr(main, "FETCH_DEADLINE_SECONDS", 0.05)
+    fake_k8s.logs[("kube-system", "coredns-1", "coredns")] = lambda: time.sleep(0.5)
+
+    started = time.monotonic()
+    body = client.get("/logs").json()
+    assert time.monotonic() - started < 0.4
+    assert body["total"] == 2
+    assert body["partial"] is True
+    assert main.fetch_breaker.is_open(("kube-system", "coredns-1", "coredns"))
+
+
+def test_breaker_backoff():
+    from app.breaker import SourceBreaker
+
+    now = [0.0]
+    breaker = SourceBreaker(base_backoff=1, max_backoff=4, clock=lambda: now[0])
+    breaker.record_failure("a")
+    assert not breaker.allow("a")
+    now[0] = 1.0
+    assert breaker.allow("a")  # trial fetch
+    assert not breaker.allow("a")  # others wait for the trial
+    breaker.record_failure("a")
+    now[0] = 2.5
+    assert not breaker.allow("a")  # backoff doubled to 2s
+    now[0] = 3.0
+    assert breaker.allow("a")
+    breaker.record_success("a")
+    assert breaker.allow("a")
+
+
+def test_log_segment_roundtrip():
+    from app.store import LogSegment, parse_timestamp
+
+    segment = LogSegment()
+    source = ("default", "robot-service-1", "robot-service")
+    segment.add("2024-01-01 10:00:00", "info", source, "older")
+    segment.add("2024-01-01T10:00:01.5Z", "error", source, "newer ✓")
+    assert len(segment) == 2
+    assert parse_timestamp("2024-01-01T10:00:00Z") == 1704103200000000
+
+    page = segment.page(0, 10)
+    assert [entry["message"] for entry in page] == ["newer ✓", "older"]
+    assert page[0] == {
+        "timestamp": "2024-01-01T10:00:01.500000+00:00",
+        "level": "error",
+        "message": "newer ✓",
+        "kubernetes": {
+            "pod_name": "robot-service-1",
+            "container_name": "robot-service",
+            "namespace": "default",
+        },
+    }
+    assert segment.page(1, 1)[0]["message"] == "older"
+
+
+def test_logs_sorted_newest_first(fake_k8s):
+    body = client.get("/logs", params={"limit": 2}).json()
+    assert body["total"] == 3
+    assert [log["message"] for log in body["logs"]] == ["dns ready", "Robot r1 failed"]
+
+
+def test_repeated_searches_do_not_duplicate_lines(fake_k8s):
+    assert client.get("/logs").json()["total"] == 3
+    assert client.get("/logs").json()["total"] == 3
+
+
+def test_logs_time_range(fake_k8s):
+    params = {"from_time": "2024-01-01T10:00:01Z", "to_time": "2024-01-01T10:00:01Z"}
+    body = client.get("/logs", params=params).json()
+    assert [log["message"] for log in body["logs"]] == ["Robot r1 failed"]
+
+    response = client.get("/logs", params={"from_time": "yesterday"})
+    assert response.status_code == 400
+
+
+def test_spill_tier_reads_only_overlapping_blocks(tmp_path, monkeypatch):
+    from app import spill
+    from app.store import LogStore, SearchFilter
+
+    source = ("default", "robot-service-1", "robot-service")
+    other = ("default", "dashboard-1", "dashboard")
+    tier = spill.SpillTier(str(tmp_path), block_entries=10)
+    store = LogStore(segment_entries=50, memory_segments=1, spill=tier)
+    base = 1_700_000_000_000_000
+    rows = [(base + i, base + i, "info", f"line {i}") for i in range(200)]
+    store.ingest(source, rows)
+    store.ingest(other, [(base + 1000, base + 1000, "error", "other source")])
+    # Ingest only seals; segments are written out by spill_overflow
+    assert not tier.files and len(store.sealed) == 4
+    store.spill_overflow()
+    assert len(tier.files) == 3
+    assert len(store) == 51  # one sealed segment plus the active segment
+
+    decoded = []
+    real_decode = spill.decode_block
+    monkeypatch.setattr(
+        spill,
+        "decode_block",
+        lambda data, ids: decoded.append(1) or real_decode(data, ids),
+    )
+    search = SearchFilter(from_us=base + 15, to_us=base + 24)
+    result = store.search(search)
+    assert [result.message(i) for i in range(len(result))] == [
+        f"line {i}" for i in range(15, 25)
+    ]
+    assert len(decoded) == 2
+
+    # Files are picked up again, with their de-duplication marks, after a restart
+    reopened = LogStore(spill=spill.SpillTier(str(tmp_path), block_entries=10))
+    assert reopened.ingest(source, rows[:100]) == 0
+    assert len(reopened.search(SearchFilter(level="info"))) == 150
+
+
+def test_newest_search_stops_once_the_page_is_certain(tmp_path, monkeypatch):
+    from app import spill
+    from app.store import LogStore, SearchFilter
+
+    a = ("default", "robot-service-1", "robot-service")
+    b = ("default", "robot-service-2", "robot-service")
+    store = LogStore(
+        segment_entries=50,
+        memory_segments=1,
+        spill=spill.SpillTier(str(tmp_path), block_entries=10),
+    )
+    base = 1_700_000_000_000_000
+    store.ingest(a, [(base + 2 * i, base + 2 * i, "info", f"a{i}") for i in range(200)])
+    # Lines of the second source interleave with the newest of the first
+    b_rows = [
+        (base + 301 + 2 * i, base + 301 + 2 * i, "info", f"b{i}") for i in range(80)
+    ]
+    store.ingest(b, b_rows)
+    store.spill_overflow()
+    assert store.spill.files
+
+    decoded = []
+    real_decode = spill.decode_block
+    monkeypatch.setattr(
+        spill,
+        "decode_block",
+        lambda data, ids: decoded.append(1) or real_decode(data, ids),
+    )
+    everything = store.search(SearchFilter())
+    blocks = len(decoded)
+    decoded.clear()
+
+    result, exact = store.search_newest(SearchFilter(), 30)
+    assert not exact and len(result) < len(everything)
+    assert len(decoded) < blocks
+    assert result.page(5, 25) == everything.page(5, 25)
+
+    # Asking for more than there is scans everything
+    result, exact = store.search_newest(SearchFilter(), 1000)
+    assert exact and len(result) == len(everything) == 280
+
+
+def test_spilled_sequence_high_water_survives_restart(tmp_path):
+    from app.spill import SpillTier
+    from app.store import LogStore, parse_timestamp
+
+    source = ("default", "robot-service-1", "robot-service")
+    kubelet = parse_timestamp("2024-01-01T10:00:05Z")
+    written = parse_timestamp("2024-01-01T10:00:00Z")
+    store = LogStore(spill=SpillTier(str(tmp_path)))
+    assert store.ingest(source, [(kubelet, written, "info", "late line")]) == 1
+    store.flush()
+
+    # The application's own timestamp is older than the kubelet's
+    reopened = LogStore(spill=SpillTier(str(tmp_path)))
+    assert reopened.high_water_mark(source) == kubelet
+    assert reopened.ingest(source, [(kubelet, written, "info", "late line")]) == 0
+
+
+def test_lines_in_the_same_microsecond_are_all_kept():
+    from app.store import LogStore
+
+    source = ("default", "robot-service-1", "robot-service")
+    # Kubelet timestamps have nanoseconds; both lines map to one microsecond
+    pod_logs = (
+        "2024-01-01T10:00:00.000001001Z [INFO] first\n"
+        "2024-01-01T10:00:00.000001002Z [INFO] second\n"
+    )
+    store = LogStore()
+    rows = list(main.parse_container_logs(pod_logs, None))
+    assert rows[0][0] == rows[1][0]
+    assert store.ingest(source, rows) == 2
+    # A later fetch that returns them again adds nothing
+    mark = store.high_water_mark(source)
+    assert store.ingest(source, main.parse_container_logs(pod_logs, mark)) == 0
+    assert len(store.active) == 2
+
+
+def test_logs_debug_timing(fake_k8s):
+    body = client.get("/logs").json()
+    assert "timing" not in body
+
+    body = client.get("/logs", params={"debug": "timing", "level": "error"}).json()
+    assert set(body["timing"]["stages"]) == {"list", "fetch", "parse", "filter", "sort"}
+    assert body["timing"]["counts"] == {
+        "lines_fetched": 3,
+        "bytes_fetched": body["timing"]["counts"]["bytes_fetched"],
+        "lines_parsed": 0,  # every line was stored by the first search
+        "lines_matched": 1,
+    }
+
+    metrics = client.get("/metrics").text
+    assert 'log_api_stage_duration_seconds_count{stage="fetch"}' in metrics
+    assert "log_api_lines_matched_total" in metrics
+
+
+class FakePrometheus(BaseHTTPRequestHandler):
+    """Local Prometheus answering query_range for ``robots_added_total``, which
+    counts one robot per second. Every request is recorded in ``calls``.
+    """
+
+    calls = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        self.calls.append(params)
+        if params["query"] != "robots_added_total":
+            status, body = 400, {
+                "status": "error",
+                "errorType": "bad_data",
+                "error": "unknown metric",
+            }
+        else:
+            start, end, step = (float(params[k]) for k in ("start", "end", "step"))
+            count = int((end - start) // step) + 1
+            values = [[start + i * step, str(start + i * step)] for i in range(count)]
+            status, body = 200, {
+                "status": "success",
+                "data": {
+                    "resultType": "matrix",
+                    "result": [{"metric": {"job": "robot"}, "values": values}],
+                },
+            }
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def fake_prometheus(monkeypatch):
+    from app.promproxy import RangeQueryCache, fetch_query_range
+
+    FakePrometheus.calls = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePrometheus)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    now = [10_000.0]
+    cache = RangeQueryCache(
+        fetch=lambda *args: fetch_query_range(url, *args),
+        refresh_seconds=15,
+        settle_seconds=60,
+        clock=lambda: now[0],
+    )
+    monkeypatch.setattr(main, "prometheus_cache", cache)
+    yield SimpleNamespace(calls=FakePrometheus.calls, now=now, cache=cache)
+    server.shutdown()
+
+
+def test_prometheus_proxy_fetches_only_the_uncached_tail(fake_prometheus):
+    def query_range(start, end, **params):
+        return client.get(
+            "/prometheus/query_range",
+            params={
+                "query": "robots_added_total",
+                "start": start,
+                "end": end,
+                "step": "60s",
+                **params,
+            },
+        )
+
+    # Unaligned windows snap to the step grid that every client shares
+    response = query_range(6_410, 10_000)
+    assert response.status_code == 200
+    values = response.json()["data"]["result"][0]["values"]
+    assert values[0] == [6_420.0, "6420.0"] and values[-1] == [9_960.0, "9960.0"]
+    assert len(values) == 60
+    assert [(c["start"], c["end"]) for c in fake_prometheus.calls] == [
+        ("6420.0", "9960.0")
+    ]
+
+    # Within the refresh interval the cache answers alone
+    fake_prometheus.now[0] += 10
+    assert query_range(6_420, 9_970).json() == response.json()
+    assert len(fake_prometheus.calls) == 1
+
+    # Later, only samples newer than settle_seconds at the last fetch are fetched
+    fake_prometheus.now[0] = 10_300
+    values = query_range(6_700, 10_300).json()["data"]["result"][0]["values"]
+    assert values[0][0] == 6_720.0 and values[-1][0] == 10_260.0
+    assert (fake_prometheus.calls[-1]["start"], fake_prometheus.calls[-1]["end"]) == (
+        "9960.0",
+        "10260.0",
+    )
+
+    # Downsampled to at most 10 points, keeping each bucket's last sample
+    values = query_range(6_700, 10_300, points=10).json()["data"]["result"][0]
+    assert len(values["values"]) == 10 and values["values"][-1][0] == 10_260.0
+    assert len(fake_prometheus.calls) == 2
+
+    bad = client.get(
+        "/prometheus/query_range",
+        params={"query": "nope", "start": 0, "end": 60, "step": "1m"},
+    )
+    assert bad.status_code == 400 and bad.json()["detail"] == "unknown metric"
+
+
+def test_prometheus_proxy_coalesces_concurrent_queries():
+    import asyncio
+    import time
+
+    from app.promproxy import RangeQueryCache
+
+    calls = []
+
+    def slow_fetch(query, start, end, step):
+        calls.append((start, end))
+        time.sleep(0.05)
+        return [{"metric": {}, "values": [[start, "1"], [end, "2"]]}]
+
+    cache = RangeQueryCache(slow_fetch, clock=lambda: 1_000.0)
+
+    async def burst():
+        return await asyncio.gather(
+            *(cache.query_range("up", 0, 600, 60) for _ in range(8))
+        )
+
+    results = asyncio.run(burst())
+    assert calls == [(0, 600)]
+    assert all(r == results[0] for r in results)
+
+
+def test_admission_sheds_searches_but_not_cheap_requests(monkeypatch):
+    from app.admission import CostClass
+
+    heavy = CostClass("heavy", limit=1, queue_size=0, max_wait=2.0)
+    monkeypatch.setitem(main.admission.classes, "heavy", heavy)
+    monkeypatch.setattr(main, "kube_client", KubeClient(factory=no_cluster))
+    heavy.active = 1  # a search is already running
+
+    response = client.get("/logs")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "2"
+    assert client.get("/pods").status_code == 200
+    assert client.get("/health").status_code == 200
+    # Exports have their own limit
+    assert client.get("/logs/export").status_code == 200
+    # and so do searches that replicas send each other, but only those
+    replica = {"client": ("127.0.0.1", 40000)}
+    outsider = {"client": ("203.0.113.9", 40000)}
+    classify = main.admission.classify
+    assert classify("/logs", "level=info&scope=local", replica).name == "peer"
+    assert classify("/logs", "level=info&scope=local", outsider).name == "heavy"
+    assert classify("/logs", "scope=all", replica).name == "heavy"
+
+    heavy.active = 0
+    assert client.get("/logs").status_code == 200
+    text = client.get("/metrics").text
+    assert (
+        'log_api_admission_shed_total{cost_class="heavy",reason="queue_full"} 1.0'
+        in text
+    )
+    assert 'log_api_admission_queue_seconds_count{cost_class="heavy"}' in text
+
+
+def test_pattern_miner_generalizes_and_stays_bounded():
+    from app.patterns import PatternMiner
+
+    miner = PatternMiner(max_clusters=2)
+    first = miner.add("Added robot: robot-1")
+    assert miner.add("Added robot: robot-22") is first
+    assert first.pattern == "Added robot: <*>"
+    assert miner.add("Robot heartbeat from dock A") is not first
+    # Differing non-numeric tokens are generalized once most tokens agree
+    assert miner.add("Robot heartbeat from dock B").pattern == (
+        "Robot heartbeat from dock <*>"
+    )
+    assert miner.match("Added robot: robot-7") is first
+    assert miner.match("Removed robot: robot-7") is None
+
+    miner.add("Fetching all robots")
+    assert len(miner) == 2
+    assert miner.match("Added robot: robot-7") is None
+
+
+def test_pattern_miner_merges_ids_without_digits():
+    from app.patterns import PatternMiner
+
+    miner = PatternMiner()
+    added = miner.add("Added robot: alpha-bot")
+    assert miner.add("Added robot: beta-bot") is added
+    assert added.pattern == "Added robot: <*>"
+
+    missing = miner.add("Robot with ID foo-bar not found")
+    assert miner.add("Robot with ID baz-qux not found") is missing
+    assert missing.pattern == "Robot with ID <*> not found"
+    assert miner.match("Robot with ID gamma not found") is missing
+    assert len(miner) == 2
+
+
+def test_logs_patterns(fake_k8s):
+    main.pattern_miner.clear()
+    fake_k8s.logs[("default", "robot-service-1", "robot-service")] = (
+        "".join(
+            f"2024-01-01T10:00:{i:02d}Z [INFO] Added robot: r{i}\n" for i in range(30)
+        )
+        + "2024-01-01T10:00:40Z [ERROR] Robot r1 failed\n"
+    )
+
+    response = client.get("/logs/patterns", params={"namespace": "default"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 31
+    top = body["patterns"][0]
+    assert top["pattern"] == "Added robot: <*>"
+    assert top["count"] == 30
+    assert top["sample_values"] == ["r0", "r1", "r2"]
+    assert top["first_seen"].startswith("2024-01-01T10:00:00")
+    assert top["last_seen"].startswith("2024-01-01T10:00:29")
+
+    response = client.get(
+        "/logs/patterns", params={"namespace": "default", "level": "error"}
+    )
+    assert [p["pattern"] for p in response.json()["patterns"]] == ["Robot <*> failed"]
+
+
+def test_store_stream_merges_every_tier_in_time_order(tmp_path):
+    from app.spill import SpillTier
+    from app.store import LogStore, SearchFilter
+
+    a = ("default", "robot-service-1", "robot-service")
+    b = ("default", "robot-service-2", "robot-service")
+    store = LogStore(
+        segment_entries=20,
+        memory_segments=1,
+        spill=SpillTier(str(tmp_path), block_entries=5),
+    )
+    base = 1_700_000_000_000_000
+    # The sources' timestamps interleave, but each was ingested in one go
+    store.ingest(a, [(base + 2 * i, base + 2 * i, "info", f"a{i}") for i in range(50)])
+    store.ingest(
+        b, [(base + 2 * i + 1, base + 2 * i + 1, "info", f"b{i}") for i in range(45)]
+    )
+    store.spill_overflow()
+    assert store.spill.files and store.sealed and len(store.active)
+
+    rows = list(store.stream(SearchFilter(from_us=base + 10)))
+    expected = [base + 2 * i for i in range(5, 50)]
+    expected += [base + 2 * i + 1 for i in range(5, 45)]
+    assert [r[0] for r in rows] == sorted(expected)
+    assert rows[0][1:4] == (a, 1, "a5")
+
+
+def test_spill_files_outlive_the_budget_while_streamed(tmp_path):
+    from app.spill import SpillTier
+    from app.store import LogStore, SearchFilter
+
+    source = ("default", "robot-service-1", "robot-service")
+    store = LogStore(
+        segment_entries=10,
+        memory_segments=1,
+        spill=SpillTier(str(tmp_path), block_entries=5),
+    )
+    base = 1_700_000_000_000_000
+    store.ingest(source, [(base + i, base + i, "info", f"m{i}") for i in range(30)])
+    store.spill_overflow()
+    oldest = store.spill.files[0]
+    store.spill.max_bytes = oldest.size
+
+    stream = store.stream(SearchFilter())
+    assert next(stream)[3] == "m0"
+    # The budget drops the file being streamed, but it stays readable
+    store.ingest(source, [(base + i, base + i, "info", f"m{i}") for i in range(30, 50)])
+    store.spill_overflow()
+    assert oldest not in store.spill.files
+    assert os.path.exists(oldest.path)
+    assert [row[3] for row in stream][:9] == [f"m{i}" for i in range(1, 10)]
+    # and is deleted once the stream is done
+    assert not os.path.exists(oldest.path)
+    assert not any(row[3] == "m0" for row in store.stream(SearchFilter()))
+
+
+def test_logs_export_resumes_from_checkpoint(monkeypatch):
+    monkeypatch.setattr(main, "kube_client", KubeClient(factory=no_cluster))
+    monkeypatch.setattr(main, "EXPORT_CHECKPOINT_ROWS", 2)
+    base = 1_700_000_000_000_000
+    sources = [("default", f"robot-service-{i}", "robot-service") for i in range(2)]
+    for n, source in enumerate(sources):
+        # Both sources log at the same instants
+        main.log_store.ingest(
+            source,
+            [(base + i, base + i, "info", f"tick {i} from {n}") for i in range(3)],
+        )
+
+    def export(**params):
+        lines = client.get("/logs/export", params=params).text.splitlines()
+        return [json.loads(line) for line in lines]
+
+    everything = export()
+    logs = [line for line in everything if "message" in line]
+    assert [log["message"] for log in logs] == [
+        f"tick {i} from {n}" for i in range(3) for n in range(2)
+    ]
+    assert logs[0]["kubernetes"]["pod_name"] == "robot-service-0"
+    checkpoints = [line["checkpoint"] for line in everything if "checkpoint" in line]
+    assert everything[-1]["done"] is True
+    assert len(checkpoints) == 4
+
+    # Resuming after the first checkpoint skips exactly what came before it
+    resumed = export(checkpoint=checkpoints[0])
+    assert [line["message"] for line in resumed if "message" in line] == [
+        log["message"] for log in logs[2:]
+    ]
+    resumed = export(checkpoint=checkpoints[1], level="info", pod="robot-service-1")
+    assert [line["message"] for line in resumed if "message" in line] == [
+        "tick 2 from 1"
+    ]
+
+    response = client.get("/logs/export", params={"checkpoint": "soon"})
+    assert response.status_code == 400
+
+
+def test_standing_queries_share_predicates_and_stream_matches():
+    import asyncio
+
+    from app.standing import StandingQueryIndex, events
+    from app.store import LogStore
+
+    index = StandingQueryIndex(recent_size=2)
+    store = LogStore()
+
+    def broken(*line):
+        raise RuntimeError("listener bug")
+
+    # A failing listener neither loses lines nor starves the others
+    store.listeners.extend([broken, index])
+    errors = index.add(query="failed", level="error")
+    same = index.add(name="pager", query="failed", level="error")
+    robots = index.add(pod="robot-service-1")
+    assert index.predicates() == 2
+    # Levels match whatever their case
+    shouted = index.add(level="ERROR")
+    with pytest.raises(ValueError):
+        index.add()
+
+    async def scenario():
+        stream = events(errors, keepalive=0.05)
+        assert await stream.__anext__() == ": subscribed\n\n"
+        robot = ("default", "robot-service-1", "robot-service")
+        store.ingest(
+            robot,
+            [
+                (1, 1_000_000, "info", "Added robot r1"),
+                (2, 2_000_000, "error", "Robot r1 failed"),
+                (3, 3_000_000, "error", "Robot r2 failed"),
+                (4, 4_000_000, "error", "Robot r3 failed"),
+            ],
+        )
+        store.ingest(("default", "db-0", "db"), [(1, 5_000_000, "error", "failed")])
+        received = [await stream.__anext__()]
+        # Removing the query ends the stream once queued matches are sent
+        index.remove(errors.id)
+        received += [event async for event in stream]
+        return received
+
+    received = asyncio.run(scenario())
+    assert len(received) == 4
+    assert received[0].startswith("event: match\ndata: ")
+    assert json.loads(received[0].split("data: ")[1])["message"] == "Robot r1 failed"
+    assert not errors.subscribers
+    assert (errors.matches, same.matches, robots.matches) == (4, 4, 4)
+    assert shouted.matches == 4
+    index.remove(shouted.id)
+    assert [m[3] for m in same.recent] == ["Robot r3 failed", "failed"]
+    assert index.predicates() == 2 and len(index) == 2
+    assert len(store.active) == 5
+    assert store.high_water_mark(("default", "robot-service-1", "robot-service")) == 4
+
+
+def test_webhooks_do_not_follow_redirects():
+    from urllib.error import HTTPError
+
+    from app.standing import post_webhook
+
+    class Redirect(BaseHTTPRequestHandler):
+        requests = []
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            Redirect.requests.append(("POST", self.path))
+            self.send_response(302)
+            self.send_header("Location", "/elsewhere")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_GET(self):
+            Redirect.requests.append(("GET", self.path))
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Redirect)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(HTTPError):
+            post_webhook(f"http://127.0.0.1:{server.server_address[1]}/hook", {}, 5)
+    finally:
+        server.shutdown()
+    assert Redirect.requests == [("POST", "/hook")]
+
+
+def test_standing_query_endpoints(fake_k8s, monkeypatch):
+    response = client.post("/logs/standing", json={"query": "/fail(ed)?/"})
+    assert response.status_code == 201
+    query_id = response.json()["id"]
+    assert response.json()["matches"] == 0
+    assert client.post("/logs/standing", json={"query": "(oops"}).status_code == 400
+    response = client.post(
+        "/logs/standing", json={"level": "error", "webhook_url": "file:///etc"}
+    )
+    assert response.status_code == 400
+    # Webhooks may only target the allowed hosts
+    monkeypatch.setattr(main, "STANDING_WEBHOOK_HOSTS", {"alerts.example.com"})
+    response = client.post(
+        "/logs/standing",
+        json={"level": "error", "webhook_url": "http://169.254.169.254/latest"},
+    )
+    assert response.status_code == 400
+    response = client.post(
+        "/logs/standing",
+        json={"level": "error", "webhook_url": "https://alerts.example.com/hook"},
+    )
+    assert response.status_code == 201
+    client.delete(f"/logs/standing/{response.json()['id']}")
+
+    # Lines are matched as they are ingested by the search
+    client.get("/logs", params={"namespace": "default"})
+    client.get("/logs", params={"namespace": "default"})
+    body = client.get(f"/logs/standing/{query_id}").json()
+    assert body["matches"] == 1
+    assert body["recent"][0]["message"] == "Robot r1 failed"
+    assert body["last_match"].startswith("2024-01-01T10:00:01")
+    assert [q["id"] for q in client.get("/logs/standing").json()] == [query_id]
+
+    assert client.delete(f"/logs/standing/{query_id}").status_code == 200
+    assert client.get(f"/logs/standing/{query_id}").status_code == 404
+    response = client.get("/logs/standing/events", params={"id": query_id})
+    assert response.status_code == 404
+
+
+def test_hash_ring_moves_only_the_joining_replicas_share():
+    from app.sharding import HashRing
+
+    keys = [f"default/robot-service-{i}" for i in range(600)]
+    before = HashRing(["http://a", "http://b", "http://c"])
+    after = HashRing(["http://a", "http://b", "http://c", "http://d"])
+    owners = {key: before.owner(key) for key in keys}
+    moved = [key for key in keys if after.owner(key) != owners[key]]
+    assert all(after.owner(key) == "http://d" for key in moved)
+    assert 75 < len(moved) < 225
+    for member in before.members:
+        assert 100 < list(owners.values()).count(member) < 300
+
+
+class FakePeer(BaseHTTPRequestHandler):
+    calls = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.calls.append(
+            {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        )
+        data = json.dumps(
+            {
+                "total": 3,
+                "logs": [
+                    {
+                        "timestamp": "2024-01-01T10:00:05+00:00",
+                        "level": "info",
+                        "message": f"peer line {i}",
+                        "kubernetes": {"pod_name": f"peer-{i}", "namespace": "x"},
+                    }
+                    for i in (5, 3)
+                ],
+                "partial": True,
+                "skipped_sources": ["x/peer-9/app"],
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def test_logs_scatter_gather_across_replicas(fake_k8s, monkeypatch):
+    from app.sharding import Membership
+
+    FakePeer.calls = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePeer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    peer = f"http://127.0.0.1:{server.server_address[1]}"
+    down = "http://127.0.0.1:9"
+    membership = Membership("http://self:8080", peers=[peer, down])
+    monkeypatch.setattr(main, "membership", membership)
+    # Only pods the ring assigns to this replica are read
+    owned = [
+        s
+        for s in (
+            ("default", "robot-service-1", "robot-service"),
+            ("kube-system", "coredns-1", "coredns"),
+        )
+        if membership.owns(s)
+    ]
+    try:
+        response = client.get("/logs", params={"level": "info", "limit": 2})
+    finally:
+        server.shutdown()
+
+    body = response.json()
+    assert [c for c in fake_k8s.calls if c[0] == "log"] == [
+        ("log", namespace, pod) for namespace, pod, _ in owned
+    ]
+    assert FakePeer.calls == [
+        {"level": "info", "scope": "local", "offset": "0", "limit": "2"}
+    ]
+    # One info line per pod
+    local = len(owned)
+    assert body["total"] == 3 + local
+    assert [log["message"] for log in body["logs"]] == ["peer line 5", "peer line 3"]
+    assert body["partial"] is True
+    assert body["skipped_sources"] == ["x/peer-9/app", f"peer {down}"]
+
+    # Peers asked for their own shard do not fan out again
+    response = client.get("/logs", params={"level": "info", "scope": "local"})
+    assert response.json()["total"] == local
+    assert client.get("/logs", params={"offset": 10001}).status_code == 422
+
+    # Endpoints that only see this replica's shard say so
+    body = client.get("/logs/patterns").json()
+    assert body["partial"] is True
+    assert body["skipped_sources"][-2:] == [f"peer {peer}", f"peer {down}"]
+    assert client.get("/logs/export").status_code == 409
+    assert client.get("/logs/export", params={"scope": "local"}).status_code == 200
+    response = client.post("/logs/standing", json={"level": "error"})
+    assert response.json()["partial"] is True
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_concurrent_searches_on_two_replicas():
+    here = Path(__file__).parent
+    kube_port = free_port()
+    ports = [free_port(), free_port()]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    processes = [
+        # Slow pod logs keep both replicas' searches in flight at once
+        subprocess.Popen(
+            [sys.executable, str(here.parent / "tests/performance/fake_k8s_api.py")]
+            + ["--port", str(kube_port), "--pods", "4", "--latency", "0.3"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    ]
+    for port, url, peer in zip(ports, urls, reversed(urls)):
+        env = dict(
+            os.environ,
+            LOG_API_KUBE_HOST=f"http://127.0.0.1:{kube_port}",
+            LOG_API_SELF_URL=url,
+            LOG_API_PEERS=peer,
+            # One search at a time, so searches and peer requests would deadlock
+            # if they shared the slot; searches may queue behind each other
+            ADMISSION_HEAVY_CONCURRENCY="1",
+            ADMISSION_HEAVY_MAX_WAIT_SECONDS="30",
+            LOG_API_PEER_TIMEOUT_SECONDS="5",
+        )
+        processes.append(
+            subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app"]
+                + ["--port", str(port), "--log-level", "warning"],
+                cwd=here,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        )
+    try:
+        wait_until_up(f"http://127.0.0.1:{kube_port}/api/v1/pods")
+        for url in urls:
+            wait_until_up(f"{url}/health")
+
+        def search(url):
+            with urllib.request.urlopen(f"{url}/logs?limit=10", timeout=30) as r:
+                return json.loads(r.read())
+
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(search, urls * 2))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    for body in results:
+        assert body["skipped_sources"] == []
+        assert body["partial"] is False
+        assert len(body["logs"]) == 10
+
+
+def test_merge_newest_pages_once_per_line():
+    from app.sharding import merge_newest
+
+    def entry(second, message):
+        return {"timestamp": f"2024-01-01T10:00:{second:02d}Z", "message": message}
+
+    pages = [
+        [entry(9, "a"), entry(5, "b"), entry(1, "c")],
+        [entry(8, "d"), entry(5, "b"), entry(5, "e")],
+        [],
+    ]
+    merged = merge_newest(pages, offset=1, limit=3)
+    assert [e["message"] for e in merged] == ["d", "b", "e"]
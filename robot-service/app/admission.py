@@ -0,0 +1,196 @@
+"""Admission control: per-class concurrency limits with bounded wait queues.
+
+Each request is assigned a cost class by its path, or by its path and query
+parameters for routes such as ``/logs?scope=local``. A class may have a guard,
+a check on the request that its routes apply only to (for example, that it
+comes from a known address). A class runs at most
+``limit`` requests at once; further requests wait in FIFO order, up to
+``queue_size`` of them. A request that finds the queue full, or that has not
+started within ``max_wait`` seconds, is rejected with 503 and a Retry-After
+header instead of piling up inside the server. Classes have separate limits,
+so a burst of expensive searches cannot hold back cheap CRUD requests.
+
+Health, readiness and metrics endpoints are never queued or shed.
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl
+
+from prometheus_client import Counter, Gauge, Histogram
+
+QUEUE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+EXEMPT_PATHS = ("/health", "/ready", "/metrics")
+
+
+class CostClass:
+    def __init__(
+        self, name: str, limit: int, queue_size: int = 0, max_wait: float = 1.0
+    ):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """Take a slot, waiting if needed; return the reason if shed instead."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if waiter.done():
+            # release() handed this request its slot
+            return None
+        self._waiters.remove(waiter)
+        waiter.cancel()
+        return "timeout"
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+        else:
+            self._waiters.remove(waiter)
+            waiter.cancel()
+
+    def release(self) -> None:
+        # Hand the slot straight to the oldest waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionController:
+    """The cost classes of one service and their metrics, named with ``prefix``."""
+
+    def __init__(
+        self,
+        classes: Iterable[CostClass],
+        routes: Dict[str, str],
+        default: str = "default",
+        exempt: Iterable[str] = EXEMPT_PATHS,
+        prefix: str = "",
+        guards: Optional[Dict[str, Callable[[dict], bool]]] = None,
+    ):
+        self.classes = {cost_class.name: cost_class for cost_class in classes}
+        self.routes: Dict[str, str] = {}
+        # path -> (query parameters, class name), for routes with a query
+        self.param_routes: Dict[str, List[Tuple[Set[Tuple[str, str]], str]]] = {}
+        for route, name in routes.items():
+            path, _, query = route.partition("?")
+            if query:
+                self.param_routes.setdefault(path, []).append(
+                    (set(parse_qsl(query)), name)
+                )
+            else:
+                self.routes[path] = name
+        self.default = default
+        self.exempt = set(exempt)
+        # class name -> check on the ASGI scope of the requests it may admit
+        self.guards = guards or {}
+        self.shed = Counter(
+            f"{prefix}admission_shed_total",
+            "Requests rejected by admission control",
+            ["cost_class", "reason"],
+        )
+        self.queue_time = Histogram(
+            f"{prefix}admission_queue_seconds",
+            "Time admitted requests waited for a slot",
+            ["cost_class"],
+            buckets=QUEUE_BUCKETS,
+        )
+        self.active = Gauge(
+            f"{prefix}admission_active_requests",
+            "Requests holding an admission slot",
+            ["cost_class"],
+            multiprocess_mode="livesum",
+        )
+
+    def classify(
+        self, path: str, query_string: str = "", scope: Optional[dict] = None
+    ) -> Optional[CostClass]:
+        if path in self.exempt:
+            return None
+        name = self.routes.get(path, self.default)
+        if query_string and path in self.param_routes:
+            params = set(parse_qsl(query_string))
+            for wanted, route_name in self.param_routes[path]:
+                guard = self.guards.get(route_name)
+                if guard is not None and not (scope and guard(scope)):
+                    continue
+                if wanted <= params:
+                    name = route_name
+                    break
+        return self.classes[name]
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cost_class = self.controller.classify(
+            scope["path"], scope.get("query_string", b"").decode("latin-1"), scope
+        )
+        if cost_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        reason = await cost_class.acquire()
+        if reason is not None:
+            self.controller.shed.labels(cost_class=cost_class.name, reason=reason).inc()
+            await self.reject(send, cost_class)
+            return
+        self.controller.queue_time.labels(cost_class=cost_class.name).observe(
+            time.perf_counter() - started
+        )
+        active = self.controller.active.labels(cost_class=cost_class.name)
+        active.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            active.dec()
+            cost_class.release()
+
+    async def reject(self, send, cost_class: CostClass) -> None:
+        body = json.dumps({"detail": "Server is overloaded, retry later"}).encode()
+        retry_after = str(max(1, math.ceil(cost_class.max_wait)))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", retry_after.encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,78 @@
+"""Streaming fleet export in NDJSON, CSV or Arrow IPC stream format.
+
+Rows come from the store's ``export_rows`` as plain tuples, in chunks, and are
+encoded one chunk at a time, so neither the whole fleet nor a Robot model per
+row is ever built. Arrow needs the optional pyarrow package.
+"""
+
+import csv
+import io
+import json
+from typing import Iterable, Iterator, List, Tuple
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover - optional
+    pyarrow = None
+
+COLUMNS = ("id", "name", "status", "last_seen")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def available_formats() -> List[str]:
+    return [f for f in MEDIA_TYPES if f != "arrow" or pyarrow is not None]
+
+
+def ndjson_chunks(chunks: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in rows
+        ).encode()
+
+
+def csv_chunks(chunks: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only: the fleet is empty
+        yield buffer.getvalue().encode()
+
+
+def arrow_chunks(chunks: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    schema = pyarrow.schema(
+        [
+            ("id", pyarrow.string()),
+            ("name", pyarrow.string()),
+            ("status", pyarrow.string()),
+            ("last_seen", pyarrow.float64()),
+        ]
+    )
+    buffer = io.BytesIO()
+    writer = pyarrow.ipc.new_stream(buffer, schema)
+    for rows in chunks:
+        writer.write_batch(pyarrow.record_batch(list(zip(*rows)), schema=schema))
+        yield take(buffer)
+    writer.close()
+    yield take(buffer)
+
+
+def take(buffer: io.BytesIO) -> bytes:
+    """Return what has been written to ``buffer`` so far and empty it."""
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+ENCODERS = {"ndjson": ndjson_chunks, "csv": csv_chunks, "arrow": arrow_chunks}
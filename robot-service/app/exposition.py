@@ -0,0 +1,79 @@
+"""Cached Prometheus exposition for /metrics.
+
+The registry is rendered at most once per ``ttl`` seconds per format, and the
+gzip variant is compressed once from that render. Concurrent scrapes wait for
+the render in progress instead of starting their own, and every scrape within
+the interval is served the same bytes.
+"""
+
+import gzip
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.openmetrics.exposition import \
+    CONTENT_TYPE_LATEST as OPENMETRICS_CONTENT_TYPE
+from prometheus_client.openmetrics.exposition import \
+    generate_latest as generate_openmetrics
+
+
+def accepts_openmetrics(accept: str) -> bool:
+    return "application/openmetrics-text" in accept
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class ExpositionCache:
+    def __init__(
+        self,
+        ttl: float = 0.0,
+        registry_factory: Callable = lambda: REGISTRY,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.registry_factory = registry_factory
+        self.clock = clock
+        # (openmetrics, gzip) -> (rendered at, body)
+        self._entries: Dict[Tuple[bool, bool], Tuple[float, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def _render(self, openmetrics: bool) -> bytes:
+        registry = self.registry_factory()
+        if openmetrics:
+            return generate_openmetrics(registry)
+        return generate_latest(registry)
+
+    def get(self, openmetrics: bool = False, compressed: bool = False) -> bytes:
+        key = (openmetrics, compressed)
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                return entry[1]
+            plain = self._entries.get((openmetrics, False))
+            if plain is not None and now - plain[0] < self.ttl:
+                rendered_at, body = plain
+            else:
+                rendered_at, body = now, self._render(openmetrics)
+                self._entries[(openmetrics, False)] = (rendered_at, body)
+            if compressed:
+                body = gzip.compress(body, compresslevel=6)
+                self._entries[key] = (rendered_at, body)
+            return body
+
+    def response_parts(self, accept: str, accept_encoding: str):
+        """Return (body, media type, extra headers) for a scrape request."""
+        openmetrics = accepts_openmetrics(accept)
+        compressed = accepts_gzip(accept_encoding)
+        headers = {"Vary": "Accept, Accept-Encoding"}
+        if compressed:
+            headers["Content-Encoding"] = "gzip"
+        media_type = OPENMETRICS_CONTENT_TYPE if openmetrics else CONTENT_TYPE_LATEST
+        return self.get(openmetrics, compressed), media_type, headers
@@ -0,0 +1,303 @@
+"""Per-robot status history kept in fixed-size rings.
+
+Each robot's status transitions are stored in a ring of ``capacity`` entries:
+one int64 array of epoch seconds and one uint8 array of status codes, 9 bytes
+per transition. Status strings are interned to codes on first use. A robot's
+ring is allocated on its first transition; when another ring would exceed
+``budget_bytes``, the ring of the robot whose status changed longest ago is
+dropped. Once a ring is full, each transition overwrites the oldest one.
+
+Time in status is computed over whole arrays with numpy: each transition lasts
+until the next one (or the end of the window), and the durations are summed
+per status code with one ``bincount`` across the fleet.
+
+With a shared SQLite robot store, ``SqliteStatusHistory`` keeps the same
+transitions in a table of that database instead, so every worker records into
+and reads from one history. It sums time in status in SQL, with a window
+function over the transitions in the requested window.
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Statuses beyond the first MAX_CODES - 1 are all recorded as OTHER
+MAX_CODES = 255
+OTHER = "other"
+# One int64 timestamp and one uint8 code
+RING_ENTRY_BYTES = 9
+
+
+class StatusRing:
+    __slots__ = ("times", "codes", "start", "count")
+
+    def __init__(self, capacity: int):
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.codes = np.zeros(capacity, dtype=np.uint8)
+        self.start = 0
+        self.count = 0
+
+    def append(self, timestamp: int, code: int) -> None:
+        capacity = len(self.times)
+        index = (self.start + self.count) % capacity
+        self.times[index] = timestamp
+        self.codes[index] = code
+        if self.count < capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def last_code(self) -> Optional[int]:
+        if not self.count:
+            return None
+        return int(self.codes[(self.start + self.count - 1) % len(self.codes)])
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the timestamps and codes, oldest first."""
+        end = self.start + self.count
+        if end <= len(self.times):
+            return (
+                self.times[self.start : end].copy(),
+                self.codes[self.start : end].copy(),
+            )
+        return (
+            np.concatenate(
+                (self.times[self.start :], self.times[: end % len(self.times)])
+            ),
+            np.concatenate(
+                (self.codes[self.start :], self.codes[: end % len(self.codes)])
+            ),
+        )
+
+
+class StatusHistory:
+    def __init__(self, capacity: int = 1024, budget_bytes: int = 64 * 1024 * 1024):
+        self.capacity = max(1, capacity)
+        self.budget_bytes = budget_bytes
+        # Every ring has the same size, so the budget is a number of robots
+        self.max_robots = budget_bytes // (self.capacity * RING_ENTRY_BYTES)
+        self._rings: "OrderedDict[str, StatusRing]" = OrderedDict()
+        self._codes: Dict[str, int] = {}
+        self._statuses: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._rings) * self.capacity * RING_ENTRY_BYTES
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    def _code(self, status: str) -> int:
+        code = self._codes.get(status)
+        if code is None:
+            if len(self._statuses) >= MAX_CODES - 1:
+                status = OTHER
+            code = self._codes.get(status)
+        if code is None:
+            code = self._codes[status] = len(self._statuses)
+            self._statuses.append(status)
+        return code
+
+    def record(self, robot_id: str, status: str, timestamp: float) -> None:
+        """Record that ``robot_id`` is in ``status`` from ``timestamp`` on."""
+        with self._lock:
+            code = self._code(status)
+            ring = self._rings.get(robot_id)
+            if ring is None:
+                if not self.max_robots:
+                    return
+                while len(self._rings) >= self.max_robots:
+                    self._rings.popitem(last=False)
+                ring = self._rings[robot_id] = StatusRing(self.capacity)
+            else:
+                self._rings.move_to_end(robot_id)
+            if ring.last_code() != code:
+                ring.append(int(timestamp), code)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rings.clear()
+            self._codes.clear()
+            self._statuses.clear()
+
+    def transitions(
+        self, robot_id: str, start: float = 0, end: Optional[float] = None
+    ) -> List[dict]:
+        """Transitions of ``robot_id`` within [start, end], oldest first."""
+        with self._lock:
+            ring = self._rings.get(robot_id)
+            if ring is None:
+                return []
+            times, codes = ring.ordered()
+            statuses = list(self._statuses)
+        keep = times >= start
+        if end is not None:
+            keep &= times <= end
+        return [
+            {"timestamp": int(t), "status": statuses[c]}
+            for t, c in zip(times[keep].tolist(), codes[keep].tolist())
+        ]
+
+    def time_in_status(
+        self, start: float, end: float, robot_ids: Optional[List[str]] = None
+    ) -> Dict[str, float]:
+        """Seconds spent in each status within [start, end].
+
+        Covers ``robot_ids`` (every recorded robot by default). Time before a
+        robot's oldest retained transition is not counted.
+        """
+        with self._lock:
+            ids = list(self._rings) if robot_ids is None else robot_ids
+            parts = [self._rings[i].ordered() for i in ids if i in self._rings]
+            statuses = list(self._statuses)
+        return sum_time_in_status(parts, statuses, start, end)
+
+
+def sum_time_in_status(
+    parts: List[Tuple[np.ndarray, np.ndarray]],
+    statuses: List[str],
+    start: float,
+    end: float,
+) -> Dict[str, float]:
+    """Seconds per status for the (times, codes) transitions of each robot."""
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return {}
+    times = np.concatenate([t for t, _ in parts])
+    codes = np.concatenate([c for _, c in parts])
+    # Each transition lasts until the next one of the same robot; a
+    # robot's last transition lasts until the end of the window
+    until = np.empty(len(times), dtype=np.float64)
+    until[:-1] = times[1:]
+    until[np.cumsum([len(t) for t, _ in parts]) - 1] = end
+    durations = np.minimum(until, end) - np.maximum(times, start)
+    np.clip(durations, 0, None, out=durations)
+    totals = np.bincount(codes, weights=durations, minlength=len(statuses))
+    return {
+        statuses[code]: float(seconds)
+        for code, seconds in enumerate(totals.tolist())
+        if seconds > 0
+    }
+
+
+class SqliteStatusHistory:
+    """Status transitions in a table of the shared SQLite robot database.
+
+    Keeps at most ``capacity`` transitions per robot, like the in-process
+    rings, but has no byte budget: the table lives on disk. A repeated status
+    is skipped in the same statement that inserts, so workers recording the
+    same robot concurrently never store it twice.
+    """
+
+    def __init__(self, path: str, capacity: int = 1024):
+        self.path = path
+        self.capacity = max(1, capacity)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS status_history ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " robot_id TEXT NOT NULL,"
+                " timestamp INTEGER NOT NULL,"
+                " status TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS status_history_robot"
+                " ON status_history (robot_id, seq)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS status_history_time"
+                " ON status_history (robot_id, timestamp)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return (
+            self._connect()
+            .execute("SELECT COUNT(DISTINCT robot_id) FROM status_history")
+            .fetchone()[0]
+        )
+
+    def record(self, robot_id: str, status: str, timestamp: float) -> None:
+        """Record that ``robot_id`` is in ``status`` from ``timestamp`` on."""
+        conn = self._connect()
+        with conn:
+            inserted = conn.execute(
+                "INSERT INTO status_history (robot_id, timestamp, status)"
+                " SELECT ?, ?, ? WHERE (SELECT status FROM status_history"
+                "  WHERE robot_id = ? ORDER BY seq DESC LIMIT 1) IS NOT ?",
+                (robot_id, int(timestamp), status, robot_id, status),
+            ).rowcount
+            if inserted:
+                # Drop the transitions beyond the newest ``capacity``
+                conn.execute(
+                    "DELETE FROM status_history WHERE robot_id = ? AND seq <="
+                    " (SELECT seq FROM status_history WHERE robot_id = ?"
+                    "  ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                    (robot_id, robot_id, self.capacity),
+                )
+
+    def clear(self) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM status_history")
+
+    def transitions(
+        self, robot_id: str, start: float = 0, end: Optional[float] = None
+    ) -> List[dict]:
+        """Transitions of ``robot_id`` within [start, end], oldest first."""
+        rows = self._connect().execute(
+            "SELECT timestamp, status FROM status_history"
+            " WHERE robot_id = ? AND timestamp >= ? ORDER BY seq",
+            (robot_id, start),
+        )
+        return [
+            {"timestamp": timestamp, "status": status}
+            for timestamp, status in rows
+            if end is None or timestamp <= end
+        ]
+
+    def time_in_status(
+        self, start: float, end: float, robot_ids: Optional[List[str]] = None
+    ) -> Dict[str, float]:
+        """Seconds spent in each status within [start, end].
+
+        Covers ``robot_ids`` (every recorded robot by default). Time before a
+        robot's oldest retained transition is not counted.
+        """
+        params: Dict[str, object] = {"start": start, "end": end}
+        robots = ""
+        if robot_ids is not None:
+            if not robot_ids:
+                return {}
+            names = [f"r{i}" for i in range(len(robot_ids))]
+            params.update(zip(names, robot_ids))
+            robots = f" AND h.robot_id IN ({', '.join(':' + n for n in names)})"
+        # Durations are summed in SQL. Only each robot's transitions from its
+        # last one at or before start up to end are read; each lasts until the
+        # robot's next one, or until end for its last one.
+        rows = self._connect().execute(
+            "SELECT status, SUM(MAX(0, COALESCE(until, :end) - MAX(since, :start)))"
+            " FROM (SELECT status, timestamp AS since,"
+            "  LEAD(timestamp) OVER (PARTITION BY robot_id ORDER BY seq) AS until"
+            "  FROM status_history AS h"
+            "  WHERE timestamp <= :end AND timestamp >= COALESCE("
+            "   (SELECT MAX(timestamp) FROM status_history"
+            "    WHERE robot_id = h.robot_id AND timestamp <= :start), :start)"
+            f"{robots})"
+            " GROUP BY status",
+            params,
+        )
+        return {status: float(seconds) for status, seconds in rows if seconds > 0}
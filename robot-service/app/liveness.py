@@ -0,0 +1,70 @@
+"""Heartbeat deadlines kept in a hashed timer wheel.
+
+Each heartbeat (re)schedules its robot's deadline ``timeout`` seconds ahead in
+the slot covering that time. Every tick, only the slots that have fully passed
+are examined, so detecting missed heartbeats costs work proportional to the
+heartbeats received, not to the fleet size. A rescheduled robot leaves a stale
+entry in its old slot, which is discarded when that slot expires because the
+robot's current deadline is later.
+"""
+
+import math
+import threading
+from typing import Dict, List, Set
+
+
+class TimerWheel:
+    def __init__(self, timeout: float, tick: float = 1.0, now: float = 0.0):
+        self.timeout = timeout
+        self.tick = tick
+        # Every deadline lies less than one rotation ahead of the cursor
+        self._slots: List[Set[str]] = [
+            set() for _ in range(int(math.ceil(timeout / tick)) + 2)
+        ]
+        self._deadlines: Dict[str, float] = {}
+        self._cursor = int(now // tick)  # next tick to expire
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, key: str, now: float) -> None:
+        deadline = now + self.timeout
+        with self._lock:
+            self._deadlines[key] = deadline
+            tick = max(int(deadline // self.tick), self._cursor)
+            self._slots[tick % len(self._slots)].add(key)
+
+    def advance(self, now: float) -> List[str]:
+        """Expire every slot that ended at or before ``now``; return the keys
+        whose deadline passed without being rescheduled.
+        """
+        expired = []
+        with self._lock:
+            target = int(now // self.tick)
+            # After a long pause, one pass over every slot is enough
+            start = max(self._cursor, target - len(self._slots))
+            size = len(self._slots)
+            for tick in range(start, target):
+                slot = self._slots[tick % size]
+                keep = set()
+                for key in slot:
+                    deadline = self._deadlines.get(key)
+                    if deadline is None:
+                        continue
+                    if deadline <= now:
+                        del self._deadlines[key]
+                        expired.append(key)
+                    elif int(deadline // self.tick) % size == tick % size:
+                        # Scheduled while the cursor lagged: a later rotation
+                        keep.add(key)
+                slot.clear()
+                slot |= keep
+            self._cursor = max(self._cursor, target)
+        return expired
+
+    def clear(self) -> None:
+        with self._lock:
+            for slot in self._slots:
+                slot.clear()
+            self._deadlines.clear()
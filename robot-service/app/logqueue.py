@@ -0,0 +1,125 @@
+"""Queue-based logging that keeps formatting and stdout writes off requests.
+
+Request handlers only put records on a bounded queue. A background thread
+drains it, formats the records and writes them in batches, so one write covers
+many lines. When the queue is full a record is dropped and counted instead of
+blocking the event loop. Records logged with ``extra={"sampled": True}`` are
+high-frequency info lines; only one in every ``sample_every`` is kept.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler
+from typing import Optional
+
+from prometheus_client import Counter
+
+log_records_dropped = Counter(
+    "log_records_dropped_total",
+    "Log records discarded before being written",
+    ["reason"],
+)
+
+_STOP = object()
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in every ``every`` sampled records at INFO or below."""
+
+    def __init__(self, every: int = 1):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or record.levelno > logging.INFO:
+            return True
+        if not getattr(record, "sampled", False):
+            return True
+        with self._lock:
+            self._seen += 1
+            keep = (self._seen - 1) % self.every == 0
+        if not keep:
+            log_records_dropped.labels(reason="sampled").inc()
+        return keep
+
+
+class DroppingQueueHandler(QueueHandler):
+    """A QueueHandler that drops records instead of blocking on a full queue."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the writer thread; only freeze the message so
+        # later changes to the arguments cannot alter it.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.labels(reason="queue_full").inc()
+
+
+class BatchWriter(threading.Thread):
+    """Format queued records and write them to ``stream`` in batches."""
+
+    def __init__(self, records: queue.Queue, stream, formatter, batch_size=256):
+        super().__init__(name="log-writer", daemon=True)
+        self.records = records
+        self.stream = stream
+        self.formatter = formatter
+        self.batch_size = batch_size
+
+    def run(self) -> None:
+        while True:
+            batch = [self.records.get()]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
+            lines = []
+            for record in batch:
+                try:
+                    lines.append(self.formatter.format(record))
+                except Exception:
+                    log_records_dropped.labels(reason="format_error").inc()
+            if lines:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            if stopping:
+                return
+
+    def stop(self) -> None:
+        """Write out everything queued so far, then exit."""
+        self.records.put(_STOP)
+        self.join()
+
+
+def install_queue_logging(
+    logger: logging.Logger,
+    stream,
+    formatter: logging.Formatter,
+    queue_size: int = 10_000,
+    batch_size: int = 256,
+    sample_every: int = 1,
+    level: Optional[int] = logging.INFO,
+) -> BatchWriter:
+    """Route ``logger`` through a bounded queue to a batching writer thread."""
+    records: queue.Queue = queue.Queue(maxsize=queue_size)
+    handler = DroppingQueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_every))
+    logger.handlers = [handler]
+    if level is not None:
+        logger.setLevel(level)
+    writer = BatchWriter(records, stream, formatter, batch_size)
+    writer.start()
+    atexit.register(writer.stop)
+    return writer
@@ -1,16 +1,30 @@
+import asyncio
 import json
 import logging
+import os
 import sys
-from typing import List
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 import uvicorn
-from app.models import Robot, RobotUpdate
-from fastapi import FastAPI, HTTPException
+from app.admission import AdmissionController, AdmissionMiddleware, CostClass
+from app.compression import CompressionMiddleware
+from app.export import ENCODERS, MEDIA_TYPES, available_formats
+from app.exposition import ExpositionCache
+from app.history import SqliteStatusHistory, StatusHistory
+from app.instrumentation import PrometheusMiddleware, RequestMetrics
+from app.liveness import TimerWheel
+from app.logqueue import install_queue_logging
+from app.models import (FleetStatusSummary, HeartbeatBatch, HeartbeatResult,
+                        Robot, RobotHistory, RobotLiveness, RobotUpdate)
+from app.profiling import install_profiling
+from app.store import OFFLINE, MemoryRobotStore, SqliteRobotStore, create_store
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from prometheus_client import (CONTENT_TYPE_LATEST, Counter, Gauge, Histogram,
-                               generate_latest)
-from pydantic import BaseModel
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import (REGISTRY, CollectorRegistry, Counter, Gauge,
+                               multiprocess)
 
 
 # Create a custom formatter for JSON logs
@@ -31,13 +45,52 @@ class JsonFormatter(logging.Formatter):
         return json.dumps(log_record)
 
 
-# Configure logging
-handler = logging.StreamHandler(sys.stdout)
-handler.setFormatter(JsonFormatter())
-logging.basicConfig(level=logging.INFO, handlers=[handler])
+# Configure logging. Records are queued and written to stdout in batches by a
+# background thread; LOG_SAMPLE_EVERY=N keeps one in N high-frequency lines.
+log_writer = install_queue_logging(
+    logging.getLogger(),
+    sys.stdout,
+    JsonFormatter(),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("LOG_BATCH_SIZE", "256")),
+    sample_every=int(os.getenv("LOG_SAMPLE_EVERY", "1")),
+)
 logger = logging.getLogger("robot-service")
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    seed_heartbeats()
+    watcher = asyncio.create_task(watch_heartbeats())
+    yield
+    watcher.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Admission control. Requests run within per-class concurrency limits and wait
+# in a bounded queue; past their class's wait budget they are shed with 503 and
+# Retry-After. Added before CORS so that shed responses carry CORS headers too.
+# Fleet-wide history summaries are the expensive class.
+admission = AdmissionController(
+    [
+        CostClass(
+            "default",
+            limit=int(os.getenv("ADMISSION_CONCURRENCY", "64")),
+            queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "256")),
+            max_wait=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "1")),
+        ),
+        CostClass(
+            "heavy",
+            limit=int(os.getenv("ADMISSION_HEAVY_CONCURRENCY", "2")),
+            queue_size=int(os.getenv("ADMISSION_HEAVY_QUEUE_SIZE", "8")),
+            max_wait=float(os.getenv("ADMISSION_HEAVY_MAX_WAIT_SECONDS", "2")),
+        ),
+    ],
+    routes={"/robots/history/summary": "heavy", "/robots/export": "heavy"},
+    prefix="",
+)
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
 app.add_middleware(
     CORSMiddleware,
@@ -47,56 +100,277 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Use list for database
-robots_db = []
+# Opt-in request profiling, served from /admin/profiles. Nothing is installed
+# unless PROFILING_ENABLED is set. Reading profiles, and asking for one with
+# X-Profile, need an X-Profile-Token header equal to PROFILING_TOKEN.
+if os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true"):
+    install_profiling(
+        app,
+        sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+        interval=float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.005")),
+        capacity=int(os.getenv("PROFILING_MAX_PROFILES", "50")),
+        token=os.getenv("PROFILING_TOKEN") or None,
+    )
+
+# Robot store. The default keeps robots in this process; with several workers
+# set ROBOT_SERVICE_STORE=sqlite:///<path> so that they all share one fleet.
+robots_db = create_store()
+
+# Status transitions per robot. With the SQLite store they go to a table of the
+# same database, so every worker records into and reads from one history;
+# otherwise they are kept in this process within a fixed budget.
+HISTORY_CAPACITY = int(os.getenv("ROBOT_HISTORY_CAPACITY", "1024"))
+if isinstance(robots_db, SqliteRobotStore):
+    status_history = SqliteStatusHistory(robots_db.path, capacity=HISTORY_CAPACITY)
+else:
+    status_history = StatusHistory(
+        capacity=HISTORY_CAPACITY,
+        budget_bytes=int(
+            os.getenv("ROBOT_HISTORY_BUDGET_BYTES", str(64 * 1024 * 1024))
+        ),
+    )
+HISTORY_DEFAULT_WINDOW_SECONDS = 24 * 3600
+
+# With several workers, each process writes its samples to
+# PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
 
 robot_added_counter = Counter("robots_added_total", "Total robots added")
-request_duration = Histogram(
-    "request_duration_seconds", "Request duration in seconds", ["endpoint"]
+# Compress responses of at least COMPRESSION_MIN_BYTES for clients that accept
+# gzip (or zstd/brotli when installed). Inside the metrics middleware, so that
+# response sizes are recorded as sent.
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")),
 )
-robots_total = Gauge("robots_total", "Total number of robots", ["status"])
+
+# Request duration, size and in-flight metrics per route template
+http_metrics = RequestMetrics()
+request_duration = http_metrics.duration
+app.add_middleware(PrometheusMiddleware, metrics=http_metrics)
+
+# Set from the shared store after each write, so the most recent value from any
+# worker is the fleet-wide count.
+robots_total = Gauge(
+    "robots_total",
+    "Total number of robots",
+    ["status"],
+    multiprocess_mode="mostrecent",
+)
+
+
+def refresh_robots_total():
+    counts = robots_db.count_by_status()
+    for sample in robots_total.collect()[0].samples:
+        status = sample.labels["status"]
+        if status not in counts:
+            robots_total.labels(status=status).set(0)
+    for status, count in counts.items():
+        robots_total.labels(status=status).set(count)
+
+
+# Robots that miss heartbeats for HEARTBEAT_TIMEOUT_SECONDS are marked offline.
+HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("HEARTBEAT_TIMEOUT_SECONDS", "15"))
+HEARTBEAT_TICK_SECONDS = float(os.getenv("HEARTBEAT_TICK_SECONDS", "1"))
+heartbeat_wheel = TimerWheel(
+    HEARTBEAT_TIMEOUT_SECONDS, HEARTBEAT_TICK_SECONDS, now=time.time()
+)
+heartbeats_received = Counter("robot_heartbeats_total", "Robot heartbeats received")
+robots_marked_offline = Counter(
+    "robots_marked_offline_total", "Robots marked offline after missed heartbeats"
+)
+
+
+def seed_heartbeats() -> None:
+    """Schedule every robot seen before this process started.
+
+    The wheel lives in memory, so without this a robot that stops beating
+    across a restart would never be marked offline.
+    """
+    for robot_id, seen in robots_db.last_seen().items():
+        heartbeat_wheel.schedule(robot_id, seen)
+
+
+def expire_heartbeats(now: float) -> List[str]:
+    """Mark robots whose heartbeat deadline passed as offline."""
+    expired = heartbeat_wheel.advance(now)
+    if not expired:
+        return []
+    # The store checks last_seen, so a beat taken by another worker still counts
+    marked = robots_db.mark_offline(expired, now - HEARTBEAT_TIMEOUT_SECONDS)
+    if marked:
+        for robot_id in marked:
+            status_history.record(robot_id, OFFLINE, now)
+        robots_marked_offline.inc(len(marked))
+        refresh_robots_total()
+        logger.warning(f"Robots offline after missed heartbeats: {len(marked)}")
+    return marked
+
+
+async def watch_heartbeats():
+    while True:
+        await asyncio.sleep(HEARTBEAT_TICK_SECONDS)
+        try:
+            expire_heartbeats(time.time())
+        except Exception as e:
+            logger.error(f"Heartbeat expiry failed: {e}")
 
 
 @app.get("/robots", response_model=List[Robot])
 async def get_robots():
-    with request_duration.labels(endpoint="/robots").time():
-        logger.info("Fetching all robots")
-        return robots_db
+    logger.info("Fetching all robots", extra={"sampled": True})
+    return robots_db.list()
+
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+
+
+@app.get("/robots/export")
+def export_robots(format: str = "ndjson"):
+    """Stream the fleet as of the request in NDJSON, CSV or Arrow IPC format."""
+    if format not in available_formats():
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported format {format!r}; use one of {available_formats()}",
+        )
+    chunks = robots_db.export_rows(EXPORT_CHUNK_ROWS)
+    extension = "arrows" if format == "arrow" else format
+    return StreamingResponse(
+        ENCODERS[format](chunks),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="robots.{extension}"'
+        },
+    )
 
 
 @app.post("/robots", response_model=Robot)
 async def add_robot(robot: Robot):
-    with request_duration.labels(endpoint="/robots").time():
-        if any(r.id == robot.id for r in robots_db):
-            logger.error(f"Robot with ID {robot.id} already exists")
-            raise HTTPException(status_code=400, detail="Robot ID already exists")
-        robots_db.append(robot)
-        robot_added_counter.inc()
-        robots_total.labels(status=robot.status).inc()
-        extra = {"robot_id": robot.id, "status": robot.status}
-        logger.info(f"Added robot: {robot.id}", extra=extra)
-        return robot
+    if not robots_db.add(robot):
+        logger.error(f"Robot with ID {robot.id} already exists")
+        raise HTTPException(status_code=400, detail="Robot ID already exists")
+    robot_added_counter.inc()
+    status_history.record(robot.id, robot.status, time.time())
+    refresh_robots_total()
+    extra = {"robot_id": robot.id, "status": robot.status}
+    logger.info(f"Added robot: {robot.id}", extra=extra)
+    return robot
 
 
 @app.patch("/robot/{robot_id}", response_model=Robot)
 async def update_robot(robot_id: str, update: RobotUpdate):
-    with request_duration.labels(endpoint="/robot").time():
-        for robot in robots_db:
-            if robot.id == robot_id:
-                if update.name:
-                    robot.name = update.name
-                if update.status:
-                    robot.status = update.status
-                logger.info(f"Updated robot: {robot_id}")
-                return robot
+    robot = robots_db.update(robot_id, name=update.name, status=update.status)
+    if robot is None:
         logger.error(f"Robot with ID {robot_id} not found")
         raise HTTPException(status_code=404, detail="Robot not found")
+    if update.status:
+        status_history.record(robot_id, update.status, time.time())
+        refresh_robots_total()
+    logger.info(f"Updated robot: {robot_id}")
+    return robot
+
+
+@app.post("/robots/heartbeats", response_model=HeartbeatResult)
+async def record_heartbeats(batch: HeartbeatBatch):
+    """Record a batch of heartbeats; the last one per robot wins."""
+    now = time.time()
+    beats = {}
+    for beat in batch.heartbeats:
+        beats[beat.id] = beat.status or beats.get(beat.id)
+    unknown, changed = robots_db.record_heartbeats(beats, now)
+    missing = set(unknown)
+    for robot_id in beats:
+        if robot_id not in missing:
+            heartbeat_wheel.schedule(robot_id, now)
+    heartbeats_received.inc(len(batch.heartbeats))
+    if changed:
+        for robot_id, status in changed.items():
+            status_history.record(robot_id, status, now)
+        refresh_robots_total()
+    return {"accepted": len(beats) - len(unknown), "unknown": unknown}
+
+
+@app.get("/robots/heartbeats", response_model=List[RobotLiveness])
+async def get_heartbeats():
+    last_seen = robots_db.last_seen()
+    return [
+        RobotLiveness(id=r.id, status=r.status, last_seen=last_seen.get(r.id))
+        for r in robots_db.list()
+    ]
+
+
+def history_window(start: Optional[float], end: Optional[float]):
+    end = time.time() if end is None else end
+    start = end - HISTORY_DEFAULT_WINDOW_SECONDS if start is None else start
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+
+@app.get("/robot/{robot_id}/history", response_model=RobotHistory)
+async def get_robot_history(
+    robot_id: str, start: Optional[float] = None, end: Optional[float] = None
+):
+    """Status transitions of one robot and its time in each status, over the
+    last 24 hours unless a window is given.
+    """
+    if robots_db.get(robot_id) is None:
+        raise HTTPException(status_code=404, detail="Robot not found")
+    start, end = history_window(start, end)
+    return RobotHistory(
+        id=robot_id,
+        start=start,
+        end=end,
+        transitions=status_history.transitions(robot_id, start, end),
+        time_in_status=status_history.time_in_status(start, end, [robot_id]),
+    )
+
+
+@app.get("/robots/history/summary", response_model=FleetStatusSummary)
+async def get_fleet_history_summary(
+    start: Optional[float] = None, end: Optional[float] = None
+):
+    """Robot-seconds spent in each status across the fleet."""
+    start, end = history_window(start, end)
+    return FleetStatusSummary(
+        start=start,
+        end=end,
+        robots=len(status_history),
+        time_in_status=status_history.time_in_status(start, end),
+    )
+
+
+def metrics_registry():
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+# Scrapes within METRICS_CACHE_SECONDS of a render are served the same bytes;
+# 0 renders on every scrape.
+metrics_cache = ExpositionCache(
+    ttl=float(os.getenv("METRICS_CACHE_SECONDS", "0")),
+    registry_factory=metrics_registry,
+)
 
 
 @app.get("/metrics")
-def metrics():
-    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+def metrics(request: Request):
+    body, media_type, headers = metrics_cache.response_parts(
+        request.headers.get("accept", ""), request.headers.get("accept-encoding", "")
+    )
+    return Response(content=body, media_type=media_type, headers=headers)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1 and isinstance(robots_db, MemoryRobotStore):
+        raise SystemExit(
+            "WEB_CONCURRENCY > 1 needs a shared store, "
+            "e.g. ROBOT_SERVICE_STORE=sqlite:////dev/shm/robots.db"
+        )
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8080, workers=workers)
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, field_validator
 
@@ -26,3 +26,50 @@ class RobotUpdate(BaseModel):
         if v is not None and (not v or not v.strip()):
             raise ValueError("Field cannot be empty or whitespace")
         return v
+
+
+class Heartbeat(BaseModel):
+    id: str
+    status: Optional[str] = None
+
+    @field_validator("status")
+    @classmethod
+    def validate_not_empty(cls, v):
+        if v is not None and (not v or not v.strip()):
+            raise ValueError("Field cannot be empty or whitespace")
+        return v
+
+
+class HeartbeatBatch(BaseModel):
+    heartbeats: List[Heartbeat]
+
+
+class HeartbeatResult(BaseModel):
+    accepted: int
+    unknown: List[str]
+
+
+class RobotLiveness(BaseModel):
+    id: str
+    status: str
+    last_seen: Optional[float] = None
+
+
+class StatusTransition(BaseModel):
+    timestamp: int
+    status: str
+
+
+class RobotHistory(BaseModel):
+    id: str
+    start: float
+    end: float
+    transitions: List[StatusTransition]
+    time_in_status: Dict[str, float]
+
+
+class FleetStatusSummary(BaseModel):
+    start: float
+    end: float
+    robots: int
+    time_in_status: Dict[str, float]
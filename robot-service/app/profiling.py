@@ -0,0 +1,224 @@
+"""Opt-in request profiling.
+
+A raw ASGI middleware profiles a sampled fraction of requests, plus any request
+sent with ``X-Profile: 1``. While a profiled request runs, a background thread
+samples the stacks of the other threads every ``interval`` seconds. The
+profiles are kept in a bounded in-memory store and served as collapsed stacks
+(``frame;frame;frame count``), which flamegraph.pl and speedscope read directly.
+
+Nothing is installed unless profiling is enabled, so the disabled cost is zero.
+Reading profiles and flagging requests with ``X-Profile`` both need the
+``X-Profile-Token`` header to match the configured token; with no token, only
+sampled requests are profiled and the profiles cannot be read.
+Samples cover every thread, so concurrent requests show up in each other's
+profiles; prefer header-flagged requests on a quiet replica for clean output.
+"""
+
+import asyncio
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+PROFILE_HEADER = b"x-profile"
+TOKEN_HEADER = b"x-profile-token"
+
+
+def token_matches(token: Optional[str], given: Optional[str]) -> bool:
+    return bool(token) and given is not None and hmac.compare_digest(token, given)
+
+
+def collapse(frame) -> str:
+    """Render a frame and its callers as one collapsed-stack line, root first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """Sample every other thread's stack until stopped."""
+
+    def __init__(self, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop_event.is_set():
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                thread_name = names.get(ident, str(ident))
+                self.samples[f"{thread_name};{collapse(frame)}"] += 1
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+class Profile:
+    __slots__ = ("id", "method", "path", "status", "started", "duration", "samples")
+
+    def __init__(self, profile_id, method, path, started):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started = started
+        self.duration = 0.0
+        self.samples: Counter = Counter()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started": self.started,
+            "duration_seconds": round(self.duration, 6),
+            "samples": sum(self.samples.values()),
+        }
+
+    def collapsed(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+
+class ProfileStore:
+    """The most recent ``capacity`` profiles."""
+
+    def __init__(self, capacity: int = 50):
+        self._profiles: Deque[Profile] = deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self) -> str:
+        return str(next(self._ids))
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[Profile]:
+        with self._lock:
+            return list(self._profiles)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        for profile in self.list():
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+
+
+class ProfilingMiddleware:
+    def __init__(
+        self,
+        app,
+        store: ProfileStore,
+        sample_rate=0.0,
+        interval=0.005,
+        token: Optional[str] = None,
+    ):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.token = token
+
+    def wants_profile(self, scope) -> bool:
+        headers = dict(scope.get("headers", ()))
+        flag = headers.get(PROFILE_HEADER)
+        given = headers.get(TOKEN_HEADER)
+        if flag is not None and token_matches(
+            self.token, given.decode("latin-1") if given is not None else None
+        ):
+            return flag in (b"1", b"true")
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(
+            self.store.next_id(), scope["method"], scope["path"], time.time()
+        )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler = StackSampler(self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration = time.perf_counter() - started
+            # Joins the sampler thread, so off the event loop
+            profile.samples = await asyncio.to_thread(sampler.stop)
+            self.store.add(profile)
+
+
+def install_profiling(
+    app, sample_rate=0.0, interval=0.005, capacity=50, token: Optional[str] = None
+):
+    """Add the profiling middleware and its admin endpoints to ``app``.
+
+    The endpoints answer 403 unless the request's X-Profile-Token is ``token``.
+    """
+    store = ProfileStore(capacity)
+
+    def require_token(x_profile_token: Optional[str] = Header(None)):
+        if not token_matches(token, x_profile_token):
+            raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+    router = APIRouter(prefix="/admin/profiles", dependencies=[Depends(require_token)])
+
+    @router.get("")
+    def list_profiles() -> Dict[str, list]:
+        return {"profiles": [p.summary() for p in reversed(store.list())]}
+
+    @router.get("/{profile_id}", response_class=PlainTextResponse)
+    def get_profile(profile_id: str):
+        profile = store.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return profile.collapsed()
+
+    app.include_router(router)
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=store,
+        sample_rate=sample_rate,
+        interval=interval,
+        token=token,
+    )
+    return store
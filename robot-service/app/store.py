@@ -0,0 +1,341 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.models import Robot
+
+OFFLINE = "offline"
+# Status given to an offline robot that heartbeats again without a status
+ONLINE = "active"
+
+
+class MemoryRobotStore:
+    """Robots held in this process, indexed by id in insertion order."""
+
+    def __init__(self):
+        self._robots: Dict[str, Robot] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[Robot]:
+        return iter(self.list())
+
+    def __len__(self) -> int:
+        return len(self._robots)
+
+    def list(self) -> List[Robot]:
+        return list(self._robots.values())
+
+    def get(self, robot_id: str) -> Optional[Robot]:
+        return self._robots.get(robot_id)
+
+    def add(self, robot: Robot) -> bool:
+        """Add a robot. Returns False if the id is already taken."""
+        with self._lock:
+            if robot.id in self._robots:
+                return False
+            self._robots[robot.id] = robot
+            return True
+
+    def update(
+        self, robot_id: str, name: Optional[str] = None, status: Optional[str] = None
+    ) -> Optional[Robot]:
+        with self._lock:
+            robot = self._robots.get(robot_id)
+            if robot is None:
+                return None
+            if name:
+                robot.name = name
+            if status:
+                robot.status = status
+            return robot
+
+    def record_heartbeats(
+        self, beats: Dict[str, Optional[str]], seen: float
+    ) -> Tuple[List[str], Dict[str, str]]:
+        """Apply the latest heartbeat of each robot seen at ``seen``.
+
+        Returns the unknown robot ids and the new status of each robot whose
+        status changed.
+        """
+        unknown = []
+        changed: Dict[str, str] = {}
+        with self._lock:
+            for robot_id, status in beats.items():
+                robot = self._robots.get(robot_id)
+                if robot is None:
+                    unknown.append(robot_id)
+                    continue
+                status = status or (ONLINE if robot.status == OFFLINE else None)
+                if status and status != robot.status:
+                    robot.status = status
+                    changed[robot_id] = status
+                self._last_seen[robot_id] = seen
+        return unknown, changed
+
+    def mark_offline(self, robot_ids: Iterable[str], cutoff: float) -> List[str]:
+        """Mark the given robots offline unless seen at or after ``cutoff``."""
+        marked = []
+        with self._lock:
+            for robot_id in robot_ids:
+                robot = self._robots.get(robot_id)
+                if robot is None or robot.status == OFFLINE:
+                    continue
+                if self._last_seen.get(robot_id, cutoff) < cutoff:
+                    robot.status = OFFLINE
+                    marked.append(robot_id)
+        return marked
+
+    def last_seen(self) -> Dict[str, float]:
+        return dict(self._last_seen)
+
+    def export_rows(self, chunk_size: int = 1000) -> Iterator[List[Tuple]]:
+        """(id, name, status, last_seen) rows in chunks of ``chunk_size``.
+
+        The robot ids are taken when iteration starts, so robots added later
+        are left out; each chunk's rows are read as that chunk is produced.
+        """
+        with self._lock:
+            robot_ids = list(self._robots)
+        for start in range(0, len(robot_ids), chunk_size):
+            with self._lock:
+                chunk = robot_ids[start : start + chunk_size]
+                robots = (self._robots.get(robot_id) for robot_id in chunk)
+                rows = [
+                    (r.id, r.name, r.status, self._last_seen.get(r.id))
+                    for r in robots
+                    if r is not None
+                ]
+            if rows:
+                yield rows
+
+    def count_by_status(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for robot in self.list():
+            counts[robot.status] = counts.get(robot.status, 0) + 1
+        return counts
+
+    def clear(self) -> None:
+        with self._lock:
+            self._robots.clear()
+            self._last_seen.clear()
+
+
+class SqliteRobotStore:
+    """Robots in a SQLite database shared by every worker process.
+
+    Point all workers at the same file (for example under /dev/shm) and each
+    sees one consistent fleet. SQLite serializes writers; readers run in
+    parallel in WAL mode. Each process caches the fleet and revalidates it
+    with ``PRAGMA data_version``, which changes when another connection
+    commits, so repeated reads cost one pragma instead of a table scan. The
+    counter is only comparable on one connection, so it is always read on a
+    dedicated one that never writes and so sees every thread's commits.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache: Optional[List[Robot]] = None
+        self._cache_version: Optional[int] = None
+        self._version_conn = sqlite3.connect(path, check_same_thread=False)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS robots ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " id TEXT NOT NULL UNIQUE,"
+                " name TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " last_seen REAL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(robots)")}
+            if "last_seen" not in columns:
+                conn.execute("ALTER TABLE robots ADD COLUMN last_seen REAL")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _data_version(self) -> int:
+        # Callers hold self._lock
+        return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def __iter__(self) -> Iterator[Robot]:
+        return iter(self.list())
+
+    def __len__(self) -> int:
+        return len(self.list())
+
+    def list(self) -> List[Robot]:
+        with self._lock:
+            # Read before the rows, so the rows are never older than the version
+            version = self._data_version()
+            if self._cache is not None and self._cache_version == version:
+                return list(self._cache)
+        rows = self._connect().execute(
+            "SELECT id, name, status FROM robots ORDER BY seq"
+        )
+        robots = [
+            Robot.model_construct(id=row[0], name=row[1], status=row[2]) for row in rows
+        ]
+        with self._lock:
+            self._cache, self._cache_version = robots, version
+        return list(robots)
+
+    def get(self, robot_id: str) -> Optional[Robot]:
+        row = (
+            self._connect()
+            .execute("SELECT id, name, status FROM robots WHERE id = ?", (robot_id,))
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return Robot.model_construct(id=row[0], name=row[1], status=row[2])
+
+    def _invalidate(self) -> None:
+        # Drop the fleet now rather than at the next version check
+        with self._lock:
+            self._cache = None
+
+    def add(self, robot: Robot) -> bool:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO robots (id, name, status) VALUES (?, ?, ?)",
+                    (robot.id, robot.name, robot.status),
+                )
+        except sqlite3.IntegrityError:
+            return False
+        self._invalidate()
+        return True
+
+    def update(
+        self, robot_id: str, name: Optional[str] = None, status: Optional[str] = None
+    ) -> Optional[Robot]:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE robots SET name = COALESCE(?, name),"
+                " status = COALESCE(?, status) WHERE id = ?",
+                (name or None, status or None, robot_id),
+            )
+            if cursor.rowcount == 0:
+                return None
+            row = conn.execute(
+                "SELECT id, name, status FROM robots WHERE id = ?", (robot_id,)
+            ).fetchone()
+        self._invalidate()
+        return Robot.model_construct(id=row[0], name=row[1], status=row[2])
+
+    def record_heartbeats(
+        self, beats: Dict[str, Optional[str]], seen: float
+    ) -> Tuple[List[str], Dict[str, str]]:
+        conn = self._connect()
+        ids = list(beats)
+        current: Dict[str, str] = {}
+        changed: Dict[str, str] = {}
+        with conn:
+            # Take the write lock before reading, so that an update from another
+            # worker cannot land between the read and the write below
+            conn.execute("BEGIN IMMEDIATE")
+            # Stay below SQLite's default limit of 999 bound parameters
+            for i in range(0, len(ids), 900):
+                chunk = ids[i : i + 900]
+                rows = conn.execute(
+                    "SELECT id, status FROM robots WHERE id IN"
+                    f" ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                current.update(rows)
+            for robot_id, old in current.items():
+                status = beats[robot_id] or (ONLINE if old == OFFLINE else old)
+                if status != old:
+                    changed[robot_id] = status
+            conn.executemany(
+                "UPDATE robots SET status = ? WHERE id = ?",
+                [(status, robot_id) for robot_id, status in changed.items()],
+            )
+            conn.executemany(
+                "UPDATE robots SET last_seen = ? WHERE id = ?",
+                [(seen, robot_id) for robot_id in current],
+            )
+        unknown = [robot_id for robot_id in ids if robot_id not in current]
+        if changed:
+            self._invalidate()
+        return unknown, changed
+
+    def mark_offline(self, robot_ids: Iterable[str], cutoff: float) -> List[str]:
+        conn = self._connect()
+        ids = list(robot_ids)
+        marked: List[str] = []
+        with conn:
+            for i in range(0, len(ids), 900):
+                chunk = ids[i : i + 900]
+                # last_seen is shared, so a beat taken by another worker counts
+                rows = conn.execute(
+                    "UPDATE robots SET status = ? WHERE status != ?"
+                    " AND last_seen < ?"
+                    f" AND id IN ({','.join('?' * len(chunk))}) RETURNING id",
+                    [OFFLINE, OFFLINE, cutoff, *chunk],
+                )
+                marked.extend(row[0] for row in rows)
+        if marked:
+            self._invalidate()
+        return marked
+
+    def last_seen(self) -> Dict[str, float]:
+        rows = self._connect().execute(
+            "SELECT id, last_seen FROM robots WHERE last_seen IS NOT NULL"
+        )
+        return dict(rows.fetchall())
+
+    def export_rows(self, chunk_size: int = 1000) -> Iterator[List[Tuple]]:
+        # A read transaction on its own connection pins the snapshot in WAL mode
+        # while writers carry on; the rows are read a chunk at a time. The
+        # connection is only opened once iteration starts, so an export that is
+        # never read holds nothing open.
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        try:
+            conn.isolation_level = None
+            conn.execute("BEGIN")
+            cursor = conn.execute(
+                "SELECT id, name, status, last_seen FROM robots ORDER BY seq"
+            )
+            rows = cursor.fetchmany(chunk_size)
+            while rows:
+                yield rows
+                rows = cursor.fetchmany(chunk_size)
+        finally:
+            conn.close()
+
+    def count_by_status(self) -> Dict[str, int]:
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) FROM robots GROUP BY status"
+        )
+        return {status: count for status, count in rows}
+
+    def clear(self) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM robots")
+        self._invalidate()
+
+
+def create_store(url: Optional[str] = None):
+    """Create the robot store named by ``url`` (``memory`` or
+    ``sqlite:///path/to/robots.db``), defaulting to $ROBOT_SERVICE_STORE.
+    """
+    url = url or os.getenv("ROBOT_SERVICE_STORE", "memory")
+    if url == "memory":
+        return MemoryRobotStore()
+    if url.startswith("sqlite:///"):
+        return SqliteRobotStore(url[len("sqlite:///") :])
+    raise ValueError(f"Unsupported ROBOT_SERVICE_STORE: {url}")
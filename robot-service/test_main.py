@@ -1,4 +1,5 @@
 import pytest
+from app import main
 from app.main import app
 from fastapi.testclient import TestClient
 
@@ -82,3 +83,230 @@ def test_metrics_endpoint():
 
     response = client.get("/metrics")
     assert "robots_added_total" in response.text
+
+
+def test_request_profiling():
+    import time
+
+    from app.profiling import install_profiling
+    from fastapi import FastAPI
+
+    profiled_app = FastAPI()
+
+    @profiled_app.get("/slow")
+    def slow():
+        time.sleep(0.05)
+        return {"ok": True}
+
+    store = install_profiling(
+        profiled_app, sample_rate=0.0, interval=0.001, token="secret"
+    )
+    profiled_client = TestClient(profiled_app)
+    token = {"X-Profile-Token": "secret"}
+
+    # Not sampled and not flagged: no profile is taken
+    assert "x-profile-id" not in profiled_client.get("/slow").headers
+    # Flagged without the token: ignored
+    response = profiled_client.get("/slow", headers={"X-Profile": "1"})
+    assert "x-profile-id" not in response.headers
+    assert store.list() == []
+
+    response = profiled_client.get("/slow", headers={"X-Profile": "1", **token})
+    profile_id = response.headers["x-profile-id"]
+
+    assert profiled_client.get("/admin/profiles").status_code == 403
+    wrong = {"X-Profile-Token": "guess"}
+    assert profiled_client.get("/admin/profiles", headers=wrong).status_code == 403
+    summaries = profiled_client.get("/admin/profiles", headers=token).json()
+    assert summaries["profiles"][0]["id"] == profile_id
+    assert summaries["profiles"][0]["path"] == "/slow"
+    assert summaries["profiles"][0]["status"] == 200
+
+    collapsed = profiled_client.get(f"/admin/profiles/{profile_id}", headers=token)
+    assert "slow (test_main.py:" in collapsed.text
+    missing = profiled_client.get("/admin/profiles/missing", headers=token)
+    assert missing.status_code == 404
+
+
+def test_request_metrics_by_route_and_status():
+    client.patch("/robot/missing", json={"status": "inactive"})
+    client.post("/robots", json={"id": "", "name": "x", "status": "active"})
+    client.get("/no-such-path")
+    client.request("FOO", "/robots")
+
+    text = client.get("/metrics").text
+    assert (
+        'request_duration_seconds_count{endpoint="/robot/{robot_id}",'
+        'method="PATCH",status_class="4xx"}'
+    ) in text
+    assert (
+        'request_duration_seconds_count{endpoint="/robots",'
+        'method="POST",status_class="4xx"}'
+    ) in text
+    assert 'endpoint="unmatched"' in text
+    assert "response_size_bytes_bucket" in text
+    assert 'requests_in_flight{method="GET"}' in text
+    assert 'method="other"' in text
+    assert 'method="FOO"' not in text
+
+    # /metrics itself is measured too
+    text = client.get("/metrics").text
+    assert 'request_duration_seconds_count{endpoint="/metrics"' in text
+
+
+def test_metrics_negotiates_openmetrics_and_gzip(monkeypatch):
+    response = client.get("/metrics", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+
+    response = client.get(
+        "/metrics",
+        headers={"Accept": "application/openmetrics-text", "Accept-Encoding": "gzip"},
+    )
+    assert response.headers["content-type"].startswith("application/openmetrics-text")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text.endswith("# EOF\n")
+    assert "robots_added_total" in response.text
+
+    # Within the cache interval every scrape is served the same render
+    now = [100.0]
+    monkeypatch.setattr(main.metrics_cache, "ttl", 10.0)
+    monkeypatch.setattr(main.metrics_cache, "clock", lambda: now[0])
+    monkeypatch.setattr(main.metrics_cache, "_entries", {})
+    first = client.get("/metrics").text
+    client.post("/robots", json={"id": "cached", "name": "c", "status": "active"})
+    assert client.get("/metrics").text == first
+    now[0] += 10.0
+    assert client.get("/metrics").text != first
+
+
+def test_heartbeats_mark_missing_robots_offline(monkeypatch):
+    for robot_id in ("h1", "h2"):
+        client.post(
+            "/robots", json={"id": robot_id, "name": robot_id, "status": "active"}
+        )
+    monkeypatch.setattr(main, "heartbeat_wheel", main.TimerWheel(10, 1, now=1000))
+    monkeypatch.setattr(main, "HEARTBEAT_TIMEOUT_SECONDS", 10)
+    monkeypatch.setattr(main.time, "time", lambda: 1000.0)
+
+    batch = {
+        "heartbeats": [
+            {"id": "h1"},
+            {"id": "h2", "status": "charging"},
+            {"id": "h2"},
+            {"id": "ghost"},
+        ]
+    }
+    response = client.post("/robots/heartbeats", json=batch)
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 2, "unknown": ["ghost"]}
+
+    monkeypatch.setattr(main.time, "time", lambda: 1005.0)
+    client.post("/robots/heartbeats", json={"heartbeats": [{"id": "h2"}]})
+    assert main.expire_heartbeats(1012.0) == ["h1"]
+
+    liveness = {r["id"]: r for r in client.get("/robots/heartbeats").json()}
+    assert liveness["h1"] == {"id": "h1", "status": "offline", "last_seen": 1000.0}
+    assert liveness["h2"]["status"] == "charging"
+    assert liveness["h2"]["last_seen"] == 1005.0
+    assert 'robots_total{status="offline"} 1.0' in client.get("/metrics").text
+
+
+def test_heartbeat_deadlines_are_seeded_from_the_store(monkeypatch):
+    for robot_id in ("s1", "s2"):
+        client.post(
+            "/robots", json={"id": robot_id, "name": robot_id, "status": "active"}
+        )
+    main.robots_db.record_heartbeats({"s1": None, "s2": None}, seen=1000.0)
+    main.robots_db.record_heartbeats({"s2": None}, seen=1008.0)
+    # A restarted process starts with an empty wheel
+    monkeypatch.setattr(main, "heartbeat_wheel", main.TimerWheel(10, 1, now=1012))
+    monkeypatch.setattr(main, "HEARTBEAT_TIMEOUT_SECONDS", 10)
+
+    main.seed_heartbeats()
+    assert main.expire_heartbeats(1013.0) == ["s1"]
+    assert main.expire_heartbeats(1019.0) == ["s2"]
+
+
+def test_status_history_endpoints(monkeypatch):
+    main.status_history.clear()
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "time", lambda: now[0])
+    client.post("/robots", json={"id": "s1", "name": "s1", "status": "active"})
+    client.post("/robots", json={"id": "s2", "name": "s2", "status": "active"})
+    now[0] = 1060.0
+    client.patch("/robot/s1", json={"status": "error"})
+    now[0] = 1090.0
+    client.post(
+        "/robots/heartbeats", json={"heartbeats": [{"id": "s1", "status": "active"}]}
+    )
+    now[0] = 1120.0
+
+    response = client.get("/robot/s1/history")
+    assert response.status_code == 200
+    history = response.json()
+    assert [t["status"] for t in history["transitions"]] == [
+        "active",
+        "error",
+        "active",
+    ]
+    assert history["time_in_status"] == {"active": 90.0, "error": 30.0}
+
+    summary = client.get("/robots/history/summary", params={"start": 1000}).json()
+    assert summary["robots"] == 2
+    assert summary["time_in_status"] == {"active": 210.0, "error": 30.0}
+
+    assert client.get("/robot/missing/history").status_code == 404
+    params = {"start": 2000, "end": 1000}
+    assert client.get("/robots/history/summary", params=params).status_code == 400
+
+
+def test_large_responses_are_compressed():
+    for i in range(50):
+        client.post(
+            "/robots", json={"id": f"c{i}", "name": f"Robot {i}", "status": "active"}
+        )
+    response = client.get("/robots", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 50
+
+    response = client.get("/robot/missing/history", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+def test_export_streams_the_fleet():
+    import csv
+    import io
+    import json
+
+    for i in range(3):
+        client.post(
+            "/robots", json={"id": f"e{i}", "name": f"Robot {i}", "status": "active"}
+        )
+    response = client.get("/robots/export")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows[0] == {
+        "id": "e0",
+        "name": "Robot 0",
+        "status": "active",
+        "last_seen": None,
+    }
+    assert len(rows) == 3
+
+    response = client.get("/robots/export", params={"format": "csv"})
+    assert response.headers["content-disposition"].endswith('robots.csv"')
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [r["id"] for r in rows] == ["e0", "e1", "e2"]
+
+    assert client.get("/robots/export", params={"format": "xml"}).status_code == 400
+
+
+def test_export_arrow():
+    pyarrow = pytest.importorskip("pyarrow")
+
+    client.post("/robots", json={"id": "a1", "name": "Robot", "status": "active"})
+    response = client.get("/robots/export", params={"format": "arrow"})
+    table = pyarrow.ipc.open_stream(response.content).read_all()
+    assert table.to_pylist() == [
+        {"id": "a1", "name": "Robot", "status": "active", "last_seen": None}
+    ]
@@ -0,0 +1,129 @@
+"""Bytes on the wire and CPU per request for each response encoding.
+
+Feeds /logs-shaped and /robots-shaped JSON bodies of several sizes through
+CompressionMiddleware, streamed in ``--chunk-size`` pieces as a large response
+would be, once per available encoding plus identity. Each result reports the
+body size as sent, the ratio to the raw size and the CPU time spent per request.
+
+Usage: python tests/performance/bench_compression.py [--iterations 50]
+                                                     [--output results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "robot-service"))
+
+from app.compression import ENCODINGS, CompressionMiddleware
+
+LEVELS = ["info", "info", "info", "warning", "error", "debug"]
+LOG_SIZES = (10, 100, 1000)
+FLEET_SIZES = (100, 1000, 10000)
+
+
+def logs_body(count):
+    logs = [
+        {
+            "timestamp": f"2024-05-01T12:{(i // 60) % 60:02d}:{i % 60:02d}.000Z",
+            "level": LEVELS[i % len(LEVELS)],
+            "message": f"Updated robot: robot-{i % 500}",
+            "kubernetes": {
+                "pod_name": f"robot-service-{i % 20}",
+                "container_name": "robot-service",
+                "namespace": "default",
+            },
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"total": count, "logs": logs}).encode()
+
+
+def robots_body(count):
+    statuses = ["active", "inactive", "maintenance"]
+    robots = [
+        {"id": f"robot-{i}", "name": f"Robot {i}", "status": statuses[i % 3]}
+        for i in range(count)
+    ]
+    return json.dumps(robots).encode()
+
+
+def streamed(body, chunk_size):
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        for i, chunk in enumerate(chunks):
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": i < len(chunks) - 1,
+                }
+            )
+
+    return app
+
+
+def measure(body, coding, iterations, chunk_size):
+    middleware = CompressionMiddleware(streamed(body, chunk_size), minimum_size=0)
+    scope = {"type": "http", "headers": [(b"accept-encoding", coding.encode())]}
+    wire = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        nonlocal wire
+        if message["type"] == "http.response.body":
+            wire += len(message.get("body", b""))
+
+    async def requests():
+        for _ in range(iterations):
+            await middleware(scope, receive, send)
+
+    started = time.process_time()
+    asyncio.run(requests())
+    cpu = time.process_time() - started
+    return {
+        "raw_bytes": len(body),
+        "wire_bytes": wire // iterations,
+        "ratio": round(wire / iterations / len(body), 4),
+        "cpu_ms_per_request": round(cpu / iterations * 1000, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    parser.add_argument("--output", help="write the JSON results here")
+    args = parser.parse_args()
+
+    payloads = [(f"logs[entries={n}]", logs_body(n)) for n in LOG_SIZES]
+    payloads += [(f"robots[fleet={n}]", robots_body(n)) for n in FLEET_SIZES]
+    results = []
+    for name, body in payloads:
+        for coding in ["identity", *ENCODINGS]:
+            result = measure(body, coding, args.iterations, args.chunk_size)
+            results.append({"name": name, "encoding": coding, **result})
+
+    report = {"results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
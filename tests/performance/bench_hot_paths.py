@@ -0,0 +1,328 @@
+"""In-process benchmarks for the robot-service and log-api hot paths.
+
+Both apps are driven through TestClient, and log-api reads N pods x M lines from
+a stubbed CoreV1Api, so neither a cluster nor a running service is needed. The
+results are written as JSON and checked against ``performance_thresholds`` in
+tests/fixtures/test_configs.yaml; any breach makes the run exit non-zero.
+
+Both services name their package ``app``, so each suite runs in its own process.
+
+Usage: python tests/performance/bench_hot_paths.py [--suite robot|log-api]
+                                                   [--output results.json]
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import yaml
+
+ROOT = Path(__file__).parent.parent.parent
+CONFIG_PATH = ROOT / "tests" / "fixtures" / "test_configs.yaml"
+SUITES = ("robot", "log-api")
+
+LEVELS = ["INFO", "INFO", "INFO", "WARNING", "ERROR", "DEBUG"]
+
+
+def load_config():
+    with open(CONFIG_PATH, "r") as f:
+        return yaml.safe_load(f)
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(name, samples):
+    """Latency percentiles (ms) and throughput for per-operation samples (s)."""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "name": name,
+        "operations": len(ordered),
+        "ops_per_second": round(len(ordered) / total, 1) if total else None,
+        "mean_ms": round(total / len(ordered) * 1000, 4),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 4),
+    }
+
+
+def timed(operation, iterations, setup=None):
+    samples = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def ok(response):
+    # A failing request is fast and would flatter the numbers
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.request.url}: HTTP {response.status_code}")
+    return response
+
+
+def bench_robot(settings):
+    sys.path.insert(0, str(ROOT / "robot-service"))
+    from app.main import app, robots_db
+    from app.models import Robot
+    from fastapi.testclient import TestClient
+
+    client = TestClient(app)
+    iterations = settings["iterations"]
+    results = []
+    for fleet in settings["fleet_sizes"]:
+        robots_db.clear()
+        for i in range(fleet):
+            robots_db.add(Robot(id=f"robot-{i}", name=f"Robot {i}", status="active"))
+        ids = itertools.count(fleet)
+        statuses = itertools.cycle(["active", "inactive", "maintenance"])
+        targets = itertools.cycle(range(fleet))
+
+        results.append(
+            summarize(
+                f"robots.list[fleet={fleet}]",
+                timed(lambda: ok(client.get("/robots")), iterations),
+            )
+        )
+        results.append(
+            summarize(
+                f"robots.update[fleet={fleet}]",
+                timed(
+                    lambda: ok(
+                        client.patch(
+                            f"/robot/robot-{next(targets)}",
+                            json={"status": next(statuses)},
+                        )
+                    ),
+                    iterations,
+                ),
+            )
+        )
+        # Runs last: each create grows the fleet by one
+        results.append(
+            summarize(
+                f"robots.create[fleet={fleet}]",
+                timed(
+                    lambda: ok(
+                        client.post(
+                            "/robots",
+                            json={
+                                "id": f"robot-{next(ids)}",
+                                "name": "Bench Robot",
+                                "status": "active",
+                            },
+                        )
+                    ),
+                    iterations,
+                ),
+            )
+        )
+    robots_db.clear()
+    return results
+
+
+def log_corpus(kind, count):
+    for i in range(count):
+        level = LEVELS[i % len(LEVELS)]
+        stamp = f"2024-05-01T12:{(i // 60) % 60:02d}:{i % 60:02d}.{i % 1000:03d}Z"
+        if kind == "iso":
+            yield f"{stamp} [{level}] Added robot: robot-{i % 5000}"
+        elif kind == "std":
+            yield f"2024-05-01 12:{(i // 60) % 60:02d}:{i % 60:02d} {level} Tick {i}"
+        elif kind == "simple":
+            yield f"{level}: Robot robot-{i % 5000} heartbeat"
+        elif kind == "json":
+            yield json.dumps(
+                {
+                    "timestamp": stamp,
+                    "level": level,
+                    "logger": "robot-service",
+                    "message": f"Updated robot: robot-{i % 5000}",
+                }
+            )
+        else:
+            yield f"GET /robots 200 {i % 97}ms robot-{i % 5000}"
+
+
+class StubCoreV1Api:
+    """Serves ``pods`` pods with ``lines`` timestamped log lines each."""
+
+    def __init__(self, pods, lines):
+        self.pods = [
+            SimpleNamespace(
+                metadata=SimpleNamespace(name=f"robot-service-{i}", namespace="default"),
+                spec=SimpleNamespace(containers=[SimpleNamespace(name="robot-service")]),
+            )
+            for i in range(pods)
+        ]
+        body = list(log_corpus("iso", lines))
+        self.log_text = "".join(
+            f"2024-05-01T12:{i // 60 % 60:02d}:{i % 60:02d}.000000000Z {line}\n"
+            for i, line in enumerate(body)
+        )
+
+    def list_namespaced_pod(self, namespace, **kwargs):
+        return SimpleNamespace(
+            items=[p for p in self.pods if p.metadata.namespace == namespace]
+        )
+
+    def list_pod_for_all_namespaces(self, **kwargs):
+        return SimpleNamespace(items=self.pods)
+
+    def read_namespaced_pod_log(self, **kwargs):
+        return self.log_text
+
+
+def bench_log_api(settings):
+    sys.path.insert(0, str(ROOT / "log-api"))
+    from app import main
+    from app.kube import KubeClient
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    iterations = settings["iterations"]
+    results = []
+
+    parse_lines = settings["parse_lines"]
+    for kind in ("iso", "std", "simple", "json", "unstructured"):
+        lines = list(log_corpus(kind, parse_lines))
+        batch = 1000
+        samples = []
+        for start in range(0, parse_lines, batch):
+            chunk = lines[start : start + batch]
+            started = time.perf_counter()
+            for line in chunk:
+                main.parse_log_line(line)
+            elapsed = time.perf_counter() - started
+            samples.extend([elapsed / len(chunk)] * len(chunk))
+        results.append(summarize(f"parse_log_line[{kind}]", samples))
+
+    for pods, lines in settings["log_sources"]:
+        stub = StubCoreV1Api(pods, lines)
+        main.kube_client = KubeClient(factory=lambda: stub)
+        scope = f"pods={pods},lines={lines}"
+
+        def search(**params):
+            return lambda: ok(client.get("/logs", params=params))
+
+        cold = max(1, iterations // 10)
+        results.append(
+            summarize(
+                f"logs.cold[{scope}]",
+                timed(search(), cold, setup=main.log_store.clear),
+            )
+        )
+        results.append(summarize(f"logs.warm[{scope}]", timed(search(), iterations)))
+        results.append(
+            summarize(
+                f"logs.query[{scope}]",
+                timed(search(query="level:error AND robot"), iterations),
+            )
+        )
+        main.log_store.clear()
+    return results
+
+
+def thresholds_for(name, thresholds):
+    """The global thresholds, overridden per benchmark family (name before '[')."""
+    limits = {
+        "p95_ms": thresholds.get("response_time", {}).get("p95"),
+        "p99_ms": thresholds.get("response_time", {}).get("p99"),
+        "min_ops_per_second": thresholds.get("throughput", {}).get("min_rps"),
+    }
+    family = name.split("[", 1)[0]
+    limits.update(thresholds.get("benchmarks", {}).get(family, {}))
+    return limits
+
+
+def check(results, thresholds):
+    failures = []
+    for result in results:
+        limits = thresholds_for(result["name"], thresholds)
+        for key in ("p95_ms", "p99_ms"):
+            if limits.get(key) is not None and result[key] > limits[key]:
+                failures.append(
+                    f"{result['name']}: {key} {result[key]} > {limits[key]}"
+                )
+        minimum = limits.get("min_ops_per_second")
+        if minimum is not None and result["ops_per_second"] < minimum:
+            failures.append(
+                f"{result['name']}: ops_per_second "
+                f"{result['ops_per_second']} < {minimum}"
+            )
+    return failures
+
+
+def run_suite(suite, settings):
+    # Keep per-request log lines out of the measurements and the output
+    logging.disable(logging.INFO)
+    if suite == "robot":
+        return bench_robot(settings)
+    return bench_log_api(settings)
+
+
+def run_isolated(suite):
+    with tempfile.NamedTemporaryFile(suffix=".json") as output:
+        # Threshold breaches are reported by the parent, so only a crash counts
+        process = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--suite",
+                suite,
+                "--output",
+                output.name,
+                "--no-check",
+            ],
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            with open(output.name) as f:
+                return json.load(f)["results"]
+        except ValueError:
+            raise RuntimeError(f"{suite} benchmarks failed ({process.returncode})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--suite", choices=SUITES)
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--no-check", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    config = load_config()
+    settings = config["benchmark_workloads"]
+    thresholds = config.get("performance_thresholds", {})
+
+    if args.suite:
+        results = run_suite(args.suite, settings)
+    else:
+        results = [r for suite in SUITES for r in run_isolated(suite)]
+
+    failures = [] if args.no_check else check(results, thresholds)
+    report = {"results": results, "failures": failures}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if not args.suite or not args.output:
+        print(json.dumps(report, indent=2))
+    if failures:
+        for failure in failures:
+            print(f"Threshold exceeded: {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Memory benchmark for buffered log-api entries.
+
+Compares bytes per entry for the previous dict-per-line representation with the
+compact LogSegment used by /logs.
+
+Usage: python tests/performance/bench_log_memory.py [entries]
+"""
+
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "log-api"))
+
+from app.main import parse_log_line  # noqa: E402
+from app.store import LogSegment  # noqa: E402
+
+
+def synthetic_lines(count):
+    levels = ["INFO", "INFO", "INFO", "WARNING", "ERROR", "DEBUG"]
+    for i in range(count):
+        yield (
+            f"2024-05-01T12:{(i // 60) % 60:02d}:{i % 60:02d}.{i % 1000:03d}Z "
+            f"[{levels[i % len(levels)]}] Added robot: robot-{i % 5000}"
+        )
+
+
+def sources(count):
+    return [
+        (f"namespace-{i % 3}", f"robot-service-{i}", "robot-service")
+        for i in range(count)
+    ]
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def build_dicts(lines, pods):
+    entries = []
+    for i, line in enumerate(lines):
+        namespace, pod_name, container_name = pods[i % len(pods)]
+        entry = parse_log_line(line)
+        entry["kubernetes"] = {
+            "pod_name": pod_name,
+            "container_name": container_name,
+            "namespace": namespace,
+        }
+        entries.append(entry)
+    return entries
+
+
+def build_segment(lines, pods):
+    segment = LogSegment()
+    for i, line in enumerate(lines):
+        entry = parse_log_line(line)
+        segment.add(
+            entry["timestamp"], entry["level"], pods[i % len(pods)], entry["message"]
+        )
+    return segment
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lines = list(synthetic_lines(count))
+    pods = sources(50)
+    raw = sum(len(line) + 1 for line in lines)
+
+    dict_bytes, _ = measure(lambda: build_dicts(lines, pods))
+    segment_bytes, _ = measure(lambda: build_segment(lines, pods))
+
+    print(
+        json.dumps(
+            {
+                "entries": count,
+                "raw_bytes_per_entry": round(raw / count, 1),
+                "dict_bytes_per_entry": round(dict_bytes / count, 1),
+                "segment_bytes_per_entry": round(segment_bytes / count, 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
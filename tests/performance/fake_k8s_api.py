@@ -0,0 +1,314 @@
+"""Fake Kubernetes API server for offline log-api load tests.
+
+Serves the pod list, pod watch and pod log endpoints that log-api uses, for a
+synthetic cluster of ``pods`` pods with ``containers`` containers each. Every
+container starts with ``lines`` log lines spread over the last ``history``
+seconds and keeps writing ``rate`` lines per second, so tailing with
+``sinceSeconds`` returns only new output. Each request waits ``latency``
+seconds and fails with HTTP 500 with probability ``error_rate``; both apply to
+every endpoint. Output is deterministic for a given ``seed``.
+
+Point log-api at it with LOG_API_KUBE_HOST=http://127.0.0.1:<port>.
+
+Usage: python tests/performance/fake_k8s_api.py [--host 127.0.0.1]
+           [--port 8001] [--pods 20] [--containers 1] [--namespaces 1]
+           [--lines 200] [--rate 1.0] [--latency 0.0] [--error-rate 0.0]
+           [--seed 0]
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+LEVELS = ["INFO", "INFO", "INFO", "WARNING", "ERROR", "DEBUG"]
+MESSAGES = [
+    "Added robot: robot-{n}",
+    "Updated robot: robot-{n}",
+    "Robot robot-{n} heartbeat",
+    "Robot robot-{n} failed to reach waypoint",
+    "Fetching all robots",
+]
+
+POD_LIST = re.compile(r"^/api/v1/(?:namespaces/([^/]+)/)?pods$")
+POD_LOG = re.compile(r"^/api/v1/namespaces/([^/]+)/pods/([^/]+)/log$")
+
+
+def rfc3339(epoch: float) -> str:
+    moment = datetime.fromtimestamp(epoch, timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond:06d}000Z"
+
+
+class FakeCluster:
+    def __init__(
+        self,
+        pods: int = 20,
+        containers: int = 1,
+        lines: int = 200,
+        rate: float = 1.0,
+        history: float = 3600.0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        namespaces: int = 1,
+        seed: int = 0,
+        clock=time.time,
+    ):
+        self.lines = lines
+        self.rate = rate
+        self.history = history
+        self.latency = latency
+        self.error_rate = error_rate
+        self.clock = clock
+        self.started = clock()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.pods = [
+            {
+                "name": f"robot-service-{i}",
+                "namespace": "default" if namespaces == 1 else f"ns-{i % namespaces}",
+                "labels": {"app": "robot-service"},
+                "containers": [
+                    "robot-service" if c == 0 else f"sidecar-{c}"
+                    for c in range(containers)
+                ],
+            }
+            for i in range(pods)
+        ]
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def select(self, namespace: Optional[str], label_selector: Optional[str]):
+        wanted = {}
+        for term in (label_selector or "").split(","):
+            if "=" in term:
+                key, _, value = term.partition("=")
+                wanted[key.strip()] = value.strip()
+        return [
+            pod
+            for pod in self.pods
+            if (namespace is None or pod["namespace"] == namespace)
+            and all(pod["labels"].get(k) == v for k, v in wanted.items())
+        ]
+
+    def find(self, namespace: str, name: str):
+        for pod in self.pods:
+            if pod["namespace"] == namespace and pod["name"] == name:
+                return pod
+        return None
+
+    def pod_object(self, pod) -> dict:
+        return {
+            "metadata": {
+                "name": pod["name"],
+                "namespace": pod["namespace"],
+                "labels": pod["labels"],
+                "uid": f"uid-{pod['namespace']}-{pod['name']}",
+            },
+            "spec": {"containers": [{"name": c} for c in pod["containers"]]},
+            "status": {"phase": "Running"},
+        }
+
+    def pod_list(self, pods) -> dict:
+        return {
+            "kind": "PodList",
+            "apiVersion": "v1",
+            "metadata": {"resourceVersion": "1"},
+            "items": [self.pod_object(pod) for pod in pods],
+        }
+
+    def line_time(self, index: int) -> float:
+        """When line ``index`` of a container was written."""
+        if index < self.lines:
+            return self.started - self.history * (1 - index / max(1, self.lines))
+        return self.started + (index - self.lines + 1) / self.rate
+
+    def written(self, now: float) -> int:
+        """Lines written per container by ``now``."""
+        if self.rate <= 0:
+            return self.lines
+        return self.lines + max(0, int((now - self.started) * self.rate))
+
+    def log_text(
+        self,
+        pod,
+        container: str,
+        tail_lines: Optional[int] = None,
+        since_seconds: Optional[int] = None,
+        timestamps: bool = False,
+    ) -> str:
+        now = self.clock()
+        end = self.written(now)
+        start = 0
+        if since_seconds is not None:
+            # First line written at or after the cutoff
+            cutoff, high = now - since_seconds, end
+            while start < high:
+                middle = (start + high) // 2
+                if self.line_time(middle) < cutoff:
+                    start = middle + 1
+                else:
+                    high = middle
+        if tail_lines is not None:
+            start = max(start, end - tail_lines)
+        seed = sum(map(ord, f"{pod['name']}/{container}"))
+        out: List[str] = []
+        for i in range(start, end):
+            written = self.line_time(i)
+            level = LEVELS[(seed + i) % len(LEVELS)]
+            message = MESSAGES[(seed + i) % len(MESSAGES)].format(n=(seed + i) % 500)
+            line = f"{rfc3339(written)[:23]}Z [{level}] {message}"
+            if timestamps:
+                line = f"{rfc3339(written)} {line}"
+            out.append(line)
+        return "".join(f"{line}\n" for line in out)
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    cluster: FakeCluster
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict) -> None:
+        self.send_text(status, json.dumps(body), "application/json")
+
+    def send_text(self, status: int, text: str, content_type="text/plain") -> None:
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_status(self, code: int, reason: str, message: str) -> None:
+        self.send_json(
+            code,
+            {
+                "kind": "Status",
+                "apiVersion": "v1",
+                "status": "Failure",
+                "message": message,
+                "reason": reason,
+                "code": code,
+            },
+        )
+
+    def do_GET(self):
+        cluster = self.cluster
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if cluster.latency:
+            time.sleep(cluster.latency)
+        if cluster.should_fail():
+            self.send_status(500, "InternalError", "injected failure")
+            return
+
+        match = POD_LIST.match(url.path)
+        if match:
+            pods = cluster.select(match.group(1), params.get("labelSelector"))
+            if params.get("watch", "").lower() in ("true", "1"):
+                self.watch(pods, float(params.get("timeoutSeconds", "5")))
+            else:
+                self.send_json(200, cluster.pod_list(pods))
+            return
+
+        match = POD_LOG.match(url.path)
+        if match:
+            pod = cluster.find(match.group(1), match.group(2))
+            container = params.get("container") or (pod and pod["containers"][0])
+            if pod is None or container not in pod["containers"]:
+                self.send_status(404, "NotFound", f"pods {match.group(2)} not found")
+                return
+            self.send_text(
+                200,
+                cluster.log_text(
+                    pod,
+                    container,
+                    tail_lines=(
+                        int(params["tailLines"]) if "tailLines" in params else None
+                    ),
+                    since_seconds=(
+                        int(params["sinceSeconds"])
+                        if "sinceSeconds" in params
+                        else None
+                    ),
+                    timestamps=params.get("timestamps", "").lower() in ("true", "1"),
+                ),
+            )
+            return
+
+        self.send_status(404, "NotFound", f"{url.path} not found")
+
+    def watch(self, pods, timeout: float) -> None:
+        """Stream an ADDED event per pod, then hold the watch open until timeout."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for pod in pods:
+            event = json.dumps(
+                {"type": "ADDED", "object": self.cluster.pod_object(pod)}
+            )
+            self.write_chunk(f"{event}\n".encode())
+        time.sleep(timeout)
+        self.write_chunk(b"")
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(cluster: FakeCluster, host="127.0.0.1", port=0) -> ThreadingHTTPServer:
+    """Start serving ``cluster`` on a background thread; port 0 picks a free one."""
+    handler = type("Handler", (FakeApiHandler,), {"cluster": cluster})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--pods", type=int, default=20)
+    parser.add_argument("--containers", type=int, default=1)
+    parser.add_argument("--namespaces", type=int, default=1)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cluster = FakeCluster(
+        pods=args.pods,
+        containers=args.containers,
+        lines=args.lines,
+        rate=args.rate,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        namespaces=args.namespaces,
+        seed=args.seed,
+    )
+    server = serve(cluster, args.host, args.port)
+    print(f"Fake Kubernetes API on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
+import logging
+import os
 import random
+import time
 from pathlib import Path
 
+import gevent.pool
+import requests
 import yaml
-from locust import HttpUser, between, task
+from locust import HttpUser, between, events, task
+from locust.runners import WorkerRunner
 
 
 def load_test_config():
@@ -11,10 +17,12 @@ def load_test_config():
     with open(config_path, "r") as f:
         return yaml.safe_load(f)
 
+
 # Load configuration
 test_config = load_test_config()
 load_config = test_config.get("load_testing", {})
 
+
 class RobotServiceUser(HttpUser):
     """Locust performance test for Robot Service using config"""
 
@@ -49,3 +57,173 @@ class RobotServiceUser(HttpUser):
             "status": random.choice(["online", "offline", "maintenance", "error"]),
         }
         self.client.post("/robots", json=robot_data)
+
+
+# Open-model scenarios. Each user below starts a request every
+# 1 / ARRIVAL_RATE seconds without waiting for earlier ones to finish, so
+# users x rate is the offered load whatever the response time: a slow service
+# builds up requests in flight instead of quietly lowering the request rate.
+# Arrivals that find MAX_IN_FLIGHT requests of their user still running are
+# recorded as failures. Run one scenario by naming its classes, e.g.
+#   locust -f tests/performance/test_load.py --headless -u 60 -r 10 -t 60s \
+#       --reset-stats -H http://localhost:8080 RobotFleetUser
+ARRIVAL_RATE = float(load_config.get("arrival_rate_per_user", 2))
+MAX_IN_FLIGHT = int(load_config.get("max_in_flight_per_user", 50))
+FLEET_SIZE = int(os.getenv("LOAD_TEST_FLEET_SIZE", load_config.get("fleet_size", 1000)))
+STATUSES = ["active", "inactive", "maintenance", "error"]
+
+environment_config = test_config.get("test_environments", {}).get(
+    os.getenv("TEST_ENV", "local"), {}
+)
+LOG_API_URL = os.getenv("LOG_API_URL", environment_config.get("log_api_url", ""))
+
+LOG_SEARCHES = [
+    {},
+    {"level": "error"},
+    {"level": "info", "limit": 20},
+    {"query": "robot"},
+    {"query": 'level:error AND "failed"'},
+    {"query": "/robot-\\d+/ -heartbeat"},
+    {"namespace": "default"},
+    {"pod": "robot-service-0"},
+    {"from_time": "2024-01-01T00:00:00Z", "to_time": "2030-01-01T00:00:00Z"},
+    {"limit": 50, "offset": 50},
+]
+
+
+def fleet_robot_id(index):
+    return f"fleet-robot-{index}"
+
+
+@events.test_start.add_listener
+def seed_fleet(environment, **kwargs):
+    """Create the bulk fleet once before RobotFleetUser starts."""
+    if isinstance(environment.runner, WorkerRunner):
+        return
+    if not any(u.__name__ == "RobotFleetUser" for u in environment.user_classes):
+        return
+    with requests.Session() as session:
+        for i in range(FLEET_SIZE):
+            # 400 means the robot is left over from an earlier run
+            session.post(
+                f"{environment.host}/robots",
+                json={
+                    "id": fleet_robot_id(i),
+                    "name": f"Fleet {i}",
+                    "status": "active",
+                },
+            )
+    logging.info(f"Seeded a fleet of {FLEET_SIZE} robots")
+
+
+class ArrivalRateUser(HttpUser):
+    """Starts one of ``operations`` (method name, weight) at a fixed rate."""
+
+    abstract = True
+    operations = []
+
+    def on_start(self):
+        self.in_flight = gevent.pool.Pool(MAX_IN_FLIGHT)
+        self.next_arrival = time.monotonic()
+
+    def on_stop(self):
+        self.in_flight.kill()
+
+    def wait_time(self):
+        # Arrivals are scheduled, not spaced from the end of the last request
+        self.next_arrival += 1 / ARRIVAL_RATE
+        return max(0.0, self.next_arrival - time.monotonic())
+
+    @task
+    def arrive(self):
+        names, weights = zip(*self.operations)
+        operation = random.choices(names, weights)[0]
+        if self.in_flight.full():
+            self.environment.events.request.fire(
+                request_type="ARRIVAL",
+                name=f"{operation} [over {MAX_IN_FLIGHT} in flight]",
+                response_time=0,
+                response_length=0,
+                exception=RuntimeError("too many requests in flight"),
+                context={},
+            )
+            return
+        self.in_flight.spawn(getattr(self, operation))
+
+
+class RobotFleetUser(ArrivalRateUser):
+    """Reads and status updates against a fleet of FLEET_SIZE robots."""
+
+    operations = [("list_fleet", 3), ("update_status", 3), ("add_robot", 1)]
+
+    def list_fleet(self):
+        self.client.get("/robots", name=f"/robots [fleet={FLEET_SIZE}]")
+
+    def update_status(self):
+        robot_id = fleet_robot_id(random.randrange(FLEET_SIZE))
+        self.client.patch(
+            f"/robot/{robot_id}",
+            json={"status": random.choice(STATUSES)},
+            name="/robot/{robot_id}",
+        )
+
+    def add_robot(self):
+        self.client.post(
+            "/robots",
+            json={
+                "id": f"load-robot-{random.getrandbits(48):012x}",
+                "name": "Load Robot",
+                "status": "active",
+            },
+        )
+
+
+class LogApiUser(ArrivalRateUser):
+    """Log searches with varied filters against LOG_API_URL."""
+
+    operations = [("search_logs", 1)]
+
+    def search_logs(self):
+        params = random.choice(LOG_SEARCHES)
+        name = "/logs?" + ",".join(sorted(params)) if params else "/logs"
+        self.client.get(f"{LOG_API_URL}/logs", params=params, name=name)
+
+
+def threshold_failures(stats, thresholds):
+    """Compare the run's totals with performance_thresholds."""
+    total = stats.total
+    failures = []
+    if not total.num_requests:
+        return ["no requests were made"]
+    for key, percentile in (("p95", 0.95), ("p99", 0.99)):
+        limit = thresholds.get("response_time", {}).get(key)
+        observed = total.get_response_time_percentile(percentile)
+        if limit is not None and observed > limit:
+            failures.append(f"{key} {observed:.0f} ms > {limit} ms")
+    min_rps = thresholds.get("throughput", {}).get("min_rps")
+    if min_rps is not None and total.total_rps < min_rps:
+        failures.append(f"throughput {total.total_rps:.1f} rps < {min_rps} rps")
+    uptime = thresholds.get("availability", {}).get("uptime")
+    if uptime is not None and (1 - total.fail_ratio) * 100 < uptime:
+        failures.append(f"success rate {(1 - total.fail_ratio) * 100:.2f}% < {uptime}%")
+    return failures
+
+
+@events.quitting.add_listener
+def enforce_thresholds(environment, **kwargs):
+    """Print a per-endpoint summary and fail the run on a missed threshold."""
+    stats = environment.stats
+    print(f"{'Endpoint':<48} {'reqs':>7} {'rps':>8} {'p95':>6} {'p99':>6} {'fail%':>6}")
+    for entry in sorted(stats.entries.values(), key=lambda e: e.name):
+        print(
+            f"{entry.method + ' ' + entry.name:<48} {entry.num_requests:>7} "
+            f"{entry.total_rps:>8.1f} "
+            f"{entry.get_response_time_percentile(0.95):>6.0f} "
+            f"{entry.get_response_time_percentile(0.99):>6.0f} "
+            f"{entry.fail_ratio * 100:>6.2f}"
+        )
+    failures = threshold_failures(stats, test_config.get("performance_thresholds", {}))
+    for failure in failures:
+        logging.error(f"Threshold missed: {failure}")
+    if failures:
+        environment.process_exit_code = 1
@@ -0,0 +1,49 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# Add robot-service to path.
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "robot-service"))
+
+from app.admission import CostClass
+
+
+def test_cost_class_queues_then_sheds():
+    async def scenario():
+        cost_class = CostClass("heavy", limit=1, queue_size=1, max_wait=0.2)
+        assert await cost_class.acquire() is None
+
+        # The second request waits; the third finds the queue full
+        waiting = asyncio.ensure_future(cost_class.acquire())
+        await asyncio.sleep(0)
+        assert cost_class.waiting == 1
+        assert await cost_class.acquire() == "queue_full"
+
+        # Releasing hands the slot to the waiter instead of freeing it
+        cost_class.release()
+        assert await waiting is None
+        assert cost_class.active == 1
+
+        # Nobody releases now, so the next waiter runs out of time
+        assert await cost_class.acquire() == "timeout"
+        assert cost_class.waiting == 0
+        cost_class.release()
+        assert cost_class.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_passes_on_its_slot():
+    async def scenario():
+        cost_class = CostClass("default", limit=1, queue_size=2, max_wait=1.0)
+        await cost_class.acquire()
+        first = asyncio.ensure_future(cost_class.acquire())
+        second = asyncio.ensure_future(cost_class.acquire())
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        cost_class.release()
+        assert await second is None
+        assert cost_class.active == 1 and cost_class.waiting == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+import asyncio
+import gzip
+import sys
+from pathlib import Path
+
+# Add robot-service to path.
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "robot-service"))
+
+from app.compression import CompressionMiddleware, GzipEncoder, negotiate
+
+GZIP_ONLY = {"gzip": GzipEncoder}
+
+
+def run(middleware_app, accept_encoding="gzip"):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    asyncio.run(middleware_app(scope, receive, send))
+    headers = dict(sent[0]["headers"])
+    body = b"".join(m.get("body", b"") for m in sent[1:])
+    return headers, body, sent[1:]
+
+
+def response(chunks, headers=()):
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/json"), *headers],
+            }
+        )
+        for i, chunk in enumerate(chunks):
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": i < len(chunks) - 1,
+                }
+            )
+
+    return app
+
+
+def test_negotiate_follows_q_values_then_server_preference():
+    available = {"zstd": None, "br": None, "gzip": None}
+    assert negotiate("gzip, br", available) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", available) == "gzip"
+    assert negotiate("*;q=0.5, zstd;q=0", available) == "br"
+    assert negotiate("identity", available) is None
+    assert negotiate("gzip;q=0", available) is None
+    assert negotiate("", available) is None
+
+
+def test_streams_compressed_chunks_above_threshold():
+    chunks = [b'{"message": "Robot heartbeat"}\n' * 100] * 3
+    middleware = CompressionMiddleware(response(chunks), 1024, GZIP_ONLY)
+    headers, body, messages = run(middleware)
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert gzip.decompress(body) == b"".join(chunks)
+    assert messages[-1].get("more_body", False) is False
+    assert len(body) < len(b"".join(chunks)) / 10
+
+
+def test_small_encoded_and_unaccepted_responses_pass_through():
+    small = CompressionMiddleware(
+        response([b"{}"], [(b"content-length", b"2")]), 1024, GZIP_ONLY
+    )
+    headers, body, _ = run(small)
+    assert b"content-encoding" not in headers and body == b"{}"
+
+    payload = gzip.compress(b"x" * 5000)
+    encoded = CompressionMiddleware(
+        response([payload], [(b"content-encoding", b"gzip")]), 1024, GZIP_ONLY
+    )
+    assert run(encoded)[1] == payload
+
+    large = CompressionMiddleware(response([b"x" * 5000]), 1024, GZIP_ONLY)
+    headers, body, _ = run(large, accept_encoding="identity")
+    assert b"content-encoding" not in headers and body == b"x" * 5000
@@ -0,0 +1,88 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "performance"))
+
+from fake_k8s_api import FakeCluster, serve
+
+kubernetes = pytest.importorskip("kubernetes")
+
+
+@pytest.fixture
+def cluster():
+    now = [1_700_000_000.0]
+    fake = FakeCluster(pods=3, lines=10, rate=2.0, history=100, clock=lambda: now[0])
+    fake.now = now
+    server = serve(fake)
+    yield fake, server.server_address[1]
+    server.shutdown()
+
+
+def core_v1_api(port):
+    from kubernetes import client
+
+    configuration = client.Configuration(host=f"http://127.0.0.1:{port}")
+    return client.CoreV1Api(client.ApiClient(configuration))
+
+
+def test_lists_pods_and_reads_logs(cluster):
+    fake, port = cluster
+    v1 = core_v1_api(port)
+
+    pods = v1.list_pod_for_all_namespaces(label_selector="app=robot-service")
+    assert [p.metadata.name for p in pods.items] == [
+        "robot-service-0",
+        "robot-service-1",
+        "robot-service-2",
+    ]
+    assert v1.list_namespaced_pod("kube-system").items == []
+    assert pods.items[0].spec.containers[0].name == "robot-service"
+
+    text = v1.read_namespaced_pod_log(
+        name="robot-service-0",
+        namespace="default",
+        container="robot-service",
+        timestamps=True,
+        tail_lines=4,
+    )
+    lines = text.splitlines()
+    assert len(lines) == 4
+    kubelet_time, _, rest = lines[0].partition(" ")
+    assert kubelet_time.endswith("000Z") and "[" in rest
+
+    # New lines appear at ``rate`` per second; sinceSeconds returns only those
+    fake.now[0] += 3
+    recent = v1.read_namespaced_pod_log(
+        name="robot-service-0", namespace="default", since_seconds=3
+    )
+    assert len(recent.splitlines()) == 6
+
+
+def test_injected_errors_and_missing_pods(cluster):
+    from kubernetes.client.rest import ApiException
+
+    fake, port = cluster
+    v1 = core_v1_api(port)
+    with pytest.raises(ApiException) as missing:
+        v1.read_namespaced_pod_log(name="nope", namespace="default")
+    assert missing.value.status == 404
+
+    fake.error_rate = 1.0
+    with pytest.raises(ApiException) as failed:
+        v1.list_pod_for_all_namespaces()
+    assert failed.value.status == 500
+
+
+def test_watch_streams_added_events(cluster):
+    from kubernetes import watch
+
+    _, port = cluster
+    events = list(
+        watch.Watch().stream(
+            core_v1_api(port).list_pod_for_all_namespaces, timeout_seconds=0
+        )
+    )
+    assert [e["type"] for e in events] == ["ADDED"] * 3
+    assert events[0]["object"].metadata.name == "robot-service-0"
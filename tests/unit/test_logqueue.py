@@ -0,0 +1,66 @@
+import io
+import logging
+import queue
+import sys
+from pathlib import Path
+
+# Add robot-service to path.
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "robot-service"))
+
+from app.logqueue import (BatchWriter, DroppingQueueHandler, SamplingFilter,
+                          log_records_dropped)
+
+
+def make_logger(name, records, sample_every=1):
+    handler = DroppingQueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_every))
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def dropped(reason):
+    return log_records_dropped.labels(reason=reason)._value.get()
+
+
+def test_records_are_written_in_batches():
+    records = queue.Queue()
+    logger = make_logger("logqueue-batches", records)
+    for i in range(10):
+        logger.info("line %d", i)
+
+    stream = io.StringIO()
+    writer = BatchWriter(records, stream, logging.Formatter("%(message)s"), 4)
+    writer.start()
+    writer.stop()
+
+    assert stream.getvalue().splitlines() == [f"line {i}" for i in range(10)]
+
+
+def test_full_queue_drops_and_counts():
+    before = dropped("queue_full")
+    logger = make_logger("logqueue-full", queue.Queue(maxsize=2))
+    for i in range(5):
+        logger.info("line %d", i)
+    assert dropped("queue_full") - before == 3
+
+
+def test_sampling_keeps_one_in_n_info_records():
+    records = queue.Queue()
+    before = dropped("sampled")
+    logger = make_logger("logqueue-sampled", records, sample_every=3)
+    for _ in range(6):
+        logger.info("hot path", extra={"sampled": True})
+    logger.info("not sampled")
+    logger.warning("warnings are never sampled", extra={"sampled": True})
+
+    messages = [records.get_nowait().getMessage() for _ in range(records.qsize())]
+    assert messages == [
+        "hot path",
+        "hot path",
+        "not sampled",
+        "warnings are never sampled",
+    ]
+    assert dropped("sampled") - before == 4
@@ -0,0 +1,191 @@
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Add robot-service to path.
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "robot-service"))
+
+from app.liveness import TimerWheel
+from app.models import Robot
+from app.store import MemoryRobotStore, SqliteRobotStore, create_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    """Each store implementation must behave the same"""
+    if request.param == "memory":
+        return MemoryRobotStore()
+    return SqliteRobotStore(str(tmp_path / "robots.db"))
+
+
+class TestRobotStore:
+    """Test suite for the robot store backends"""
+
+    def test_add_and_list(self, store):
+        """Test robots are listed in insertion order"""
+        assert store.add(Robot(id="r1", name="Robot 1", status="online"))
+        assert store.add(Robot(id="r2", name="Robot 2", status="offline"))
+        assert [r.id for r in store.list()] == ["r1", "r2"]
+        assert len(store) == 2
+
+    def test_add_duplicate(self, store):
+        """Test duplicate ids are rejected"""
+        assert store.add(Robot(id="r1", name="Robot 1", status="online"))
+        assert not store.add(Robot(id="r1", name="Other", status="offline"))
+        assert store.get("r1").name == "Robot 1"
+
+    def test_update(self, store):
+        """Test partial updates and missing robots"""
+        store.add(Robot(id="r1", name="Robot 1", status="online"))
+        robot = store.update("r1", status="maintenance")
+        assert robot.model_dump() == {
+            "id": "r1",
+            "name": "Robot 1",
+            "status": "maintenance",
+        }
+        assert store.update("missing", name="x") is None
+
+    def test_count_by_status(self, store):
+        """Test status counts"""
+        store.add(Robot(id="r1", name="Robot 1", status="online"))
+        store.add(Robot(id="r2", name="Robot 2", status="online"))
+        store.add(Robot(id="r3", name="Robot 3", status="error"))
+        assert store.count_by_status() == {"online": 2, "error": 1}
+
+    def test_clear(self, store):
+        """Test clearing the store"""
+        store.add(Robot(id="r1", name="Robot 1", status="online"))
+        store.clear()
+        assert store.list() == []
+
+    def test_heartbeats_and_offline(self, store):
+        """Test heartbeats update liveness and missed ones mark robots offline"""
+        store.add(Robot(id="r1", name="Robot 1", status="active"))
+        store.add(Robot(id="r2", name="Robot 2", status="active"))
+        unknown, changed = store.record_heartbeats(
+            {"r1": None, "r2": "charging", "ghost": None}, seen=100.0
+        )
+        assert unknown == ["ghost"]
+        assert changed == {"r2": "charging"}
+        assert store.last_seen() == {"r1": 100.0, "r2": 100.0}
+        assert store.get("r2").status == "charging"
+
+        store.record_heartbeats({"r2": None}, seen=120.0)
+        # r2 beat after the cutoff, so only r1 goes offline
+        assert store.mark_offline(["r1", "r2"], cutoff=110.0) == ["r1"]
+        assert store.count_by_status() == {"offline": 1, "charging": 1}
+        assert store.mark_offline(["r1"], cutoff=110.0) == []
+
+        # A status-less heartbeat brings an offline robot back
+        assert store.record_heartbeats({"r1": None}, seen=130.0) == (
+            [],
+            {"r1": "active"},
+        )
+        assert store.get("r1").status == "active"
+
+    def test_export_rows_streams_the_fleet_in_chunks(self, store):
+        """Test exports stream in chunks and leave out robots added meanwhile"""
+        for i in range(5):
+            store.add(Robot(id=f"r{i}", name=f"Robot {i}", status="active"))
+        store.record_heartbeats({"r0": None}, seen=50.0)
+        # Nothing is read until iteration starts, so an unread export is free
+        store.export_rows(chunk_size=2)
+        chunks = store.export_rows(chunk_size=2)
+        first = next(chunks)
+        store.add(Robot(id="late", name="Late", status="active"))
+        chunks = [first] + list(chunks)
+        assert [len(c) for c in chunks] == [2, 2, 1]
+        assert chunks[0][0] == ("r0", "Robot 0", "active", 50.0)
+        assert chunks[-1][0][0] == "r4"
+
+
+def test_sqlite_export_reads_one_snapshot(tmp_path):
+    """Writes made once a SQLite export has started are not seen by it"""
+    store = SqliteRobotStore(str(tmp_path / "robots.db"))
+    for i in range(3):
+        store.add(Robot(id=f"r{i}", name=f"Robot {i}", status="active"))
+    chunks = store.export_rows(chunk_size=2)
+    first = next(chunks)
+    store.update("r2", status="error")
+    assert [first] + list(chunks) == [
+        [("r0", "Robot 0", "active", None), ("r1", "Robot 1", "active", None)],
+        [("r2", "Robot 2", "active", None)],
+    ]
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    """Two stores on one file behave like two workers sharing one fleet"""
+    path = str(tmp_path / "robots.db")
+    worker_a = SqliteRobotStore(path)
+    worker_b = SqliteRobotStore(path)
+
+    worker_a.add(Robot(id="r1", name="Robot 1", status="online"))
+    assert [r.id for r in worker_b.list()] == ["r1"]
+
+    # worker_b's cached list is revalidated after worker_a writes again
+    worker_a.update("r1", status="error")
+    assert worker_b.list()[0].status == "error"
+    assert not worker_b.add(Robot(id="r1", name="Robot 1", status="online"))
+
+
+def test_sqlite_heartbeats_keep_a_concurrent_status_update(tmp_path):
+    """A status written by another worker mid-heartbeat is not overwritten"""
+    path = str(tmp_path / "robots.db")
+    store = SqliteRobotStore(path)
+    store.add(Robot(id="r1", name="Robot 1", status="active"))
+
+    other_worker = sqlite3.connect(path, isolation_level=None)
+    other_worker.execute("BEGIN IMMEDIATE")
+    other_worker.execute("UPDATE robots SET status = 'maintenance' WHERE id = 'r1'")
+    beat = threading.Thread(target=store.record_heartbeats, args=({"r1": None}, 10.0))
+    beat.start()
+    time.sleep(0.2)
+    other_worker.execute("COMMIT")
+    beat.join()
+
+    assert store.get("r1").status == "maintenance"
+    assert store.last_seen() == {"r1": 10.0}
+
+
+def test_sqlite_cache_is_revalidated_on_every_thread(tmp_path):
+    """A thread with its own connection never gets another worker's stale list"""
+    path = str(tmp_path / "robots.db")
+    worker_a = SqliteRobotStore(path)
+    worker_b = SqliteRobotStore(path)
+    worker_a.add(Robot(id="r1", name="Robot 1", status="online"))
+    worker_a.list()
+
+    worker_b.update("r1", status="error")
+    statuses = []
+    thread = threading.Thread(target=lambda: statuses.append(worker_a.list()))
+    thread.start()
+    thread.join()
+    assert statuses[0][0].status == "error"
+
+
+def test_create_store():
+    """Test store selection from the store URL"""
+    assert isinstance(create_store("memory"), MemoryRobotStore)
+    with pytest.raises(ValueError):
+        create_store("redis://localhost")
+
+
+def test_timer_wheel_expires_only_missed_deadlines():
+    """Rescheduled keys survive their old slot; missed ones expire once"""
+    wheel = TimerWheel(timeout=10, tick=1, now=0)
+    wheel.schedule("r1", now=0)
+    wheel.schedule("r2", now=0)
+    assert wheel.advance(5) == []
+    wheel.schedule("r2", now=5)
+    assert wheel.advance(11) == ["r1"]
+    assert len(wheel) == 1
+    assert wheel.advance(11) == []
+    # A pause longer than a rotation still expires everything due
+    assert wheel.advance(100) == ["r2"]
+    # A deadline already past is expired on the next tick
+    wheel.schedule("r3", now=50)
+    assert wheel.advance(101) == ["r3"]
@@ -0,0 +1,16 @@
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent.parent
+
+# Each service image is built from its own directory, so these modules are
+# copied into both services rather than imported from a shared package.
+SHARED = ["admission", "compression", "exposition", "instrumentation", "profiling"]
+
+
+@pytest.mark.parametrize("module", SHARED)
+def test_shared_modules_stay_identical(module):
+    log_api = (ROOT / "log-api" / "app" / f"{module}.py").read_bytes()
+    robot_service = (ROOT / "robot-service" / "app" / f"{module}.py").read_bytes()
+    assert log_api == robot_service
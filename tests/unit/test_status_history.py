@@ -0,0 +1,109 @@
+import sys
+from pathlib import Path
+
+# Add robot-service to path.
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "robot-service"))
+
+from app.history import (MAX_CODES, OTHER, RING_ENTRY_BYTES,
+                         SqliteStatusHistory, StatusHistory)
+
+
+def test_transitions_skip_repeats_and_wrap():
+    history = StatusHistory(capacity=3)
+    history.record("r1", "active", 100)
+    history.record("r1", "active", 110)
+    history.record("r1", "error", 120)
+    history.record("r1", "active", 130)
+    assert [t["timestamp"] for t in history.transitions("r1")] == [100, 120, 130]
+
+    # A full ring overwrites its oldest transition
+    history.record("r1", "maintenance", 140)
+    assert history.transitions("r1") == [
+        {"timestamp": 120, "status": "error"},
+        {"timestamp": 130, "status": "active"},
+        {"timestamp": 140, "status": "maintenance"},
+    ]
+    assert history.transitions("r1", start=125, end=135) == [
+        {"timestamp": 130, "status": "active"}
+    ]
+    assert history.transitions("missing") == []
+
+
+def test_time_in_status_per_robot_and_fleet():
+    history = StatusHistory()
+    history.record("r1", "active", 0)
+    history.record("r1", "error", 60)
+    history.record("r1", "active", 90)
+    history.record("r2", "error", 30)
+
+    assert history.time_in_status(0, 120, ["r1"]) == {"active": 90.0, "error": 30.0}
+    # The window clips the first and last transitions
+    assert history.time_in_status(70, 100, ["r1"]) == {"error": 20.0, "active": 10.0}
+    assert history.time_in_status(0, 120) == {"active": 90.0, "error": 120.0}
+    assert history.time_in_status(200, 300, ["missing"]) == {}
+
+
+def test_budget_evicts_least_recently_changed_robot():
+    history = StatusHistory(capacity=10, budget_bytes=2 * 10 * RING_ENTRY_BYTES)
+    history.record("r1", "active", 0)
+    history.record("r2", "active", 0)
+    history.record("r1", "error", 10)
+    history.record("r3", "active", 20)
+    assert len(history) == 2
+    assert history.nbytes <= history.budget_bytes
+    assert history.transitions("r2") == []
+    assert len(history.transitions("r1")) == 2
+
+
+def test_statuses_beyond_code_space_are_other():
+    history = StatusHistory(capacity=2)
+    for i in range(MAX_CODES + 5):
+        history.record(f"r{i}", f"status-{i}", i)
+    assert history.transitions(f"r{MAX_CODES + 4}")[0]["status"] == OTHER
+    assert history.transitions("r0")[0]["status"] == "status-0"
+
+
+def test_sqlite_history_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "robots.db")
+    # Two workers pointed at the same database
+    first = SqliteStatusHistory(path, capacity=3)
+    second = SqliteStatusHistory(path, capacity=3)
+    first.record("r1", "active", 0)
+    second.record("r1", "active", 10)
+    second.record("r1", "error", 60)
+    first.record("r1", "active", 90)
+    first.record("r2", "error", 30)
+
+    assert second.transitions("r1") == [
+        {"timestamp": 0, "status": "active"},
+        {"timestamp": 60, "status": "error"},
+        {"timestamp": 90, "status": "active"},
+    ]
+    assert second.time_in_status(0, 120, ["r1"]) == {"active": 90.0, "error": 30.0}
+    assert first.time_in_status(0, 120) == {"active": 90.0, "error": 120.0}
+    assert len(second) == 2
+
+    # Only the newest ``capacity`` transitions of a robot are kept
+    second.record("r1", "maintenance", 100)
+    assert [t["timestamp"] for t in first.transitions("r1")] == [60, 90, 100]
+    assert first.transitions("r1", start=70, end=95) == [
+        {"timestamp": 90, "status": "active"}
+    ]
+
+    # The same totals as the in-process history, for any window
+    memory = StatusHistory(capacity=3)
+    for robot_id, status, timestamp in [
+        ("r1", "error", 60),
+        ("r1", "active", 90),
+        ("r1", "maintenance", 100),
+        ("r2", "error", 30),
+    ]:
+        memory.record(robot_id, status, timestamp)
+    for start, end in [(0, 120), (70, 95), (95, 200), (10, 40), (150, 160)]:
+        for robot_ids in (None, ["r1"], ["r2", "missing"], []):
+            assert first.time_in_status(start, end, robot_ids) == (
+                memory.time_in_status(start, end, robot_ids)
+            )
+
+    second.clear()
+    assert len(first) == 0